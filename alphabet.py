@@ -5,6 +5,12 @@ Alphabet maps objects to integer ids. It provides two way mapping from the index
 """
 import json
 import os
+import struct
+import warnings
+import numpy as np
+
+BINARY_MAGIC = b'ALPHABET1'
+BINARY_SUFFIX = '.alphabet'
 
 
 class Alphabet:
@@ -16,12 +22,14 @@ class Alphabet:
         # Index 1 is occupied by default, all else following.
         self.default_index = 0
         self.next_index = 1
+        self._instance_array = None
 
     def add(self, instance):
         if instance not in self.instance2index:
             self.instances.append(instance)
             self.instance2index[instance] = self.next_index
             self.next_index += 1
+            self._instance_array = None
 
     def get_index(self, instance):
         try:
@@ -41,9 +49,50 @@ class Alphabet:
         try:
             return self.instances[index - 1]
         except IndexError:
-            print('unknown instance, return the first label.')
+            warnings.warn('unknown index %d in alphabet %s, returning the first label' % (index, self.__name))
             return self.instances[0]
 
+    def encode(self, sequences):
+        """
+        Map whole sequences of instances to ids at once. Unseen instances are added in order of first occurrence
+        while the alphabet keeps growing, so ids match those of get_index called token by token.
+        :param sequences: list of lists of str instances.
+        :return: (flat int32 ids, int64 offsets), sequence i being flat[offsets[i]:offsets[i + 1]].
+        """
+        lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+        offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        tokens = [token for s in sequences for token in s]
+        if not tokens:
+            return np.zeros(0, dtype=np.int32), offsets
+        # One alphabet lookup per distinct instance instead of one per token; distinct instances come in order of
+        # first occurrence.
+        distinct = {}
+        inverse = np.fromiter((distinct.setdefault(token, len(distinct)) for token in tokens), dtype=np.int64,
+                              count=len(tokens))
+        for token in distinct:
+            if not isinstance(token, str):
+                raise TypeError('alphabet %s encodes str instances, got %r' % (self.__name, token))
+        get = self.get_index if self.keep_growing else lambda token: self.instance2index.get(token, self.default_index)
+        unique_ids = np.fromiter((get(token) for token in distinct), dtype=np.int32, count=len(distinct))
+        return unique_ids[inverse], offsets
+
+    def decode(self, ids):
+        """
+        Map an array of ids back to instances with one lookup array. Like get_instance, id 0 maps to None and ids
+        beyond the alphabet to the first instance. Negative ids raise a ValueError.
+        """
+        if self._instance_array is None:
+            self._instance_array = np.array([None] + self.instances, dtype=object)
+        ids = np.asarray(ids, dtype=np.int64)
+        if (ids < 0).any():
+            raise ValueError('negative index in alphabet %s' % self.__name)
+        unknown = ids >= len(self._instance_array)
+        if unknown.any():
+            warnings.warn('unknown indices in alphabet %s, returning the first label' % self.__name)
+            ids = np.where(unknown, 1, ids)
+        return self._instance_array[ids].tolist()
+
     def size(self):
         return len(self.instances) + 1
 
@@ -67,6 +116,8 @@ class Alphabet:
     def from_json(self, data):
         self.instances = data["instances"]
         self.instance2index = data["instance2index"]
+        self.next_index = len(self.instances) + 1
+        self._instance_array = None
 
     def save(self, output_directory, name=None):
         """
@@ -77,7 +128,8 @@ class Alphabet:
         """
         saving_name = name if name else self.__name
         try:
-            json.dump(self.get_content(), open(os.path.join(output_directory, saving_name + ".json"), 'w'))
+            with open(os.path.join(output_directory, saving_name + ".json"), 'w') as f:
+                json.dump(self.get_content(), f)
         except Exception as e:
             print("Alphabet is not saved")
 
@@ -89,4 +141,37 @@ class Alphabet:
         :return:
         """
         loading_name = name if name else self.__name
-        self.from_json(json.load(open(os.path.join(input_directory, loading_name + ".json"))))
+        with open(os.path.join(input_directory, loading_name + ".json")) as f:
+            self.from_json(json.load(f))
+
+    def save_binary(self, output_directory, name=None):
+        """
+        Save the alphabet in a compact binary file: a magic string, the number of instances, then every instance as
+        a length-prefixed UTF-8 string, in index order.
+        """
+        saving_name = name if name else self.__name
+        encoded = [instance.encode('utf-8') for instance in self.instances]
+        with open(os.path.join(output_directory, saving_name + BINARY_SUFFIX), 'wb') as f:
+            f.write(BINARY_MAGIC)
+            f.write(struct.pack('<I', len(encoded)))
+            for data in encoded:
+                f.write(struct.pack('<I', len(data)))
+                f.write(data)
+
+    def load_binary(self, input_directory, name=None):
+        loading_name = name if name else self.__name
+        with open(os.path.join(input_directory, loading_name + BINARY_SUFFIX), 'rb') as f:
+            data = f.read()
+        if not data.startswith(BINARY_MAGIC):
+            raise ValueError('%s is not an alphabet file' % loading_name)
+        position = len(BINARY_MAGIC)
+        count, = struct.unpack_from('<I', data, position)
+        position += 4
+        instances = []
+        for _ in range(count):
+            length, = struct.unpack_from('<I', data, position)
+            position += 4
+            instances.append(data[position:position + length].decode('utf-8'))
+            position += length
+        self.from_json({'instances': instances,
+                        'instance2index': dict((instance, index + 1) for index, instance in enumerate(instances))})
@@ -0,0 +1,222 @@
+"""
+Benchmarks of the NER pipeline on a synthetic CoNLL corpus: reading, alphabet mapping, featurization, one training
+epoch, single-text latency, batch throughput and entity scoring. Results are written as JSON and can be compared
+with a stored baseline; the run fails when a metric got worse than the baseline by more than the tolerance.
+
+The inference benchmarks use the trained model of infer.py (model/ and embedding/), the others only the synthetic
+data and a random embedding.
+
+Usage:
+    python benchmark.py --num_sentences 2000 --output bench.json
+    python benchmark.py --baseline bench.json --tolerance 0.2
+    python benchmark.py --only read_conll_format read_conll_columns score_by_entity
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import numpy as np
+
+BENCHMARKS = ('read_conll_format', 'read_conll_columns', 'alphabet_mapping', 'construct_tensor_word',
+              'construct_tensor_onehot', 'training_epoch', 'infer_string', 'infer_batch', 'score_by_entity')
+ENTITY_TYPES = ('PER', 'LOC', 'ORG', 'MISC')
+POS_TAGS = ('N', 'Np', 'V', 'A', 'P', 'E', 'C', 'M', 'R', 'L', 'CH')
+
+
+def sentence_lengths(num_sentences, mean_length, max_length, length_dist, rng):
+    """Lengths drawn from a lognormal (long-tailed, like real text) or a uniform distribution."""
+    if length_dist == 'uniform':
+        lengths = rng.randint(1, 2 * mean_length, size=num_sentences)
+    else:
+        lengths = rng.lognormal(np.log(mean_length), 0.5, size=num_sentences).astype(int)
+    return np.clip(lengths, 1, max_length)
+
+
+def random_tags(length, rng):
+    tags = []
+    while len(tags) < length:
+        if rng.rand() < 0.15:
+            tag_type = ENTITY_TYPES[rng.randint(len(ENTITY_TYPES))]
+            size = min(rng.randint(1, 4), length - len(tags))
+            tags += ['B-' + tag_type] + ['I-' + tag_type] * (size - 1)
+        else:
+            tags.append('O')
+    return tags
+
+
+def generate_corpus(output_file, num_sentences, mean_length=25, max_length=130, vocab_size=10000,
+                    length_dist='lognormal', seed=0):
+    """
+    Write a synthetic corpus in the word/POS/NER format read by utils.read_conll_format.
+    :param vocab_size: number of distinct words, drawn with Zipfian frequencies.
+    :return: the vocabulary.
+    """
+    rng = np.random.RandomState(seed)
+    vocab = ['w%d' % i for i in range(vocab_size)]
+    weights = 1. / np.arange(1, vocab_size + 1)
+    weights /= weights.sum()
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for length in sentence_lengths(num_sentences, mean_length, max_length, length_dist, rng):
+            words = rng.choice(vocab_size, size=length, p=weights)
+            for word, tag in zip(words, random_tags(length, rng)):
+                f.write('%s\t%s\t%s\n' % (vocab[word], POS_TAGS[rng.randint(len(POS_TAGS))], tag))
+            f.write('\n')
+    return vocab
+
+
+def corrupt(tag_sequences, labels, error_rate=0.1, seed=0):
+    """Predictions for scoring: the gold tags with a fraction replaced by random labels."""
+    rng = random.Random(seed)
+    return [[rng.choice(labels) if rng.random() < error_rate else tag for tag in tags] for tags in tag_sequences]
+
+
+def timed(fn, repeats):
+    """Fastest of repeats calls of fn in seconds, and the result of the last call."""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(names, corpus_file, vocab, max_length, repeats, num_texts, embedd_dim=100, batch_size=50):
+    import utils
+    from featurizer import construct_tensor_onehot
+    results = {}
+    seconds, (word_list, pos_list, tag_list, num_sent, _) = timed(lambda: utils.read_conll_format(corpus_file),
+                                                                  repeats)
+    num_tokens = sum(len(words) for words in word_list)
+    if 'read_conll_format' in names:
+        results['read_conll_format'] = {'seconds': seconds, 'tokens_per_second': num_tokens / seconds}
+    if 'read_conll_columns' in names:
+        from conll_reader import read_conll_columns
+        # The reader utils.create_id_data trains from, with its default process pool.
+        seconds, _ = timed(lambda: read_conll_columns(corpus_file, (0, 1, 2)), repeats)
+        results['read_conll_columns'] = {'seconds': seconds, 'tokens_per_second': num_tokens / seconds}
+
+    seconds, ((pos_flat, offsets), _, _, (tag_flat, _), _, _, alphabet_pos, alphabet_tag) = timed(
+        lambda: utils.map_string_2_id(pos_list, pos_list, pos_list, tag_list, tag_list, tag_list), repeats)
+    pos_ids = np.split(pos_flat, offsets[1:-1])
+    tag_ids = np.split(tag_flat, offsets[1:-1])
+    if 'alphabet_mapping' in names:
+        results['alphabet_mapping'] = {'seconds': seconds, 'tokens_per_second': 3 * num_tokens / seconds}
+
+    rng = np.random.RandomState(0)
+    embedd_vectors = rng.uniform(-1, 1, (len(vocab), embedd_dim)).astype(np.float32)
+    unknown_embedd = rng.uniform(-0.01, 0.01, [1, embedd_dim])
+    if 'construct_tensor_word' in names:
+        seconds, _ = timed(lambda: utils.construct_tensor_word(word_list, unknown_embedd, vocab, embedd_vectors,
+                                                               embedd_dim, max_length), repeats)
+        results['construct_tensor_word'] = {'seconds': seconds, 'tokens_per_second': num_tokens / seconds}
+    if 'construct_tensor_onehot' in names:
+        seconds, _ = timed(lambda: construct_tensor_onehot(pos_ids, max_length, alphabet_pos.size()), repeats)
+        results['construct_tensor_onehot'] = {'seconds': seconds, 'tokens_per_second': num_tokens / seconds}
+
+    if 'training_epoch' in names:
+        import network
+        X = np.concatenate([utils.construct_tensor_word(word_list, unknown_embedd, vocab, embedd_vectors,
+                                                        embedd_dim, max_length),
+                            construct_tensor_onehot(pos_ids, max_length, alphabet_pos.size())], axis=2)
+        Y = construct_tensor_onehot(tag_ids, max_length, alphabet_tag.size())
+        model = network.building_ner(2, 64, 0.5, max_length, X.shape[2], Y.shape[2])
+        # The first epoch also builds the training graph, time the second one.
+        model.fit(X, Y, batch_size=batch_size, epochs=1, verbose=0)
+        seconds, _ = timed(lambda: model.fit(X, Y, batch_size=batch_size, epochs=1, verbose=0), 1)
+        results['training_epoch'] = {'seconds': seconds, 'sentences_per_second': num_sent / seconds}
+
+    texts = [' '.join(words) for words in word_list[:num_texts]]
+    if 'infer_string' in names or 'infer_batch' in names:
+        import infer
+    if 'infer_string' in names:
+        infer.infer_string(texts[0])
+        latencies = []
+        for text in texts:
+            start = time.perf_counter()
+            infer.infer_string(text)
+            latencies.append(1000 * (time.perf_counter() - start))
+        results['infer_string'] = {'p50_ms': float(np.percentile(latencies, 50)),
+                                   'p99_ms': float(np.percentile(latencies, 99))}
+    if 'infer_batch' in names:
+        seconds, _ = timed(lambda: infer.infer_batch(texts, batch_size=batch_size), repeats)
+        results['infer_batch'] = {'seconds': seconds, 'sentences_per_second': len(texts) / seconds}
+
+    if 'score_by_entity' in names:
+        import eval
+        labels = sorted(set(tag for tags in tag_list for tag in tags))
+        pred_list = corrupt(tag_list, labels)
+        seconds, _ = timed(lambda: eval.score_by_entity(pred_list, tag_list), repeats)
+        results['score_by_entity'] = {'seconds': seconds, 'tokens_per_second': num_tokens / seconds}
+    return results
+
+
+def higher_is_better(metric):
+    return metric.endswith('per_second')
+
+
+def compare(results, baseline, tolerance):
+    """
+    Metrics of results worse than in baseline by more than tolerance (a fraction of the baseline value).
+    :return: list of (benchmark, metric, baseline value, new value).
+    """
+    regressions = []
+    for name, metrics in sorted(results.items()):
+        for metric, value in sorted(metrics.items()):
+            base = baseline.get(name, {}).get(metric)
+            if base is None:
+                continue
+            if higher_is_better(metric):
+                worse = value < base * (1 - tolerance)
+            else:
+                worse = value > base * (1 + tolerance)
+            if worse:
+                regressions.append((name, metric, base, value))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_sentences", default=2000, type=int, help="sentences of the synthetic corpus")
+    parser.add_argument("--mean_length", default=25, type=int, help="mean sentence length")
+    parser.add_argument("--max_length", default=130, type=int, help="longest sentence, also the padded length")
+    parser.add_argument("--length_dist", default="lognormal", choices=["lognormal", "uniform"])
+    parser.add_argument("--vocab_size", default=10000, type=int, help="distinct words of the synthetic corpus")
+    parser.add_argument("--num_texts", default=200, type=int, help="texts tagged by the inference benchmarks")
+    parser.add_argument("--repeats", default=3, type=int, help="runs per benchmark, the fastest is kept")
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--only", nargs="+", default=list(BENCHMARKS), choices=BENCHMARKS,
+                        help="benchmarks to run, all by default")
+    parser.add_argument("--output", default=None, help="JSON file receiving the results")
+    parser.add_argument("--baseline", default=None, help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tolerance", default=0.1, type=float,
+                        help="allowed slowdown relative to the baseline before a metric counts as a regression")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        corpus_file = os.path.join(tmp_dir, 'corpus.txt')
+        vocab = generate_corpus(corpus_file, args.num_sentences, args.mean_length, args.max_length,
+                                args.vocab_size, args.length_dist, args.seed)
+        results = run(args.only, corpus_file, vocab, args.max_length, args.repeats, args.num_texts)
+    finally:
+        shutil.rmtree(tmp_dir)
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'tolerance')}
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['config'] != config:
+            print('Warning: the baseline was run with another configuration')
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for name, metric, base, value in regressions:
+            print('REGRESSION %s %s: %.4g -> %.4g' % (name, metric, base, value))
+        if regressions:
+            raise SystemExit(1)
+        print('No regression against %s' % args.baseline)
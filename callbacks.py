@@ -0,0 +1,29 @@
+import time
+from keras.callbacks import Callback
+from instrumentation import set_gauge
+
+
+class ThroughputCallback(Callback):
+    def __init__(self, num_samples, verbose=True):
+        """
+        Measure the training throughput of every epoch, added to the epoch logs as samples_per_second (so it shows
+        up in the History) and reported to the instrumentation registry.
+        :param num_samples: number of training sentences per epoch.
+        """
+        super(ThroughputCallback, self).__init__()
+        self.num_samples = num_samples
+        self.verbose = verbose
+        self.epoch_start = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self.epoch_start
+        samples_per_second = self.num_samples / seconds
+        if logs is not None:
+            logs['samples_per_second'] = samples_per_second
+        set_gauge('train_samples_per_second', samples_per_second)
+        set_gauge('train_epoch_seconds', seconds)
+        if self.verbose:
+            print('Epoch %d: %.1f samples/s (%.1f s)' % (epoch + 1, samples_per_second, seconds))
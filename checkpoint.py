@@ -0,0 +1,141 @@
+"""
+Checkpoints of a training run, to resume it after a crash or a preemption. A checkpoint holds the model weights, the
+optimizer state and the TensorFlow random generator (as a tf.train.Checkpoint), and a state file with the epoch
+counter, the early stopping counters, the best dev value so far and the Python and NumPy random states. The POS and
+tag alphabets of the run are saved next to the checkpoints, and the weights of the best epoch are kept separately so
+that they can be restored at the end of training.
+"""
+import json
+import os
+import pickle
+import random
+import numpy as np
+import tensorflow as tf
+from keras.callbacks import Callback
+from alphabet import Alphabet
+
+STATE_FILE = 'state.json'
+RNG_FILE = 'rng.pkl'
+BEST_WEIGHTS_FILE = 'best.weights.h5'
+
+
+def write_atomic(path, data, mode='w'):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class TrainingCheckpoint(Callback):
+    def __init__(self, model, checkpoint_dir, alphabets=None, early_stopping=None, monitor='val_loss', mode='min',
+                 save_steps=None, max_to_keep=2):
+        """
+        :param model: compiled model to checkpoint; its optimizer state is saved too.
+        :param alphabets: dict of the alphabets of the run by name, saved with the checkpoints and checked against on
+        restore.
+        :param early_stopping: EarlyStopping callback whose counters are saved and restored. Put the checkpoint
+        after it in the callback list, so that the restored counters are not reset when training begins.
+        :param monitor: dev metric of the logs selecting the best weights, lower is better when mode is 'min'.
+        :param save_steps: also save every save_steps batches. A run resumed from such a checkpoint restarts the
+        epoch from its first batch, with the weights reached when it was saved.
+        """
+        super(TrainingCheckpoint, self).__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.alphabets = alphabets or {}
+        self.early_stopping = early_stopping
+        self.monitor = monitor
+        self.mode = mode
+        self.save_steps = save_steps
+        self.checkpoint = tf.train.Checkpoint(model=model, optimizer=model.optimizer,
+                                              generator=tf.random.get_global_generator())
+        self.manager = tf.train.CheckpointManager(self.checkpoint, checkpoint_dir, max_to_keep=max_to_keep)
+        self.epoch = 0
+        self.steps = 0
+        self.best = None
+        self.best_epoch = None
+        self.restored_state = None
+
+    def improved(self, value):
+        if self.best is None:
+            return True
+        return value < self.best if self.mode == 'min' else value > self.best
+
+    def on_train_begin(self, logs=None):
+        if not os.path.isdir(self.checkpoint_dir):
+            os.makedirs(self.checkpoint_dir)
+        for alphabet in self.alphabets.values():
+            alphabet.save(self.checkpoint_dir)
+        state = self.restored_state
+        if state is not None and self.early_stopping is not None and state['early_stopping'] is not None:
+            self.early_stopping.wait = state['early_stopping']['wait']
+            self.early_stopping.best = state['early_stopping']['best']
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.steps += 1
+        if self.save_steps and self.steps % self.save_steps == 0:
+            self.save(self.epoch)
+
+    def on_epoch_end(self, epoch, logs=None):
+        value = (logs or {}).get(self.monitor)
+        if value is not None and self.improved(value):
+            self.best = float(value)
+            self.best_epoch = epoch + 1
+            self.model.save_weights(os.path.join(self.checkpoint_dir, BEST_WEIGHTS_FILE))
+        self.save(epoch + 1)
+
+    def save(self, epoch):
+        """:param epoch: number of completed epochs, the epoch a resumed run starts from."""
+        path = self.manager.save(checkpoint_number=self.steps)
+        early_stopping = None
+        if self.early_stopping is not None:
+            early_stopping = {'wait': int(self.early_stopping.wait), 'best': float(self.early_stopping.best)}
+        state = {'checkpoint': os.path.basename(path), 'epoch': epoch, 'steps': self.steps, 'best': self.best,
+                 'best_epoch': self.best_epoch, 'monitor': self.monitor, 'early_stopping': early_stopping}
+        write_atomic(os.path.join(self.checkpoint_dir, RNG_FILE),
+                     pickle.dumps({'random': random.getstate(), 'numpy': np.random.get_state()}), 'wb')
+        write_atomic(os.path.join(self.checkpoint_dir, STATE_FILE), json.dumps(state, indent=2))
+
+    def restore(self, sequences=()):
+        """
+        Load the latest checkpoint into the model and the optimizer, and restore the random states and counters.
+        :param sequences: shuffled training sequences (e.g. dataset.NerSequence), reshuffled from the restored random
+        state: they drew the order of their first epoch from the random state of the new process when built.
+        :return: the epoch to resume from (the initial_epoch of model.fit), 0 when there is no checkpoint.
+        """
+        state_file = os.path.join(self.checkpoint_dir, STATE_FILE)
+        if not os.path.exists(state_file):
+            print('No checkpoint in %s, training from scratch' % self.checkpoint_dir)
+            return 0
+        with open(state_file) as f:
+            state = json.load(f)
+        for name, alphabet in self.alphabets.items():
+            saved = Alphabet(name, keep_growing=False)
+            saved.load(self.checkpoint_dir)
+            if saved.instances != alphabet.instances:
+                raise ValueError('The %s alphabet of the data differs from the one of the checkpoint in %s'
+                                 % (name, self.checkpoint_dir))
+        # The optimizer slots are created by the first training step and restored then.
+        self.checkpoint.restore(os.path.join(self.checkpoint_dir, state['checkpoint']))
+        with open(os.path.join(self.checkpoint_dir, RNG_FILE), 'rb') as f:
+            rng = pickle.load(f)
+        random.setstate(rng['random'])
+        np.random.set_state(rng['numpy'])
+        for sequence in sequences:
+            sequence.on_epoch_end()
+        self.steps = state['steps']
+        self.best = state['best']
+        self.best_epoch = state['best_epoch']
+        self.restored_state = state
+        print('Resuming from %s after %d epochs' % (state['checkpoint'], state['epoch']))
+        return state['epoch']
+
+    def restore_best(self):
+        """Load the weights of the best epoch, if any epoch reported the monitored value."""
+        if self.best_epoch is None:
+            return False
+        self.checkpoint.model.load_weights(os.path.join(self.checkpoint_dir, BEST_WEIGHTS_FILE))
+        print('Restored the weights of epoch %d (%s %.4f)' % (self.best_epoch, self.monitor, self.best))
+        return True
@@ -0,0 +1,166 @@
+"""
+Columnar CoNLL reader for large corpora. The file is memory-mapped and cut into shards at blank lines, the shards are
+parsed by a process pool, and every selected column comes back as flat int32 token ids into a per-column vocabulary,
+with int64 sentence offsets shared by all columns, instead of lists of lists of strings.
+
+Vocabularies list the distinct tokens of a column in order of first occurrence in the file, the order in which
+Alphabet.encode assigns ids (minus one, as alphabet ids start at 1).
+"""
+import mmap
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from featurizer import map_number_and_punct
+
+MIN_SHARD_SIZE = 1 << 20
+
+
+class ConllColumns:
+    def __init__(self, vocabs, ids, offsets):
+        """
+        :param vocabs: one list of distinct tokens per column.
+        :param ids: one flat int32 array per column, token k of the column being vocabs[column][ids[column][k]].
+        :param offsets: int64 sentence offsets, sentence i spanning [offsets[i], offsets[i + 1]) of every column.
+        """
+        self.vocabs = vocabs
+        self.ids = ids
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def max_length(self):
+        return int(self.lengths.max()) if len(self) else 0
+
+    def sentences(self, column):
+        """Tokens of a column as a list of lists of strings, the layout of utils.read_conll_format."""
+        vocab = np.array(self.vocabs[column] + [''], dtype=object)
+        tokens = vocab[self.ids[column]].tolist()
+        return [tokens[start:end] for start, end in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())]
+
+
+def next_sentence_start(mm, position):
+    """Offset of the first line at or after position that follows a blank line, or the end of the file."""
+    size = len(mm)
+    if position == 0:
+        return 0
+    line_start = position if mm[position - 1:position] == b'\n' else mm.find(b'\n', position) + 1
+    while 0 < line_start < size:
+        previous_start = mm.rfind(b'\n', 0, line_start - 1) + 1
+        if mm[previous_start:line_start].strip() == b'':
+            return line_start
+        line_start = mm.find(b'\n', line_start) + 1
+    return size
+
+
+def shard_bounds(path, num_shards):
+    """Cut a file into at most num_shards byte ranges that all start at a sentence."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return [(0, 0)]
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            starts = sorted(set(next_sentence_start(mm, size * i // num_shards) for i in range(num_shards)))
+        finally:
+            mm.close()
+    return [(start, end) for start, end in zip(starts, starts[1:] + [size]) if start < end]
+
+
+def parse_shard(path, start, end, columns, normalize_columns=()):
+    """
+    Parse the sentences in [start, end) of a CoNLL file.
+    :return: (vocabs, ids, lengths), vocabs and ids per column as in ConllColumns, lengths per sentence.
+    """
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            text = mm[start:end].decode('utf-8')
+        finally:
+            mm.close()
+    indexes = [{} for _ in columns]
+    ids = [[] for _ in columns]
+    lengths = []
+    length = 0
+    for line in text.split('\n'):
+        fields = line.split()
+        if not fields:
+            if length:
+                lengths.append(length)
+                length = 0
+            continue
+        length += 1
+        for k, column in enumerate(columns):
+            token = fields[column]
+            if k in normalize_columns:
+                token = map_number_and_punct(token.lower())
+            index = indexes[k]
+            token_id = index.get(token)
+            if token_id is None:
+                token_id = index[token] = len(index)
+            ids[k].append(token_id)
+    # The last sentence counts even without a trailing blank line.
+    if length:
+        lengths.append(length)
+    vocabs = [list(index) for index in indexes]
+    return vocabs, [np.array(column_ids, dtype=np.int32) for column_ids in ids], np.array(lengths, dtype=np.int64)
+
+
+def merge_shards(shards, num_columns):
+    vocabs = [[] for _ in range(num_columns)]
+    indexes = [{} for _ in range(num_columns)]
+    ids = [[] for _ in range(num_columns)]
+    lengths = []
+    for shard_vocabs, shard_ids, shard_lengths in shards:
+        for k in range(num_columns):
+            index, vocab = indexes[k], vocabs[k]
+            lookup = np.empty(len(shard_vocabs[k]), dtype=np.int32)
+            for local_id, token in enumerate(shard_vocabs[k]):
+                token_id = index.get(token)
+                if token_id is None:
+                    token_id = index[token] = len(vocab)
+                    vocab.append(token)
+                lookup[local_id] = token_id
+            ids[k].append(lookup[shard_ids[k]])
+        lengths.append(shard_lengths)
+    lengths = np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    ids = [np.concatenate(column_ids) if column_ids else np.zeros(0, dtype=np.int32) for column_ids in ids]
+    return ConllColumns(vocabs, ids, offsets)
+
+
+def read_conll_columns(path, columns=(0, 1, -1), normalize_columns=(0,), num_workers=None, num_shards=None):
+    """
+    Read selected columns of a CoNLL file.
+    :param columns: column indices to read; negative indices count from the end of the line. The default reads
+    the word, the POS and the NER tag of the 4-column files in data/.
+    :param normalize_columns: positions in columns whose tokens are lowercased and mapped by map_number_and_punct,
+    as read_conll_format does for words.
+    :param num_workers: processes parsing the shards, all cores by default, 0 to parse in the calling process.
+    Workers are spawned and import the __main__ module again, so scripts must call this under a main guard.
+    :param num_shards: number of shards, by default about one per MIN_SHARD_SIZE bytes but at most 4 per worker.
+    :return: ConllColumns, with one vocabulary and id array per entry of columns. Runs of blank lines separate two
+    sentences and yield no empty sentence, unlike utils.read_conll_format which keeps one per extra blank line.
+    """
+    columns = tuple(columns)
+    normalize_columns = tuple(normalize_columns)
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    if num_shards is None:
+        num_shards = max(1, min(os.path.getsize(path) // MIN_SHARD_SIZE, 4 * max(1, num_workers)))
+    bounds = shard_bounds(path, num_shards)
+    if num_workers == 0 or len(bounds) == 1:
+        shards = [parse_shard(path, start, end, columns, normalize_columns) for start, end in bounds]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [pool.submit(parse_shard, path, start, end, columns, normalize_columns)
+                       for start, end in bounds]
+            shards = [future.result() for future in futures]
+    return merge_shards(shards, len(columns))
@@ -0,0 +1,64 @@
+"""
+Keras input pipeline featurizing batches on the fly from a featurizer.Corpus, so that peak memory is bounded by the
+batch size instead of the corpus size. Keras prefetches upcoming batches in background threads while the model
+trains (see the workers and max_queue_size arguments of Model.fit).
+
+With length bucketing, sentences of similar length are batched together and every batch is only padded to its
+longest sentence, which requires a model built with time_step=None.
+"""
+import math
+import numpy as np
+from keras.utils import Sequence
+from featurizer import pad_ids
+from prediction import argmax_decode, bucket_batches, predict_corpus
+
+
+class NerSequence(Sequence):
+    def __init__(self, corpus, featurizer, dim_pos, dim_tag, batch_size, max_length, shuffle=False, bucket=False,
+                 input_format='vector', targets=None):
+        """
+        :param corpus: featurizer.Corpus to iterate over.
+        :param featurizer: Featurizer building the network inputs.
+        :param max_length: number of time steps of every batch, or the longest allowed when bucketing.
+        :param shuffle: reshuffle the sentences at the end of every epoch. Keep False for prediction so that outputs
+        stay in corpus order.
+        :param bucket: batch sentences of similar length together and pad each batch to its longest sentence.
+        :param input_format: 'vector' for a network built by network.building_ner, 'id' for network.building_ner_ids.
+        :param targets: optional float (#tokens, #tags) targets replacing the one-hot tags of the corpus, e.g. the
+        soft targets of a teacher model (see distill.py).
+        """
+        self.corpus = corpus
+        self.featurizer = featurizer
+        self.dim_pos = dim_pos
+        self.dim_tag = dim_tag
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.shuffle = shuffle
+        self.bucket = bucket
+        self.input_format = input_format
+        self.targets = targets
+        self.on_epoch_end()
+
+    def __len__(self):
+        return int(math.ceil(len(self.corpus) / float(self.batch_size)))
+
+    def __getitem__(self, index):
+        indices = self.batches[index]
+        time_step = self.max_length
+        if self.bucket:
+            time_step = min(self.max_length, max(1, int(self.corpus.lengths[indices].max())))
+        if self.targets is not None:
+            X = self.featurizer.inputs(self.corpus.word_ids, self.corpus.pos_ids, self.corpus.offsets, time_step,
+                                       self.dim_pos, indices, self.input_format)
+            return X, pad_ids(self.targets, self.corpus.offsets, time_step, indices)
+        return self.featurizer.transform_corpus(self.corpus, time_step, self.dim_pos, self.dim_tag, indices,
+                                                self.input_format)
+
+    def on_epoch_end(self):
+        if self.bucket:
+            self.batches = bucket_batches(self.corpus.lengths, self.batch_size, self.shuffle)
+        else:
+            order = np.arange(len(self.corpus))
+            if self.shuffle:
+                np.random.shuffle(order)
+            self.batches = [order[start:start + self.batch_size] for start in range(0, len(order), self.batch_size)]
@@ -0,0 +1,73 @@
+"""
+Viterbi decoding of the per-token tag probabilities of the network under BIO constraints. An I-X tag may only follow
+B-X or I-X, and the padding class 0 of the tag alphabet is never predicted. Decoding is vectorized across the batch,
+with one NumPy step per time step.
+"""
+import numpy as np
+from eval import split_tag
+
+EPSILON = 1e-12
+
+
+def transition_mask(alphabet_tag):
+    """
+    Legal BIO transitions between the tag ids of an alphabet.
+    :return: (allowed, start_allowed): allowed[i, j] tells whether tag j may follow tag i, start_allowed[j] whether a
+    sentence may start with tag j. Tags outside the BIO scheme are unconstrained, the padding class 0 is excluded.
+    """
+    size = alphabet_tag.size()
+    allowed = np.zeros((size, size), dtype=bool)
+    start_allowed = np.zeros(size, dtype=bool)
+    for j, tag in alphabet_tag.enumerate_items():
+        prefix, tag_type = split_tag(tag)
+        if prefix != 'I':
+            allowed[1:, j] = True
+            start_allowed[j] = True
+            continue
+        for i, prev in alphabet_tag.enumerate_items():
+            prev_prefix, prev_type = split_tag(prev)
+            allowed[i, j] = prev_prefix in ('B', 'I') and prev_type == tag_type
+    return allowed, start_allowed
+
+
+def viterbi_decode(probs, lengths, allowed, start_allowed):
+    """
+    Most probable legal tag sequence of every sentence of a batch.
+    :param probs: (batch, time, #tags) softmax outputs of the network.
+    :param lengths: length of every sentence, positions beyond it are ignored.
+    :param allowed, start_allowed: see transition_mask.
+    :return: (batch, time) matrix of tag ids, 0 beyond the sentence lengths.
+    """
+    probs = np.asarray(probs)
+    lengths = np.asarray(lengths)
+    batch_size, time_step, num_tags = probs.shape
+    log_probs = np.log(np.maximum(probs, EPSILON))
+    transitions = np.where(allowed, 0., -np.inf)
+    scores = np.where(start_allowed, log_probs[:, 0], -np.inf)
+    backpointers = np.empty((batch_size, time_step, num_tags), dtype=np.int32)
+    backpointers[:, 0] = np.arange(num_tags)
+    for t in range(1, time_step):
+        candidates = scores[:, :, None] + transitions
+        best_prev = np.argmax(candidates, axis=1)
+        best_scores = np.take_along_axis(candidates, best_prev[:, None, :], axis=1)[:, 0] + log_probs[:, t]
+        # Finished sentences keep their scores and point back to the same tag, so backtracking passes through.
+        active = (t < lengths)[:, None]
+        scores = np.where(active, best_scores, scores)
+        backpointers[:, t] = np.where(active, best_prev, np.arange(num_tags))
+    paths = np.zeros((batch_size, time_step), dtype=np.int32)
+    best = np.argmax(scores, axis=1)
+    rows = np.arange(batch_size)
+    for t in range(time_step - 1, -1, -1):
+        paths[:, t] = best
+        best = backpointers[rows, t, best]
+    paths[np.arange(time_step) >= lengths[:, None]] = 0
+    return paths
+
+
+class ViterbiDecoder:
+    def __init__(self, alphabet_tag):
+        self.allowed, self.start_allowed = transition_mask(alphabet_tag)
+
+    def __call__(self, probs, lengths):
+        """Same signature as dataset.argmax_decode, so it can be passed as the decode argument of predict_corpus."""
+        return viterbi_decode(probs, lengths, self.allowed, self.start_allowed)
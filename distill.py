@@ -0,0 +1,190 @@
+"""
+Distill a trained model (the teacher) into a smaller and faster student tagger. The teacher tags the training set,
+and optionally raw unlabeled text, and the student (see network.building_student: fewer or narrower BiLSTM layers,
+a GRU or a convolutional tagger) is trained on its tag probabilities: on labeled sentences the targets mix the
+teacher probabilities with the gold tags, on unlabeled ones they are the teacher probabilities alone.
+
+The student is saved with the alphabets of the teacher in the layout of model/, so infer.py serves it when NER_MODEL
+points to it. A report compares the F1 score and the prediction throughput of both models on the test set.
+
+Usage:
+    python distill.py --teacher_dir model --word_dir embedding/store --train_dir data/train.txt \
+        --dev_dir data/dev.txt --test_dir data/test.txt --unlabeled news.txt --cell lstm --num_layer 1 \
+        --num_hidden_node 32 --output_dir model_student
+    NER_MODEL=model_student python server.py
+"""
+import argparse
+import json
+import time
+import numpy as np
+
+
+def soften(probs, temperature=1.):
+    """
+    Probabilities of a softmax output at another temperature, i.e. softmax(logits / temperature) computed from
+    softmax(logits). Temperatures above 1 spread the mass over the runner-up tags.
+    """
+    if temperature == 1.:
+        return probs
+    logits = np.log(np.maximum(probs, 1e-12)) / temperature
+    logits -= logits.max(axis=-1, keepdims=True)
+    softened = np.exp(logits)
+    return (softened / softened.sum(axis=-1, keepdims=True)).astype(np.float32)
+
+
+def mix_targets(soft, tag_ids, alpha):
+    """alpha * teacher probabilities + (1 - alpha) * one-hot gold tags, per token of a flat corpus."""
+    targets = alpha * soft
+    targets[np.arange(len(tag_ids)), tag_ids] += 1. - alpha
+    return targets.astype(np.float32)
+
+
+def read_labeled(path, featurizer, alphabet_pos, alphabet_tag, tag_column=2):
+    from conll_reader import read_conll_columns
+    from featurizer import Corpus
+    from finetune import map_columns
+    columns = read_conll_columns(path, (0, 1, tag_column), num_workers=0)
+    pos_ids, tag_ids = map_columns(columns, alphabet_pos, alphabet_tag, path)
+    return Corpus(featurizer.vocab_word_ids(columns.vocabs[0], columns.ids[0]), pos_ids, tag_ids, columns.offsets)
+
+
+def read_unlabeled(paths, featurizer, alphabet_pos, num_workers=None):
+    """Corpus of raw text files, one document per line, split into sentences and POS-tagged with underthesea."""
+    from document import split_sentences
+    from segmenter import segment_all
+    texts = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                texts += [line[start:end] for start, end in split_sentences(line)]
+    segmented = segment_all(texts, num_workers)
+    pos_flat, _ = alphabet_pos.encode([pos_list for _, pos_list in segmented])
+    return featurizer.corpus([words for words, _ in segmented], pos_flat)
+
+
+def evaluate(model, corpus, featurizer, alphabet_pos, alphabet_tag, time_step, batch_size):
+    """(F1 score, sentences per second) of a model on a labeled corpus, timed after a warm-up run."""
+    from decoder import ViterbiDecoder
+    from eval import score_by_entity
+    from prediction import predict_corpus
+    decoder = ViterbiDecoder(alphabet_tag)
+    predicts = predict_corpus(model.predict_on_batch, corpus, featurizer, alphabet_pos.size(), batch_size,
+                              time_step, decode=decoder)
+    start = time.perf_counter()
+    predict_corpus(model.predict_on_batch, corpus, featurizer, alphabet_pos.size(), batch_size, time_step,
+                   decode=decoder)
+    seconds = time.perf_counter() - start
+    gold = [alphabet_tag.decode(tag_ids) for tag_ids in corpus.split(corpus.tag_ids)]
+    f1 = score_by_entity([alphabet_tag.decode(tag_ids) for tag_ids in predicts], gold)['OVERALL']['F1']
+    return f1, len(corpus) / seconds
+
+
+def distill(teacher_dir, word_dir, vector_dir, train_dir, dev_dir, test_dir, output_dir, unlabeled_files=(),
+            cell='lstm', num_layer=1, num_hidden_node=32, dropout=0.2, temperature=2., alpha=0.5, batch_size=50,
+            patience=3, max_epochs=100, tag_column=2, segment_workers=None):
+    """
+    :param cell: 'lstm', 'gru' or 'conv', see network.building_student.
+    :param temperature: temperature the teacher probabilities are softened to, see soften.
+    :param alpha: weight of the teacher probabilities against the gold tags on labeled sentences.
+    :param segment_workers: POS tagging processes for the unlabeled text, all cores by default.
+    :return: report of the F1 scores and throughputs of the teacher and the student on the test set.
+    """
+    from keras.callbacks import EarlyStopping
+    from tensorflow import keras
+    import dataset
+    import network
+    from alphabet import Alphabet
+    from callbacks import ThroughputCallback
+    from featurizer import Featurizer
+    from finetune import concat_corpora, network_config
+    from prediction import predict_probs
+    from utils import load_embedding, load_unknown_embedd
+
+    teacher = keras.models.load_model(teacher_dir)
+    if len(teacher.inputs) != 1:
+        raise ValueError('only teachers built with --input_format vector can be distilled')
+    alphabet_pos = Alphabet('pos', keep_growing=False)
+    alphabet_pos.load(teacher_dir)
+    alphabet_tag = Alphabet('tag', keep_growing=False)
+    alphabet_tag.load(teacher_dir)
+    embedd_words, embedd_vectors = load_embedding(word_dir, vector_dir)
+    featurizer = Featurizer(embedd_words, embedd_vectors, load_unknown_embedd(word_dir))
+    dim_pos, dim_tag = alphabet_pos.size(), alphabet_tag.size()
+    teacher_time_step = network_config(teacher)[3]
+
+    print('Loading data...')
+    train, dev, test = [read_labeled(path, featurizer, alphabet_pos, alphabet_tag, tag_column)
+                        for path in (train_dir, dev_dir, test_dir)]
+
+    print('Computing the soft targets of the teacher...')
+    targets = [mix_targets(soften(predict_probs(teacher.predict_on_batch, train, featurizer, dim_pos, batch_size,
+                                                teacher_time_step), temperature), train.tag_ids, alpha)]
+    if unlabeled_files:
+        unlabeled = read_unlabeled(unlabeled_files, featurizer, alphabet_pos, segment_workers)
+        print('Adding %d unlabeled sentences' % len(unlabeled))
+        targets.append(soften(predict_probs(teacher.predict_on_batch, unlabeled, featurizer, dim_pos, batch_size,
+                                            teacher_time_step), temperature))
+        train = concat_corpora([train, unlabeled])
+    targets = np.concatenate(targets)
+
+    print('Training student...')
+    # The student takes batches of any length, so that they are only padded to their longest sentence.
+    student = network.building_student(cell, num_layer, num_hidden_node, dropout, None,
+                                       featurizer.embedd_dim + dim_pos, dim_tag)
+    print(student.summary())
+    max_length = int(max(train.lengths.max(), dev.lengths.max()))
+    train_data = dataset.NerSequence(train, featurizer, dim_pos, dim_tag, batch_size, max_length, shuffle=True,
+                                     bucket=True, targets=targets)
+    # Early stopping watches the loss against the gold tags.
+    dev_data = dataset.NerSequence(dev, featurizer, dim_pos, dim_tag, batch_size, max_length, bucket=True)
+    student.fit(train_data, epochs=max_epochs, validation_data=dev_data,
+                callbacks=[EarlyStopping(patience=patience, restore_best_weights=True),
+                           ThroughputCallback(len(train))])
+
+    print('Saving model...')
+    student.save(output_dir)
+    alphabet_pos.save(output_dir)
+    alphabet_tag.save(output_dir)
+
+    print('Comparing with the teacher...')
+    report = {}
+    for name, model, time_step in (('teacher', teacher, teacher_time_step), ('student', student, None)):
+        f1, sentences_per_second = evaluate(model, test, featurizer, alphabet_pos, alphabet_tag, time_step,
+                                            batch_size)
+        report[name] = {'F1': f1, 'sentences_per_second': sentences_per_second,
+                        'parameters': int(model.count_params())}
+    report['speedup'] = report['student']['sentences_per_second'] / report['teacher']['sentences_per_second']
+    report['F1_delta'] = report['student']['F1'] - report['teacher']['F1']
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--teacher_dir", default="model", help="model and alphabets saved by ner.py")
+    parser.add_argument("--word_dir", help="word surface dict directory, or an embedding store directory")
+    parser.add_argument("--vector_dir", help="word vector dict directory")
+    parser.add_argument("--train_dir", help="training file")
+    parser.add_argument("--dev_dir", help="development file, for early stopping")
+    parser.add_argument("--test_dir", help="testing file, for the comparison of the teacher and the student")
+    parser.add_argument("--unlabeled", nargs="*", default=[],
+                        help="raw text files, one document per line, tagged by the teacher as extra training data")
+    parser.add_argument("--output_dir", default="model_student", help="directory receiving the student model")
+    parser.add_argument("--cell", default="lstm", choices=["lstm", "gru", "conv"], help="layers of the student")
+    parser.add_argument("--num_layer", default=1, type=int, help="number of layers of the student")
+    parser.add_argument("--num_hidden_node", default=32, type=int,
+                        help="units per direction of a recurrent layer, or filters of a convolution")
+    parser.add_argument("--dropout", default=0.2, type=float, help="input dropout of the recurrent layers")
+    parser.add_argument("--temperature", default=2., type=float, help="temperature of the teacher probabilities")
+    parser.add_argument("--alpha", default=0.5, type=float,
+                        help="weight of the teacher probabilities against the gold tags on labeled sentences")
+    parser.add_argument("--batch_size", default=50, type=int)
+    parser.add_argument("--patience", default=3, type=int, help="patience of the early stopping on the dev loss")
+    parser.add_argument("--max_epochs", default=100, type=int)
+    parser.add_argument("--tag_column", default=2, type=int, help="column of the NER tag in the data files")
+    parser.add_argument("--segment_workers", default=None, type=int,
+                        help="processes POS tagging the unlabeled text, all cores by default")
+    args = parser.parse_args()
+    print(json.dumps(distill(args.teacher_dir, args.word_dir, args.vector_dir, args.train_dir, args.dev_dir,
+                             args.test_dir, args.output_dir, args.unlabeled, args.cell, args.num_layer,
+                             args.num_hidden_node, args.dropout, args.temperature, args.alpha, args.batch_size,
+                             args.patience, args.max_epochs, args.tag_column, args.segment_workers), indent=2))
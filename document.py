@@ -0,0 +1,121 @@
+"""
+Helpers of document-level inference (infer.infer_documents): sentence splitting with character offsets, alignment of
+POS-tagged words back to the text, overlapping windows over long sentences and the merging of their predictions.
+This module stays free of TensorFlow and underthesea.
+"""
+import re
+from eval import chunks
+
+# A sentence ends at . ! ? or an ellipsis, possibly followed by closing quotes or brackets, before white space; a
+# line break always ends one.
+SENTENCE_END = re.compile(r'[.!?…]+[\"\'”’)\]]*(?=\s)|\n+')
+# Abbreviations after which a period does not end the sentence.
+ABBREVIATIONS = {'tp', 'ths', 'ts', 'pgs', 'gs', 'bs', 'ks', 'ls', 'st', 'mr', 'mrs', 'ms', 'dr', 'no', 'vs',
+                 'tr', 'q', 'p'}
+
+
+def split_sentences(text):
+    """
+    Split a document into sentences.
+    :return: list of (start, end) character offsets of the sentences, stripped of surrounding white space.
+    """
+    spans = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        if match.group().startswith('.') and len(match.group()) == 1:
+            previous = re.search(r'(\w+)$', text[start:match.start()])
+            # Initials ("Nguyễn V. A.") and abbreviations ("TP. Hồ Chí Minh") do not end a sentence, a number or
+            # a lowercase word ("thắng 3.") does.
+            if previous is not None:
+                word = previous.group(1)
+                if (len(word) == 1 and word.isalpha() and word.isupper()) or word.lower() in ABBREVIATIONS:
+                    continue
+        spans.append((start, match.end()))
+        start = match.end()
+    spans.append((start, len(text)))
+    stripped = []
+    for start, end in spans:
+        sentence = text[start:end]
+        if sentence.strip():
+            left = len(sentence) - len(sentence.lstrip())
+            right = len(sentence.rstrip())
+            stripped.append((start + left, start + right))
+    return stripped
+
+
+def align_words(text, words, offset=0):
+    """
+    Character offsets of the words of a sentence in the document.
+    :param text: the sentence.
+    :param words: its words as returned by segmenter.segment(text, surface=True), syllables joined by '_'.
+    :param offset: offset of the sentence in the document.
+    :return: list of (start, end) offsets, end excluded. A word missing from the text (changed by the tagger) gets
+    an empty span where the previous word ended.
+    """
+    spans = []
+    position = 0
+    for word in words:
+        syllables = [syllable for syllable in word.split('_') if syllable] or [word]
+        start = text.find(syllables[0], position)
+        end = start
+        for syllable in syllables:
+            found = text.find(syllable, end)
+            if start < 0 or found < 0:
+                start = -1
+                break
+            end = found + len(syllable)
+        if start < 0:
+            spans.append((offset + position, offset + position))
+            continue
+        spans.append((offset + start, offset + end))
+        position = end
+    return spans
+
+
+def window_bounds(length, window, overlap):
+    """
+    Cut a sentence of length tokens into windows of at most window tokens overlapping by overlap tokens.
+    :return: list of (start, end) token ranges; a single range when the sentence fits in one window.
+    """
+    if window is None or length <= window:
+        return [(0, length)]
+    stride = max(1, window - overlap)
+    bounds = []
+    start = 0
+    while True:
+        end = min(start + window, length)
+        bounds.append((start, end))
+        if end == length:
+            return bounds
+        start += stride
+
+
+def merge_windows(length, bounds, predictions):
+    """
+    Tag ids of a sentence from the predictions of its overlapping windows. Every token takes the prediction of the
+    window where it lies farthest from an edge, so each window is cut in the middle of its overlaps.
+    :param predictions: one tag id sequence per window of bounds.
+    """
+    merged = [0] * length
+    margin = [-1] * length
+    for (start, end), tag_ids in zip(bounds, predictions):
+        for position in range(start, end):
+            # Edges of the sentence are not window edges.
+            left = position - start if start > 0 else length
+            right = end - 1 - position if end < length else length
+            if min(left, right) > margin[position]:
+                margin[position] = min(left, right)
+                merged[position] = int(tag_ids[position - start])
+    return merged
+
+
+def entity_spans(text, tags, word_spans):
+    """
+    Entities of a sentence as dicts with their type, text and character offsets (end excluded) in the document.
+    Chunks follow conlleval, so an I- tag that does not continue an entity starts a new one.
+    """
+    entities = []
+    for first, last, entity_type in sorted(chunks(tags)):
+        start, end = word_spans[first][0], word_spans[last][1]
+        entities.append({'type': entity_type, 'start': start, 'end': end, 'text': text[start:end]})
+    return entities
@@ -0,0 +1,213 @@
+"""
+On-disk embedding store. The vectors are a float32 .npy matrix opened memory-mapped and the vocabulary is a sorted,
+offset-indexed UTF-8 blob searched in place, so opening a store costs neither a full read of the matrix nor
+unpickling the word list: pages are only touched for the words actually looked up.
+
+Layout of a store directory:
+    vectors.npy         float32 (#words, dim) embedding matrix
+    vocab.bin           UTF-8 encoded words sorted bytewise, concatenated
+    vocab_offsets.npy   int64 (#unique words + 1), word i is vocab.bin[offsets[i]:offsets[i + 1]]
+    vocab_rows.npy      int32 (#unique words), row of vectors.npy for the i-th sorted word
+    unknown.npy         optional float32 (dim,) vector of out-of-vocabulary words, written by prune_embedding.py
+
+A quantized store (see quantize_embedding.py) holds instead of vectors.npy:
+    vectors_int8.npy    int8 (#words, dim) codes, row i being vectors[i] / scales[i] rounded
+    vector_scales.npy   float32 (#words,) scale of every row
+Its rows are dequantized to float32 only when looked up, so a quarter of the float matrix is mapped.
+
+Convert an existing vectors.npy / words.pl pair with:
+    python embedding_store.py --word_dir embedding/words.pl --vector_dir embedding/vectors.npy \
+        --output_dir embedding/store
+"""
+import argparse
+import os
+import numpy as np
+from lru_cache import LRUCache
+
+VECTORS_FILE = 'vectors.npy'
+VOCAB_FILE = 'vocab.bin'
+OFFSETS_FILE = 'vocab_offsets.npy'
+ROWS_FILE = 'vocab_rows.npy'
+UNKNOWN_FILE = 'unknown.npy'
+CODES_FILE = 'vectors_int8.npy'
+SCALES_FILE = 'vector_scales.npy'
+CHUNK_ROWS = 65536
+
+
+class Vocabulary:
+    """Read-only word -> row mapping backed by the memory-mapped files of a store."""
+
+    def __init__(self, directory, memo_size=100000):
+        """:param memo_size: number of recently looked up words whose row is kept, 0 to search every lookup."""
+        vocab_file = os.path.join(directory, VOCAB_FILE)
+        if os.path.getsize(vocab_file) > 0:
+            self.blob = np.memmap(vocab_file, dtype=np.uint8, mode='r')
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)
+        self.offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode='r')
+        self.rows = np.load(os.path.join(directory, ROWS_FILE), mmap_mode='r')
+        # Recently looked up words, so repeated tokens skip the binary search. Bounded, as a server looks up
+        # arbitrary user input.
+        self.memo = LRUCache('vocabulary', memo_size)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, word):
+        return self.get(word, -1) >= 0
+
+    def word_at(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def get(self, word, default=None):
+        row = self.memo.get(word)
+        if row is not None:
+            return default if row < 0 else row
+        key = word.encode('utf-8')
+        blob, offsets = self.blob, self.offsets
+        lo, hi = 0, len(self.rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(blob[offsets[mid]:offsets[mid + 1]]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.rows) and bytes(blob[offsets[lo]:offsets[lo + 1]]) == key:
+            row = int(self.rows[lo])
+        else:
+            row = -1
+        self.memo.put(word, row)
+        return default if row < 0 else row
+
+
+class QuantizedVectors:
+    """Read-only int8 embedding matrix with a float32 scale per row, indexed like the float32 matrix it stands for."""
+
+    def __init__(self, codes, scales):
+        self.codes = codes
+        self.scales = scales
+        self.dtype = np.dtype(np.float32)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+    def __getitem__(self, index):
+        scales = np.asarray(self.scales[index], dtype=np.float32)
+        return np.asarray(self.codes[index], dtype=np.float32) * scales[..., None]
+
+    def __array__(self, dtype=None, copy=None):
+        vectors = self[:]
+        return vectors if dtype is None else vectors.astype(dtype)
+
+
+def quantize_rows(vectors):
+    """Symmetric int8 quantization of every row: (codes, scales) with vectors ~ codes * scales[:, None]."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.
+    scales[scales == 0] = 1.
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class EmbeddingStore:
+    def __init__(self, directory):
+        self.directory = directory
+        if os.path.exists(os.path.join(directory, VECTORS_FILE)):
+            self.vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode='r')
+        else:
+            self.vectors = QuantizedVectors(np.load(os.path.join(directory, CODES_FILE), mmap_mode='r'),
+                                            np.load(os.path.join(directory, SCALES_FILE), mmap_mode='r'))
+        self.vocab = Vocabulary(directory)
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    @property
+    def unknown_embedd(self):
+        """Stored vector of out-of-vocabulary words, None if the store has none."""
+        path = os.path.join(self.directory, UNKNOWN_FILE)
+        return np.load(path) if os.path.exists(path) else None
+
+
+def is_store(directory):
+    return os.path.isdir(directory) and os.path.exists(os.path.join(directory, ROWS_FILE))
+
+
+def write_vocab(embedd_words, output_directory):
+    """Write the sorted vocabulary files. Duplicated words keep their first row, as list.index did."""
+    entries = sorted((word.encode('utf-8'), row) for row, word in enumerate(embedd_words))
+    keys, rows = [], []
+    for key, row in entries:
+        if keys and keys[-1] == key:
+            continue
+        keys.append(key)
+        rows.append(row)
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum([len(key) for key in keys], out=offsets[1:])
+    with open(os.path.join(output_directory, VOCAB_FILE), 'wb') as f:
+        f.write(b''.join(keys))
+    np.save(os.path.join(output_directory, OFFSETS_FILE), offsets)
+    np.save(os.path.join(output_directory, ROWS_FILE), np.asarray(rows, dtype=np.int32))
+
+
+def write_vectors(embedd_vectors, output_directory):
+    """Copy the embedding matrix to a float32 .npy chunk by chunk, without holding it all in memory."""
+    out = np.lib.format.open_memmap(os.path.join(output_directory, VECTORS_FILE), mode='w+', dtype=np.float32,
+                                    shape=np.shape(embedd_vectors))
+    for start in range(0, len(embedd_vectors), CHUNK_ROWS):
+        out[start:start + CHUNK_ROWS] = embedd_vectors[start:start + CHUNK_ROWS]
+    out.flush()
+    del out
+
+
+def write_quantized(embedd_vectors, output_directory):
+    """Quantize the embedding matrix chunk by chunk into the int8 codes and row scales of a quantized store."""
+    shape = np.shape(embedd_vectors)
+    codes = np.lib.format.open_memmap(os.path.join(output_directory, CODES_FILE), mode='w+', dtype=np.int8,
+                                      shape=shape)
+    scales = np.zeros(shape[0], dtype=np.float32)
+    for start in range(0, shape[0], CHUNK_ROWS):
+        codes[start:start + CHUNK_ROWS], scales[start:start + CHUNK_ROWS] = \
+            quantize_rows(embedd_vectors[start:start + CHUNK_ROWS])
+    codes.flush()
+    del codes
+    np.save(os.path.join(output_directory, SCALES_FILE), scales)
+
+
+def write_unknown(dim, output_directory, seed=0):
+    """Write a fixed out-of-vocabulary vector, drawn like Featurizer draws one when none is given."""
+    unknown_embedd = np.random.RandomState(seed).uniform(-0.01, 0.01, dim).astype(np.float32)
+    np.save(os.path.join(output_directory, UNKNOWN_FILE), unknown_embedd)
+    return unknown_embedd
+
+
+def convert(word_dir, vector_dir, output_directory):
+    # Only the converter reads the legacy pickled word list.
+    import pickle5 as pickle
+    if not os.path.isdir(output_directory):
+        os.makedirs(output_directory)
+    with open(word_dir, 'rb') as handle:
+        embedd_words = pickle.load(handle)
+    embedd_vectors = np.load(vector_dir, mmap_mode='r')
+    if len(embedd_words) != len(embedd_vectors):
+        raise ValueError('%d words but %d vectors' % (len(embedd_words), len(embedd_vectors)))
+    write_vocab(embedd_words, output_directory)
+    write_vectors(embedd_vectors, output_directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--word_dir", help="pickled word list (words.pl)")
+    parser.add_argument("--vector_dir", help="embedding matrix (vectors.npy)")
+    parser.add_argument("--output_dir", help="embedding store directory to create")
+    args = parser.parse_args()
+    convert(args.word_dir, args.vector_dir, args.output_dir)
@@ -157,57 +157,161 @@ def score_by_entity(pred_tag_sequences, gold_tag_sequences, verbose=True):
     guessed_by_type = Counter()
     gold_by_type = Counter()
 
+    # hashed keys, so that matching is linear in the number of entities
+    gold_keys = set((g['sent_id'], g['start'], g['end'], g['type']) for g in gold_ents)
     for p in pred_ents:
         guessed_by_type[p['type']] += 1
-        if p in gold_ents:
+        if (p['sent_id'], p['start'], p['end'], p['type']) in gold_keys:
             correct_by_type[p['type']] += 1
     for g in gold_ents:
         gold_by_type[g['type']] += 1
-    
-    prec_micro = 0.0
-    if sum(guessed_by_type.values()) > 0:
-        prec_micro = sum(correct_by_type.values()) * 1.0 / sum(guessed_by_type.values())
-    rec_micro = 0.0
-    if sum(gold_by_type.values()) > 0:
-        rec_micro = sum(correct_by_type.values()) * 1.0 / sum(gold_by_type.values())
-    f_micro = 0.0
-    if prec_micro + rec_micro > 0:
-        f_micro = 2.0 * prec_micro * rec_micro / (prec_micro + rec_micro)
-    overall_score = {}
-    overall_score['Recall'] = rec_micro
-    overall_score['Precision'] = prec_micro
-    overall_score['F1'] = f_micro
-
-    def score_tag(tag):
+    '''
+    if verbose:
+        logger.info("Prec.\tRec.\tF1")
+        logger.info("{:.2f}\t{:.2f}\t{:.2f}".format( \
+            prec_micro*100, rec_micro*100, f_micro*100))
+    '''
+    return score_counts(correct_by_type, guessed_by_type, gold_by_type)
+
+def score_counts(correct_by_type, guessed_by_type, gold_by_type):
+    """ Precision, recall and F1 from entity counts.
+    Args:
+        correct_by_type, guessed_by_type, gold_by_type: Counters of entities per type
+    Returns:
+        A dict of scores for every entity type found in the counts, and for all of them as 'OVERALL'.
+    """
+    def score(correct, guessed, gold):
         out = {}
         prec_micro = 0.0
-        if guessed_by_type[tag] > 0:
-            prec_micro = correct_by_type[tag] * 1.0 / guessed_by_type[tag]
+        if guessed > 0:
+            prec_micro = correct * 1.0 / guessed
         rec_micro = 0.0
-        if gold_by_type[tag] > 0:
-            rec_micro = correct_by_type[tag] * 1.0 / gold_by_type[tag]
+        if gold > 0:
+            rec_micro = correct * 1.0 / gold
         f_micro = 0.0
         if prec_micro + rec_micro > 0:
-            f_micro = 2.0 * prec_micro * rec_micro / (prec_micro + rec_micro) 
+            f_micro = 2.0 * prec_micro * rec_micro / (prec_micro + rec_micro)
         out['Recall'] = rec_micro
         out['Precision'] = prec_micro
         out['F1'] = f_micro
         return out
 
-    res = {'PER':{},'LOC':{}, 'ORG':{}, 'MISC':{}, 'OVERALL':{}}
-    res['PER'] = score_tag('PER')
-    res['LOC'] = score_tag('LOC')
-    res['ORG'] = score_tag('ORG')
-    res['MISC'] = score_tag('MISC')
-    res['OVERALL'] = overall_score
-    '''
-    if verbose:
-        logger.info("Prec.\tRec.\tF1")
-        logger.info("{:.2f}\t{:.2f}\t{:.2f}".format( \
-            prec_micro*100, rec_micro*100, f_micro*100))
-    '''
+    res = {}
+    for tag in sorted(set(guessed_by_type) | set(gold_by_type)):
+        res[tag] = score(correct_by_type[tag], guessed_by_type[tag], gold_by_type[tag])
+    res['OVERALL'] = score(sum(correct_by_type.values()), sum(guessed_by_type.values()),
+                           sum(gold_by_type.values()))
+    return res
+
+def split_tag(tag):
+    """Split a tag into its chunk tag and type at the first '-', like conlleval.pl: 'B-LOC' -> ('B', 'LOC')."""
+    prefix, sep, ent_type = tag.partition('-')
+    if not sep:
+        return tag, ''
+    return prefix, ent_type
+
+def end_of_chunk(prev_tag, tag, prev_type, ent_type):
+    """Whether a chunk ended between the previous and current word (endOfChunk in conlleval.pl)."""
+    if prev_tag in ('B', 'I') and tag in ('B', 'O'):
+        return True
+    if prev_tag == 'E' and tag in ('E', 'I', 'O'):
+        return True
+    if prev_tag not in ('O', '.') and prev_type != ent_type:
+        return True
+    return prev_tag in (']', '[')
+
+def start_of_chunk(prev_tag, tag, prev_type, ent_type):
+    """Whether a chunk starts at the current word (startOfChunk in conlleval.pl)."""
+    if prev_tag in ('B', 'I', 'O') and tag == 'B':
+        return True
+    if prev_tag in ('E', 'O') and tag in ('E', 'I'):
+        return True
+    if tag not in ('O', '.') and prev_type != ent_type:
+        return True
+    return tag in ('[', ']')
+
+def chunks(tags):
+    """Decode a tag sequence into a set of (start, end, type) chunks, with the chunk rules of conlleval.pl."""
+    res = set()
+    start = None
+    prev_tag, prev_type = 'O', ''
+    # a trailing 'O' closes the last chunk, as the sentence boundary does in conlleval.pl
+    for idx, label in enumerate(list(tags) + ['O']):
+        tag, ent_type = split_tag(label)
+        ended = end_of_chunk(prev_tag, tag, prev_type, ent_type)
+        started = start_of_chunk(prev_tag, tag, prev_type, ent_type)
+        if start is not None and (ended or started):
+            res.add((start, idx - 1, prev_type))
+            start = None
+        if started:
+            start = idx
+        prev_tag, prev_type = tag, ent_type
     return res
 
+class EntityScorer:
+    """ Streaming entity-level scorer giving the same numbers as conlleval.pl.
+    Sentences are added one at a time; a predicted entity is correct if its (sent_id, start, end, type) key is
+    among the gold keys. Entity types are taken from the data.
+    """
+    def __init__(self):
+        self.correct_by_type = Counter()
+        self.guessed_by_type = Counter()
+        self.gold_by_type = Counter()
+        self.num_sentences = 0
+        self.num_tokens = 0
+        self.correct_tokens = 0
+
+    def add_sentence(self, pred_tags, gold_tags):
+        assert len(pred_tags) == len(gold_tags), "Predicted and gold tags of a sentence differ in length."
+        pred_keys = set((self.num_sentences,) + chunk for chunk in chunks(pred_tags))
+        gold_keys = set((self.num_sentences,) + chunk for chunk in chunks(gold_tags))
+        for key in pred_keys:
+            self.guessed_by_type[key[3]] += 1
+            if key in gold_keys:
+                self.correct_by_type[key[3]] += 1
+        for key in gold_keys:
+            self.gold_by_type[key[3]] += 1
+        self.num_sentences += 1
+        self.num_tokens += len(gold_tags)
+        self.correct_tokens += sum(1 for p, g in zip(pred_tags, gold_tags) if p == g)
+
+    def result(self):
+        """Scores as returned by score_by_entity, with the token accuracy added to 'OVERALL'."""
+        res = score_counts(self.correct_by_type, self.guessed_by_type, self.gold_by_type)
+        res['OVERALL']['Accuracy'] = self.correct_tokens * 1.0 / self.num_tokens if self.num_tokens > 0 else 0.0
+        return res
+
+def iter_result(input_file, pred_column=1, gold_column=2):
+    """Yield the (predicted tags, gold tags) of each sentence of a result file, reading it line by line."""
+    with codecs.open(input_file, 'r', 'utf-8') as f:
+        preds = []
+        golds = []
+        for line in f:
+            line = line.split()
+            if len(line) > 0 and line[0] != '-X-':
+                preds.append(line[pred_column])
+                golds.append(line[gold_column])
+            elif len(preds) > 0:
+                yield preds, golds
+                preds = []
+                golds = []
+        if len(preds) > 0:
+            yield preds, golds
+
+def score_file(input_file, pred_column=1, gold_column=2):
+    """ Score a result file in a single streaming pass.
+    Args:
+        input_file: one word per line, sentences separated by blank lines
+        pred_column, gold_column: columns of the predicted and gold tags. The defaults match the files written by
+            utils.predict_to_file; use pred_column=-1, gold_column=-2 for the input format of conlleval.pl
+    Returns:
+        A dict of scores, see EntityScorer.result.
+    """
+    scorer = EntityScorer()
+    for preds, golds in iter_result(input_file, pred_column, gold_column):
+        scorer.add_sentence(preds, golds)
+    return scorer.result()
+
 def read_result(input_file):
     with codecs.open(input_file, 'r', 'utf-8') as f:
         pred_list = []
@@ -231,8 +335,7 @@ def test(pred_sequences, gold_sequences):
     print (json.dumps(score_by_entity(pred_sequences, gold_sequences), indent=2))
 
 def test_file(input_file):
-    pred_list, gold_list = read_result(input_file)
-    test(pred_list, gold_list)
+    print (json.dumps(score_file(input_file), indent=2))
 
 def stat_tag(input_file):
     _, gold_list = read_result(input_file)
@@ -0,0 +1,131 @@
+"""
+Export the trained model to TensorFlow Lite for CPU inference, optionally with dynamic-range int8 quantization of
+the weights. The model is written as model.tflite next to pos.json and tag.json, where infer.py picks it up with
+NER_BACKEND=tflite (server.py and tag_corpus.py: --backend tflite).
+
+--check tags a CoNLL file (word, POS, ..., NER) with both the Keras model and the exported one, and reports how
+often their tags differ, the entity F1 of each against the last column, and the prediction time of each.
+
+Usage:
+    python export_model.py --quantize
+    python export_model.py --check data/test_sample.txt
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+from lite_model import LiteModel, LITE_FILE
+
+
+def export(model_dir, output_dir, quantize=False, max_length=None, select_tf_ops=False):
+    """
+    :param max_length: number of time steps of the exported model, required if the model was trained with
+    bucketing and accepts any length. Longer sentences are predicted piece by piece.
+    :param select_tf_ops: allow TensorFlow ops that TensorFlow Lite lacks. The model then needs the TensorFlow
+    interpreter, not tflite_runtime. Conversions with the builtin ops only that fail, as they usually do for the
+    masked LSTM layers, are retried with them.
+    """
+    import tensorflow as tf
+    model = tf.keras.models.load_model(model_dir)
+    signature = []
+    for i, x in enumerate(model.inputs):
+        shape = [None] + list(x.shape[1:])
+        if shape[1] is None:
+            if max_length is None:
+                raise ValueError('the model accepts sentences of any length, set max_length to export it')
+            shape[1] = max_length
+        # Input names keep the input order of the Keras model, see lite_model.LiteModel.
+        signature.append(tf.TensorSpec(shape, x.dtype, name='input_%d' % i))
+    function = tf.function(lambda *inputs: model(list(inputs) if len(inputs) > 1 else inputs[0], training=False))
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([function.get_concrete_function(*signature)])
+    if quantize:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if select_tf_ops:
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+        lite_model = converter.convert()
+    else:
+        try:
+            lite_model = converter.convert()
+        except Exception as e:
+            print('Conversion with the TensorFlow Lite builtin ops failed (%s), retrying with select TensorFlow ops; '
+                  'the model then needs the TensorFlow interpreter' % str(e).splitlines()[0])
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+            lite_model = converter.convert()
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    with open(os.path.join(output_dir, LITE_FILE), 'wb') as f:
+        f.write(lite_model)
+    if os.path.abspath(output_dir) != os.path.abspath(model_dir):
+        for name in ('pos.json', 'tag.json'):
+            shutil.copy(os.path.join(model_dir, name), output_dir)
+    print('Saved %s (%.1f MB)' % (os.path.join(output_dir, LITE_FILE),
+                                  os.path.getsize(os.path.join(output_dir, LITE_FILE)) / 2. ** 20))
+
+
+def timed_predict(predict_fn, corpus, max_length, batch_size, repeats):
+    """Tags of a corpus with the fastest of repeats runs, and that run's time in seconds."""
+    import infer
+    from prediction import predict_corpus
+    best = None
+    for _ in range(repeats):
+        start = time.time()
+        predicts = predict_corpus(predict_fn, corpus, infer.featurizer, infer.alphabet_pos.size(), batch_size,
+                                  max_length, decode=infer.decoder, input_format=infer.input_format)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return predicts, best
+
+
+def check(conll_file, output_dir, model_dir='model', batch_size=50, repeats=3):
+    """Compare the exported model with the Keras one in model_dir (loaded by infer) on a CoNLL file."""
+    # infer loads the model and alphabets of NER_MODEL when imported.
+    if 'infer' in sys.modules and os.path.abspath(sys.modules['infer'].model_dir) != os.path.abspath(model_dir):
+        raise ValueError('infer already loaded %s, not %s' % (sys.modules['infer'].model_dir, model_dir))
+    os.environ['NER_MODEL'] = model_dir
+    import infer
+    from eval import EntityScorer
+    from segmenter import normalize
+    from tag_corpus import read_records
+    sentences = [tokens for _, _, tokens in read_records(conll_file, 0, os.path.getsize(conll_file), 'conll')]
+    words = [[normalize(token[0]) for token in tokens] for tokens in sentences]
+    gold = [[token[-1] for token in tokens] for tokens in sentences]
+    corpus = infer.featurizer.corpus(words, infer.map_string_2_id([[token[1] for token in tokens]
+                                                                   for tokens in sentences]))
+    lite_model = LiteModel(os.path.join(output_dir, LITE_FILE))
+    runs = [('keras', infer.model.predict_on_batch, infer.max_length),
+            ('tflite', lite_model.predict_on_batch, lite_model.input_shapes[0][1])]
+    tags = {}
+    num_tokens = sum(len(sentence) for sentence in sentences)
+    for name, predict_fn, max_length in runs:
+        predicts, elapsed = timed_predict(predict_fn, corpus, max_length, batch_size, repeats)
+        tags[name] = [infer.decode_tags(tag_ids) for tag_ids in predicts]
+        scorer = EntityScorer()
+        for pred_tags, gold_tags in zip(tags[name], gold):
+            scorer.add_sentence(pred_tags, gold_tags)
+        print('%-6s F1: %6.2f%%  time: %8.2f ms  (%.3f ms/sentence)' % (
+            name, 100 * scorer.result()['OVERALL']['F1'], 1000 * elapsed, 1000 * elapsed / len(sentences)))
+    differences = sum(a != b for keras_tags, lite_tags in zip(tags['keras'], tags['tflite'])
+                      for a, b in zip(keras_tags, lite_tags))
+    print('Tags differing between keras and tflite: %d of %d tokens (%.2f%%)' % (
+        differences, num_tokens, 100. * differences / max(1, num_tokens)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", default="model", help="directory of the trained Keras model")
+    parser.add_argument("--output_dir", default="model", help="directory receiving model.tflite")
+    parser.add_argument("--quantize", action="store_true", help="quantize the weights to int8 (dynamic range)")
+    parser.add_argument("--max_length", default=None, type=int,
+                        help="number of time steps, required for a model trained with bucketing")
+    parser.add_argument("--select_tf_ops", action="store_true",
+                        help="allow TensorFlow ops missing from TensorFlow Lite (needs the full TensorFlow to run)")
+    parser.add_argument("--check", default=None,
+                        help="CoNLL file to compare accuracy and speed of the exported model with the Keras one, "
+                             "skipping the export")
+    parser.add_argument("--batch_size", default=50, type=int, help="batch size of the check")
+    args = parser.parse_args()
+    if args.check:
+        check(args.check, args.output_dir, args.model_dir, args.batch_size)
+    else:
+        export(args.model_dir, args.output_dir, args.quantize, args.max_length, args.select_tf_ops)
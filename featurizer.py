@@ -0,0 +1,245 @@
+"""
+Featurizer turns tokenized sentences into the padded float tensors consumed by the NER network. It is shared by
+training (utils.create_data) and inference (infer.create_data) so both sides normalize and embed words identically.
+"""
+import numpy as np
+
+# Bump when the normalization below changes, so that cached preprocessed corpora are rebuilt.
+NORMALIZATION_VERSION = 2
+
+# Word ids produced by Featurizer: 0 is padding, 1 is an out-of-vocabulary word and id k >= 2 is row k - 2 of the
+# pre-trained embedding matrix.
+PAD_ID = 0
+UNK_ID = 1
+ROW_OFFSET = 2
+
+PUNCTUATIONS = frozenset([u',', u'<', u'.', u'>', u'/', u'?', u'..', u'...', u'....', u':', u';', u'"', u"'", u'[',
+                          u'{', u']', u'}', u'|', u'\\', u'`', u'~', u'!', u'@', u'#', u'$', u'%', u'^', u'&', u'*',
+                          u'(', u')', u'-', u'+', u'='])
+
+
+def map_number_and_punct(word):
+    if any(char.isdigit() for char in word):
+        word = u'<number>'
+    elif word in PUNCTUATIONS:
+        word = u'<punct>'
+    return word
+
+
+def to_flat(sequences, lookup=None, default=0):
+    """
+    Flatten a list of sequences into one int32 array plus int64 sentence offsets.
+    :param sequences: list of lists of tokens (or ids when lookup is None).
+    :param lookup: optional mapping applied to every token with lookup.get(token, default).
+    :param default: id used for tokens missing from lookup.
+    :return: (flat ids, offsets) where sentence i is flat[offsets[i]:offsets[i + 1]].
+    """
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    tokens = [token for s in sequences for token in s]
+    if lookup is not None:
+        get = lookup.get
+        tokens = [get(token, default) for token in tokens]
+    flat = np.fromiter(tokens, dtype=np.int32, count=len(tokens))
+    return flat, offsets
+
+
+def as_flat(id_sentences):
+    """Flat int32 ids of a list of id sequences, or the array itself if already flat."""
+    if isinstance(id_sentences, np.ndarray):
+        return id_sentences.astype(np.int32, copy=False)
+    return to_flat(id_sentences)[0]
+
+
+def pad_ids(flat, offsets, max_length, indices=None, value=0):
+    """
+    Gather sentences of a flat id array into a right-padded (num_sentences, max_length) matrix. Sentences longer
+    than max_length are cut. A flat array of per-token rows, e.g. (#tokens, #tags) probabilities, gives a
+    (num_sentences, max_length, #tags) tensor.
+    :param indices: optional sentence indices to gather, in output order. All sentences by default.
+    """
+    if indices is None:
+        indices = np.arange(len(offsets) - 1)
+    indices = np.asarray(indices, dtype=np.int64)
+    starts = offsets[indices]
+    lengths = np.minimum(offsets[indices + 1] - starts, max_length)
+    out = np.full((len(indices), max_length) + flat.shape[1:], value, dtype=flat.dtype)
+    rows = np.repeat(np.arange(len(indices)), lengths)
+    cols = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    out[rows, cols] = flat[np.repeat(starts, lengths) + cols]
+    return out
+
+
+def unpad(padded, offsets, indices, out):
+    """Inverse of pad_ids: scatter the valid positions of a padded (len(indices), T) matrix into the flat array out."""
+    indices = np.asarray(indices, dtype=np.int64)
+    starts = offsets[indices]
+    lengths = np.minimum(offsets[indices + 1] - starts, padded.shape[1])
+    rows = np.repeat(np.arange(len(indices)), lengths)
+    cols = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    out[np.repeat(starts, lengths) + cols] = padded[rows, cols]
+    return out
+
+
+def split_offsets(offsets, max_length):
+    """
+    Cut sentences longer than max_length into consecutive pieces of at most max_length tokens.
+    :return: offsets of the pieces, into the same flat arrays as offsets.
+    """
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+    num_pieces = np.maximum(1, -(-lengths // max_length))
+    steps = np.arange(num_pieces.sum()) - np.repeat(np.cumsum(num_pieces) - num_pieces, num_pieces)
+    return np.concatenate([np.repeat(starts, num_pieces) + steps * max_length, offsets[-1:]])
+
+
+def onehot(ids, dim):
+    """One-hot encode a padded id matrix in float32. Id 0 (padding or unknown) maps to an all-zero vector."""
+    X = np.zeros(ids.shape + (dim,), dtype=np.float32)
+    rows, cols = np.nonzero(ids > 0)
+    X[rows, cols, ids[rows, cols]] = 1
+    return X
+
+
+def construct_tensor_onehot(feature_sentences, max_length, dim):
+    flat, offsets = to_flat(feature_sentences)
+    return onehot(pad_ids(flat, offsets, max_length), dim)
+
+
+class Corpus:
+    """Flat word, POS and tag ids of a tokenized corpus; sentence i spans [offsets[i], offsets[i + 1])."""
+
+    def __init__(self, word_ids, pos_ids, tag_ids, offsets):
+        self.word_ids = word_ids
+        self.pos_ids = pos_ids
+        self.tag_ids = tag_ids
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def split(self, flat):
+        """Cut a flat id array of this corpus back into one array per sentence."""
+        return np.split(flat, self.offsets[1:-1])
+
+
+class Featurizer:
+    def __init__(self, embedd_words, embedd_vectors, unknown_embedd=None):
+        """
+        :param embedd_words: list of words of the pre-trained embedding, row i of embedd_vectors being the vector of
+        embedd_words[i], or a word -> row mapping such as embedding_store.Vocabulary.
+        :param embedd_vectors: pre-trained embedding matrix, shape (#words, dim). May be memory-mapped.
+        :param unknown_embedd: vector used for out-of-vocabulary words, random when omitted.
+        """
+        self.embedd_vectors = embedd_vectors
+        self.embedd_dim = np.shape(embedd_vectors)[1]
+        if unknown_embedd is None:
+            unknown_embedd = np.random.uniform(-0.01, 0.01, [1, self.embedd_dim])
+        self.unknown_embedd = np.asarray(unknown_embedd, dtype=np.float32).reshape(self.embedd_dim)
+        self.embedd_words = embedd_words
+        self._word2row = None
+
+    @property
+    def word2row(self):
+        # Built on first use: sentences loaded as ids (e.g. from the preprocessing cache) never need it.
+        if self._word2row is None:
+            if hasattr(self.embedd_words, 'get'):
+                self._word2row = self.embedd_words
+            else:
+                # Iterate backwards so that the first occurrence of a duplicated word wins, as list.index did.
+                self._word2row = {}
+                for row in range(len(self.embedd_words) - 1, -1, -1):
+                    self._word2row[self.embedd_words[row]] = row
+        return self._word2row
+
+    def word_ids(self, word_sentences):
+        """Map sentences of (already normalized) words to flat word ids and sentence offsets."""
+        lowered = [[word.lower() for word in words] for words in word_sentences]
+        flat, offsets = to_flat(lowered, self.word2row, UNK_ID - ROW_OFFSET)
+        flat += ROW_OFFSET
+        return flat, offsets
+
+    def vocab_word_ids(self, vocab, ids):
+        """Same as word_ids for a column read by conll_reader: one lookup per distinct word, then a gather."""
+        lookup, _ = to_flat([[word.lower() for word in vocab]], self.word2row, UNK_ID - ROW_OFFSET)
+        return (lookup + ROW_OFFSET)[ids]
+
+    def embed(self, ids, out=None):
+        """
+        Look up the embedding of a padded word id matrix.
+        :param out: optional float32 (..., >= embedd_dim) tensor whose first embedd_dim features receive the vectors.
+        :return: float32 (..., embedd_dim) tensor, or out.
+        """
+        if out is None:
+            out = np.zeros(ids.shape + (self.embedd_dim,), dtype=np.float32)
+        known = ids >= ROW_OFFSET
+        out[known, :self.embedd_dim] = self.embedd_vectors[ids[known] - ROW_OFFSET]
+        out[ids == UNK_ID, :self.embedd_dim] = self.unknown_embedd
+        return out
+
+    def embedding_matrix(self):
+        """Embedding matrix indexed by word id (row 0 padding, row 1 unknown word), for an in-graph Embedding layer."""
+        matrix = np.zeros((len(self.embedd_vectors) + ROW_OFFSET, self.embedd_dim), dtype=np.float32)
+        matrix[UNK_ID] = self.unknown_embedd
+        matrix[ROW_OFFSET:] = self.embedd_vectors
+        return matrix
+
+    def construct_tensor_word(self, word_sentences, max_length):
+        flat, offsets = self.word_ids(word_sentences)
+        return self.embed(pad_ids(flat, offsets, max_length))
+
+    def transform(self, word_sentences, pos_id_sentences, max_length, dim_pos):
+        """Build the network input: word embedding concatenated with the one-hot POS vector of each token."""
+        word_flat, offsets = self.word_ids(word_sentences)
+        pos_flat, _ = to_flat(pos_id_sentences)
+        return self.transform_ids(word_flat, pos_flat, offsets, max_length, dim_pos)
+
+    def corpus(self, word_sentences, pos_id_sentences, tag_id_sentences=None):
+        """
+        Map tokenized sentences to a Corpus. Tag ids are left at 0 when not given, e.g. for inference.
+        POS and tag ids are lists of id sequences, or flat id arrays aligned with the words such as those returned
+        by Alphabet.encode.
+        """
+        word_flat, offsets = self.word_ids(word_sentences)
+        pos_flat = as_flat(pos_id_sentences)
+        if tag_id_sentences is None:
+            tag_flat = np.zeros_like(pos_flat)
+        else:
+            tag_flat = as_flat(tag_id_sentences)
+        return Corpus(word_flat, pos_flat, tag_flat, offsets)
+
+    def transform_ids(self, word_flat, pos_flat, offsets, max_length, dim_pos, indices=None):
+        """Same as transform, from flat word and POS ids. indices selects a subset of sentences, e.g. a batch."""
+        word_ids = pad_ids(word_flat, offsets, max_length, indices)
+        pos_ids = pad_ids(pos_flat, offsets, max_length, indices)
+        X = np.zeros(word_ids.shape + (self.embedd_dim + dim_pos,), dtype=np.float32)
+        self.embed(word_ids, out=X)
+        rows, cols = np.nonzero(pos_ids > 0)
+        X[rows, cols, self.embedd_dim + pos_ids[rows, cols]] = 1
+        return X
+
+    def id_inputs(self, word_flat, pos_flat, offsets, max_length, indices=None):
+        """Inputs of a network built by network.building_ner_ids: padded int32 word ids and POS ids."""
+        return [pad_ids(word_flat, offsets, max_length, indices), pad_ids(pos_flat, offsets, max_length, indices)]
+
+    def inputs(self, word_flat, pos_flat, offsets, max_length, dim_pos, indices=None, input_format='vector'):
+        """Network inputs in the given format: 'vector' (see transform_ids) or 'id' (see id_inputs)."""
+        if input_format == 'id':
+            return self.id_inputs(word_flat, pos_flat, offsets, max_length, indices)
+        return self.transform_ids(word_flat, pos_flat, offsets, max_length, dim_pos, indices)
+
+    def transform_corpus(self, corpus, max_length, dim_pos, dim_tag, indices=None, input_format='vector'):
+        """
+        Build network inputs and targets for the sentences of a Corpus (all of them by default). Targets are
+        one-hot for the 'vector' input format and integer tag ids, for a sparse loss, for the 'id' format.
+        """
+        X = self.inputs(corpus.word_ids, corpus.pos_ids, corpus.offsets, max_length, dim_pos, indices, input_format)
+        Y = pad_ids(corpus.tag_ids, corpus.offsets, max_length, indices)
+        if input_format != 'id':
+            Y = onehot(Y, dim_tag)
+        return X, Y
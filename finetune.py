@@ -0,0 +1,163 @@
+"""
+Fine-tune a trained model on newly annotated sentences instead of retraining from scratch. The model and the POS and
+tag alphabets saved by ner.py are loaded, only the new CoNLL files are read and mapped with these alphabets, and
+training continues for a bounded number of epochs with early stopping on the dev set the model was trained with.
+
+POS tags unseen by the model are appended to the POS alphabet; the input of the first LSTM layer is widened with
+zero weights for their one-hot features, so the network computes exactly what it did for the known tags. New entity
+tags would need new output classes and are refused.
+
+Usage:
+    python finetune.py --model_dir model --word_dir embedding/store --train_dir data/new_batch.txt \
+        --dev_dir data/dev.txt --output_dir model_finetuned --epochs 20 --patience 3
+"""
+import argparse
+import os
+import numpy as np
+
+
+def widen_input_kernels(weights, num_new_features):
+    """
+    Weights of a network.building_ner model (as returned by get_weights) taking num_new_features more input
+    features: zero rows are appended to the input kernels of both directions of the first LSTM layer.
+    """
+    weights = list(weights)
+    for k in (0, 3):
+        kernel = weights[k]
+        weights[k] = np.concatenate([kernel, np.zeros((num_new_features, kernel.shape[1]), dtype=kernel.dtype)])
+    return weights
+
+
+def map_columns(columns, alphabet_pos, alphabet_tag, path):
+    """POS and tag ids of a file read by conll_reader. The POS alphabet grows if it is open; unknown tags fail."""
+    pos_ids = np.array([alphabet_pos.get_index(pos) for pos in columns.vocabs[1]], dtype=np.int32)[columns.ids[1]]
+    tag_lookup = np.array([alphabet_tag.get_index(tag) for tag in columns.vocabs[2]], dtype=np.int32)
+    unknown = [tag for tag, tag_id in zip(columns.vocabs[2], tag_lookup) if tag_id == 0]
+    if unknown:
+        raise ValueError('%s has tags the model does not predict: %s' % (path, ', '.join(sorted(unknown))))
+    return pos_ids, tag_lookup[columns.ids[2]]
+
+
+def concat_corpora(corpora):
+    """One featurizer.Corpus holding the sentences of corpora in order."""
+    from featurizer import Corpus
+    offsets = [np.zeros(1, dtype=np.int64)]
+    num_tokens = 0
+    for corpus in corpora:
+        offsets.append(np.asarray(corpus.offsets[1:], dtype=np.int64) + num_tokens)
+        num_tokens += len(corpus.word_ids)
+    return Corpus(*[np.concatenate([getattr(corpus, name) for corpus in corpora])
+                    for name in ('word_ids', 'pos_ids', 'tag_ids')], np.concatenate(offsets))
+
+
+def network_config(model):
+    """(num_lstm_layer, num_hidden_node, dropout, time_step) of a model built by network.building_ner."""
+    from keras.layers import Bidirectional
+    lstm_layers = [layer.forward_layer for layer in model.layers if isinstance(layer, Bidirectional)]
+    return len(lstm_layers), lstm_layers[0].units, lstm_layers[0].dropout, model.input_shape[1]
+
+
+def dev_f1(model, corpus, featurizer, alphabet_pos, alphabet_tag, time_step, batch_size):
+    from decoder import ViterbiDecoder
+    from eval import score_by_entity
+    from prediction import predict_corpus
+    predicts = predict_corpus(model.predict_on_batch, corpus, featurizer, alphabet_pos.size(), batch_size, time_step,
+                              decode=ViterbiDecoder(alphabet_tag))
+    gold = [alphabet_tag.decode(tag_ids) for tag_ids in corpus.split(corpus.tag_ids)]
+    return score_by_entity([alphabet_tag.decode(tag_ids) for tag_ids in predicts], gold)['OVERALL']['F1']
+
+
+def finetune(model_dir, word_dir, vector_dir, train_files, dev_dir, output_dir, epochs=20, patience=3,
+             batch_size=50, learning_rate=None, tag_column=2):
+    """
+    :param train_files: the new CoNLL files; add some of the original training data to limit forgetting.
+    :param learning_rate: learning rate of the fine-tuning, the one the model was trained with by default.
+    :return: dev F1 before and after fine-tuning.
+    """
+    from keras.callbacks import EarlyStopping
+    from tensorflow import keras
+    import dataset
+    import network
+    from alphabet import Alphabet
+    from conll_reader import read_conll_columns
+    from featurizer import Corpus, Featurizer
+    from utils import load_embedding, load_unknown_embedd
+
+    model = keras.models.load_model(model_dir)
+    if len(model.inputs) != 1:
+        raise ValueError('only models built with --input_format vector can be fine-tuned')
+    alphabet_pos = Alphabet('pos')
+    alphabet_pos.load(model_dir)
+    alphabet_tag = Alphabet('tag', keep_growing=False)
+    alphabet_tag.load(model_dir)
+    embedd_words, embedd_vectors = load_embedding(word_dir, vector_dir)
+    featurizer = Featurizer(embedd_words, embedd_vectors, load_unknown_embedd(word_dir))
+    dim_pos = alphabet_pos.size()
+    if model.input_shape[2] != featurizer.embedd_dim + dim_pos:
+        raise ValueError('the model takes %d features, the embedding and POS alphabet give %d'
+                         % (model.input_shape[2], featurizer.embedd_dim + dim_pos))
+
+    print('Loading data...')
+    corpora = []
+    for path in list(train_files) + [dev_dir]:
+        # The dev set is mapped last, with the alphabet closed by then.
+        if path == dev_dir:
+            alphabet_pos.close()
+        columns = read_conll_columns(path, (0, 1, tag_column), num_workers=0)
+        pos_ids, tag_ids = map_columns(columns, alphabet_pos, alphabet_tag, path)
+        corpora.append(Corpus(featurizer.vocab_word_ids(columns.vocabs[0], columns.ids[0]), pos_ids, tag_ids,
+                              columns.offsets))
+    train = concat_corpora(corpora[:-1])
+    dev = corpora[-1]
+    num_lstm_layer, num_hidden_node, dropout, time_step = network_config(model)
+    new_pos = alphabet_pos.size() - dim_pos
+    if new_pos:
+        print('Adding %d POS tags: %s' % (new_pos, ', '.join(alphabet_pos.instances[dim_pos - 1:])))
+        widened = network.building_ner(num_lstm_layer, num_hidden_node, dropout, time_step,
+                                       featurizer.embedd_dim + alphabet_pos.size(), alphabet_tag.size())
+        widened.set_weights(widen_input_kernels(model.get_weights(), new_pos))
+        model = widened
+    if learning_rate is not None:
+        model.optimizer.learning_rate.assign(learning_rate)
+
+    f1_before = dev_f1(model, dev, featurizer, alphabet_pos, alphabet_tag, time_step, batch_size)
+    print('Dev F1 before fine-tuning: %.4f' % f1_before)
+    print('Fine-tuning on %d sentences...' % len(train))
+    # A model trained with bucketing takes batches of any length.
+    bucket = time_step is None
+    max_length = time_step or int(max(train.lengths.max(), dev.lengths.max()))
+    train_data = dataset.NerSequence(train, featurizer, alphabet_pos.size(), alphabet_tag.size(), batch_size,
+                                     max_length, shuffle=True, bucket=bucket)
+    dev_data = dataset.NerSequence(dev, featurizer, alphabet_pos.size(), alphabet_tag.size(), batch_size, max_length,
+                                   bucket=bucket)
+    model.fit(train_data, epochs=epochs, validation_data=dev_data,
+              callbacks=[EarlyStopping(patience=patience, restore_best_weights=True)])
+    f1_after = dev_f1(model, dev, featurizer, alphabet_pos, alphabet_tag, time_step, batch_size)
+    print('Dev F1 after fine-tuning: %.4f' % f1_after)
+
+    print('Saving model...')
+    model.save(output_dir)
+    alphabet_pos.save(output_dir)
+    alphabet_tag.save(output_dir)
+    return f1_before, f1_after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", default="model", help="model and alphabets saved by ner.py")
+    parser.add_argument("--word_dir", help="word surface dict directory, or an embedding store directory")
+    parser.add_argument("--vector_dir", help="word vector dict directory")
+    parser.add_argument("--train_dir", nargs="+", help="new training files")
+    parser.add_argument("--dev_dir", help="development file the model was trained with")
+    parser.add_argument("--output_dir", default="model_finetuned", help="directory receiving the fine-tuned model")
+    parser.add_argument("--epochs", default=20, type=int, help="largest number of fine-tuning epochs")
+    parser.add_argument("--patience", default=3, type=int, help="patience of the early stopping on the dev loss")
+    parser.add_argument("--batch_size", default=50, type=int)
+    parser.add_argument("--learning_rate", default=None, type=float,
+                        help="learning rate of the fine-tuning, the one of the saved optimizer by default")
+    parser.add_argument("--tag_column", default=2, type=int, help="column of the NER tag in the data files")
+    args = parser.parse_args()
+    if os.path.abspath(args.output_dir) == os.path.abspath(args.model_dir):
+        print('Warning: overwriting the model in %s' % args.model_dir)
+    finetune(args.model_dir, args.word_dir, args.vector_dir, args.train_dir, args.dev_dir, args.output_dir,
+             args.epochs, args.patience, args.batch_size, args.learning_rate, args.tag_column)
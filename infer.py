@@ -1,118 +1,188 @@
 import codecs
+import os
 import numpy as np
-import pickle5 as pickle
-from underthesea import pos_tag
-import re
-from tensorflow import keras
 from alphabet import Alphabet
-from utils import read_conll_format
-
-model = keras.models.load_model('model')
-embedd_vectors = np.load(r'embedding/vectors.npy') #load pre-trained vector. shape (#words, dim)
-with open(r'embedding/words.pl', 'rb') as handle: #list words. len(#words)
-    embedd_words = pickle.load(handle)
+from featurizer import Corpus, Featurizer
+from segmenter import normalize, segment, segment_all
+from prediction import predict_corpus
+from decoder import ViterbiDecoder
+from embedding_store import is_store
+from utils import read_conll_format, load_embedding, load_unknown_embedd
+from instrumentation import stage
+from lru_cache import LRUCache, lookup_all
+from document import align_words, entity_spans, merge_windows, split_sentences, window_bounds
+
+
+def load_model(model_dir, backend='keras'):
+    """
+    :param backend: 'keras' runs the SavedModel in model_dir, 'tflite' the model.tflite written there by
+    export_model.py, 'numpy' the weights of model_dir/variables without TensorFlow (see numpy_model.py).
+    :return: (model, shapes of its inputs).
+    """
+    if backend == 'numpy':
+        from numpy_model import NumpyModel
+        numpy_model = NumpyModel(model_dir)
+        return numpy_model, numpy_model.input_shapes
+    if backend == 'tflite':
+        from lite_model import LiteModel, LITE_FILE
+        lite_model = LiteModel(os.path.join(model_dir, LITE_FILE))
+        return lite_model, lite_model.input_shapes
+    from tensorflow import keras
+    keras_model = keras.models.load_model(model_dir)
+    return keras_model, [tuple(x.shape) for x in keras_model.inputs]
+
+
+# Command-line tools select the backend with --backend, which sets NER_BACKEND before importing this module.
+# NER_MODEL selects another model saved in the same layout, e.g. a student distilled by distill.py.
+model_dir = os.environ.get('NER_MODEL', 'model')
+model, input_shapes = load_model(model_dir, os.environ.get('NER_BACKEND', 'keras'))
+# Prefer the memory-mapped store (python embedding_store.py ...) over the pickled word list. NER_EMBEDDING selects
+# another store, e.g. one pruned to the words of the corpora by prune_embedding.py.
+word_dir = r'embedding/store' if is_store(r'embedding/store') else r'embedding/words.pl'
+word_dir = os.environ.get('NER_EMBEDDING', word_dir)
+embedd_words, embedd_vectors = load_embedding(word_dir, r'embedding/vectors.npy')
 alphabet_pos = Alphabet(name = 'pos', keep_growing=False)
-alphabet_pos.load('model')
+alphabet_pos.load(model_dir)
 alphabet_tag = Alphabet(name = 'tag')
-alphabet_tag.load('model')
+alphabet_tag.load(model_dir)
+featurizer = Featurizer(embedd_words, embedd_vectors, load_unknown_embedd(word_dir))
+decoder = ViterbiDecoder(alphabet_tag)
+# Models built by network.building_ner_ids take word ids and POS ids instead of float vectors.
+input_format = 'id' if len(input_shapes) == 2 else 'vector'
+# Fixed number of time steps of the saved model (130 for the released one), None if it was trained with bucketing.
+max_length = input_shapes[0][1]
+# Raw text -> (words, POS tags), normalized word -> word id, and (words, POS tags) -> predicted tag ids.
+segment_cache = LRUCache('segment', 10000)
+token_cache = LRUCache('token', 100000)
+prediction_cache = LRUCache('prediction', 10000)
 
-def read_format(input:str):
-    word_list = []
-    pos_list = []
-    pos_extract = pos_tag(input)
-    for ele in pos_extract:
-        word_list.append(map_number_and_punct(re.sub(' ','_',ele[0]).lower()))
-        pos_list.append(ele[1])
-    return [word_list], [pos_list]
 
+def configure_caches(segment_size=None, token_size=None, prediction_size=None):
+    """Bound the number of entries of the inference caches, 0 disabling one. None keeps the current bound."""
+    for cache, size in ((segment_cache, segment_size), (token_cache, token_size),
+                        (prediction_cache, prediction_size)):
+        if size is not None:
+            cache.resize(size)
 
-def map_number_and_punct(word):
-    if any(char.isdigit() for char in word):
-        word = u'<number>'
-    elif word in [u',', u'<', u'.', u'>', u'/', u'?', u'..', u'...', u'....', u':', u';', u'"', u"'", u'[', u'{', u']',
-                  u'}', u'|', u'\\', u'`', u'~', u'!', u'@', u'#', u'$', u'%', u'^', u'&', u'*', u'(', u')', u'-', u'+',
-                  u'=']:
-        word = u'<punct>'
-    return word
 
+def cache_stats():
+    return {cache.name: cache.stats() for cache in (segment_cache, token_cache, prediction_cache)}
 
-def map_string_2_id_close(string_list, alphabet_string):
-    string_id_list = []
-    for strings in string_list:
-        ids = []
-        for string in strings:
-            id = alphabet_string.get_index(string)
-            ids.append(id)
-        string_id_list.append(ids)
-    return string_id_list
+
+def read_format(input:str):
+    word_list, pos_list = segment(input)
+    return [word_list], [pos_list]
 
 
 def map_string_2_id(pos_list_test):
-    pos_id_list_test = map_string_2_id_close(pos_list_test, alphabet_pos)
+    """Flat POS ids of all the sentences, see Alphabet.encode."""
+    pos_id_list_test, _ = alphabet_pos.encode(pos_list_test)
     return pos_id_list_test
 
-def construct_tensor_word(word_sentences, unknown_embedd, embedd_words, embedd_vectors, embedd_dim, max_length):
-    X = np.empty([len(word_sentences), max_length, embedd_dim]) # shape: (#sentence, max_length of a sentence, dim)
-    for i in range(len(word_sentences)):
-        words = word_sentences[i] # a sentence
-        length = len(words)
-        for j in range(length):
-            word = words[j].lower()
-            try:
-                embedd = embedd_vectors[embedd_words.index(word)]
-            except:
-                embedd = unknown_embedd
-            X[i, j, :] = embedd
-        # Zero out X after the end of the sequence
-        X[i, length:] = np.zeros([1, embedd_dim])
-    return X
-
-
-def construct_tensor_onehot(feature_sentences, max_length, dim):
-    X = np.zeros([len(feature_sentences), max_length, dim])
-    for i in range(len(feature_sentences)):
-        for j in range(len(feature_sentences[i])):
-            if feature_sentences[i][j] > 0:
-                X[i, j, feature_sentences[i][j]] = 1
-    return X
-
-
-def create_vector_data(word_list_test, pos_id_list_test, unknown_embedd, embedd_words, embedd_vectors, embedd_dim,
-                       max_length, dim_pos):
-    word_test = construct_tensor_word(word_list_test, unknown_embedd, embedd_words, embedd_vectors, embedd_dim,
-                                      max_length)
-    pos_test = construct_tensor_onehot(pos_id_list_test, max_length, dim_pos)
-    input_test = word_test
-    input_test = np.concatenate((input_test, pos_test), axis=2)
-    return input_test
+
+def word_ids(word_list):
+    """Flat word ids and offsets of sentences, looking up every distinct word once through the token cache."""
+    tokens = [word for words in word_list for word in words]
+    ids = lookup_all(token_cache, tokens, lambda missing: featurizer.word_ids([missing])[0].tolist())
+    offsets = np.zeros(len(word_list) + 1, dtype=np.int64)
+    np.cumsum([len(words) for words in word_list], out=offsets[1:])
+    return np.array(ids, dtype=np.int32), offsets
+
+
+def corpus(word_list_test, pos_list_test):
+    pos_flat = map_string_2_id(pos_list_test)
+    with stage('word_ids'):
+        word_flat, offsets = word_ids(word_list_test)
+    return Corpus(word_flat, pos_flat, np.zeros_like(pos_flat), offsets)
 
 
 def create_data(test_input):
-    embedd_dim = np.shape(embedd_vectors)[1]
-    unknown_embedd = np.random.uniform(-0.01, 0.01, [1, embedd_dim])
     word_list_test, pos_list_test = read_format(test_input)
-    pos_id_list_test = map_string_2_id(pos_list_test)
-    max_length = 130 # modify according to train set
-    input_test = \
-        create_vector_data(word_list_test, pos_id_list_test, unknown_embedd, embedd_words,
-                           embedd_vectors, embedd_dim, max_length, alphabet_pos.size())
-    return input_test, word_list_test
+    return corpus(word_list_test, pos_list_test), word_list_test
+
+
+def predict(corpus_test, batch_size=50):
+    """Tag ids of every sentence of a corpus, predicted in length-bucketed batches."""
+    # Sentences longer than a fixed-length model are predicted piece by piece instead of being cut.
+    return predict_corpus(model.predict_on_batch, corpus_test, featurizer, alphabet_pos.size(), batch_size,
+                          max_length, decode=decoder, input_format=input_format)
+
+
+def decode_tags(predicts):
+    # The Viterbi decoder never predicts the padding class, so every id maps to a tag.
+    return alphabet_tag.decode(predicts)
+
+
+def to_result(words, predicts):
+    with stage('decode_tags'):
+        return [{word: predict} for word, predict in zip(words, decode_tags(predicts))]
+
+
+def predict_sentences(sentences, batch_size=50):
+    """Tag ids of (words, POS tags) sentences, as arrays of their own so that cached ones do not pin a batch."""
+    corpus_test = corpus([list(words) for words, _ in sentences], [list(poss) for _, poss in sentences])
+    return [tag_ids.copy() for tag_ids in predict(corpus_test, batch_size)]
 
 
 def infer_string(test_input):
-    input_test, word_list_test = create_data(test_input)
-    predicts = model.predict_classes(input_test, batch_size=50)
-    result = []
-    tmp = {}
-    for i in range(len(word_list_test)):
-            for j in range(len(word_list_test[i])):
-                predict = alphabet_tag.get_instance(predicts[i][j])
-                if predict == None:
-                    predict = alphabet_tag.get_instance(predicts[i][j] + 1)
-                tmp[word_list_test[i][j]] = predict
-                result.append(tmp)
-                tmp = {}
-    return result
+    return infer_batch([test_input], num_workers=0)[0]
+
+
+def infer_batch(texts, num_workers=None, batch_size=50):
+    """
+    Tag many texts at once: POS tagging runs across a process pool, then all sentences are featurized together and
+    predicted in as few batches as bucketing allows. Texts and sentences found in the caches skip these steps, and
+    repeated ones are tagged and predicted once.
+    :param num_workers: number of POS tagging processes, all cores by default, 0 to tag in this process.
+    :return: one result per text, in the same order and format as infer_string.
+    """
+    segmented = lookup_all(segment_cache, texts, lambda missing: segment_all(missing, num_workers))
+    keys = [(tuple(words), tuple(poss)) for words, poss in segmented]
+    predicts = lookup_all(prediction_cache, keys, lambda missing: predict_sentences(missing, batch_size))
+    return [to_result(words, tag_ids) for (words, _), tag_ids in zip(segmented, predicts)]
+
+
+def infer_documents(documents, num_workers=None, batch_size=50, window=None, overlap=20):
+    """
+    Tag whole documents: every document is split into sentences, sentences longer than window words are cut into
+    windows overlapping by overlap words, and the windows of all documents are predicted together before the
+    predictions of each sentence are merged.
+    :param window: longest segment fed to the model, the time steps of a fixed-length model by default. Models
+    trained with bucketing take sentences of any length unless a window is given.
+    :return: one list of entities per document, each a dict with its type, text and character offsets (end
+    excluded) in the document.
+    """
+    window = window or max_length
+    sentence_spans = [split_sentences(text) for text in documents]
+    sentences = [text[start:end] for text, spans in zip(documents, sentence_spans) for start, end in spans]
+    # Segmented with the surface words, to find them in the text; kept apart from the segment() results.
+    segmented = lookup_all(segment_cache, [('surface', sentence) for sentence in sentences],
+                           lambda missing: segment_all([sentence for _, sentence in missing], num_workers,
+                                                       surface=True))
+    keys = []
+    bounds = []
+    for words, poss in segmented:
+        normalized = tuple(normalize(word) for word in words)
+        bounds.append(window_bounds(len(words), window, min(overlap, (window or 1) - 1)))
+        keys += [(normalized[start:end], tuple(poss[start:end])) for start, end in bounds[-1]]
+    predicts = lookup_all(prediction_cache, keys, lambda missing: predict_sentences(missing, batch_size))
+    results = []
+    k = 0
+    i = 0
+    for text, spans in zip(documents, sentence_spans):
+        entities = []
+        for start, end in spans:
+            words = segmented[i][0]
+            tag_ids = merge_windows(len(words), bounds[i], predicts[k:k + len(bounds[i])])
+            entities += entity_spans(text, decode_tags(tag_ids), align_words(text[start:end], words, start))
+            k += len(bounds[i])
+            i += 1
+        results.append(entities)
+    return results
+
+
+def infer_document(text, window=None, overlap=20):
+    return infer_documents([text], num_workers=0, window=window, overlap=overlap)[0]
 
 
 # def infer_to_file(test_dir, output_file):
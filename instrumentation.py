@@ -0,0 +1,234 @@
+"""
+Per-stage timing and memory instrumentation. Code wraps its stages in `with stage('name'):`; while instrumentation
+is enabled, every stage reports its duration and memory to the registry, which keeps per-stage totals and forwards
+each observation to the registered sinks (structured logs, Prometheus text file). While disabled, stage returns a
+shared no-op context manager, so the cost is one attribute check per stage.
+
+Memory is measured as the peak resident set size of the process so far, read at the end of the stage (a process-wide
+high-water mark, not a per-stage peak) and, when tracemalloc is tracing (enable(trace_memory=True)), as the peak of
+Python allocations during the stage. Before Python 3.9, tracemalloc cannot reset its peak, and the larger of the
+traced allocations at the start and at the end of the stage is reported instead, a lower bound of its peak.
+
+This module only uses the standard library, so that POS tagging workers can import it cheaply.
+"""
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+try:
+    import resource
+except ImportError:
+    # Not available on Windows: peak RSS is then not reported.
+    resource = None
+
+logger = logging.getLogger('ner.metrics')
+NULL_STAGE = contextlib.nullcontext()
+# tracemalloc.reset_peak is new in Python 3.9.
+CAN_RESET_PEAK = hasattr(tracemalloc, 'reset_peak')
+
+
+def peak_rss():
+    """Peak resident set size of the process since it started in bytes, None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class LogSink:
+    """Logs every observation as one JSON object to the 'ner.metrics' logger."""
+
+    def observe(self, event):
+        logger.info(json.dumps(event, sort_keys=True))
+
+
+class PrometheusFileSink:
+    """Rewrites a file in the Prometheus text format, at most every interval seconds (e.g. for node_exporter)."""
+
+    def __init__(self, registry, path, interval=10.):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.last_write = 0.
+
+    def observe(self, event):
+        if time.time() - self.last_write >= self.interval:
+            self.write()
+
+    def write(self):
+        tmp_file = self.path + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(self.registry.prometheus_text())
+        os.replace(tmp_file, self.path)
+        self.last_write = time.time()
+
+
+def traced_memory():
+    """Peak of the traced allocations since the last reset, or the current ones when the peak cannot be reset."""
+    current, peak = tracemalloc.get_traced_memory()
+    return peak if CAN_RESET_PEAK else current
+
+
+class Stage:
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.traced = tracemalloc.is_tracing()
+        if self.traced:
+            stack = self.registry.peak_stack()
+            if stack:
+                # Fold the peak reached so far into the enclosing stage before resetting it.
+                stack[-1] = max(stack[-1], traced_memory())
+            if CAN_RESET_PEAK:
+                tracemalloc.reset_peak()
+                stack.append(0)
+            else:
+                stack.append(traced_memory())
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        traced_peak = None
+        if self.traced and tracemalloc.is_tracing():
+            stack = self.registry.peak_stack()
+            traced_peak = max(stack.pop(), traced_memory())
+            if stack:
+                stack[-1] = max(stack[-1], traced_peak)
+        self.registry.observe_stage(self.name, seconds, peak_rss(), traced_peak)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self.enabled = False
+        self.sinks = []
+        self.stages = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def peak_stack(self):
+        if not hasattr(self.local, 'peaks'):
+            self.local.peaks = []
+        return self.local.peaks
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def observe_stage(self, name, seconds, rss, traced_peak):
+        with self.lock:
+            totals = self.stages.setdefault(name, {'count': 0, 'seconds': 0., 'max_seconds': 0., 'peak_rss': 0,
+                                                   'peak_traced': 0})
+            totals['count'] += 1
+            totals['seconds'] += seconds
+            totals['max_seconds'] = max(totals['max_seconds'], seconds)
+            totals['peak_rss'] = max(totals['peak_rss'], rss or 0)
+            totals['peak_traced'] = max(totals['peak_traced'], traced_peak or 0)
+        event = {'type': 'stage', 'stage': name, 'seconds': seconds, 'process_peak_rss_bytes': rss}
+        if traced_peak is not None:
+            event['peak_traced_bytes'] = traced_peak
+        self.emit(event)
+
+    def set_gauge(self, name, value):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges[name] = value
+        self.emit({'type': 'gauge', 'name': name, 'value': value})
+
+    def emit(self, event):
+        for sink in self.sinks:
+            sink.observe(event)
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            stages = sorted(self.stages.items())
+            gauges = sorted(self.gauges.items())
+        series = [('ner_stage_seconds_total', 'counter', 'Time spent in each stage.', 'seconds'),
+                  ('ner_stage_calls_total', 'counter', 'Number of times each stage ran.', 'count'),
+                  ('ner_stage_max_seconds', 'gauge', 'Longest single run of each stage.', 'max_seconds'),
+                  ('ner_stage_process_peak_rss_bytes', 'gauge',
+                   'Peak resident set size of the process since it started, read at the end of each stage.',
+                   'peak_rss'),
+                  ('ner_stage_peak_traced_bytes', 'gauge', 'Peak Python allocations during each stage.',
+                   'peak_traced')]
+        for metric, kind, help_text, key in series:
+            lines.append('# HELP %s %s' % (metric, help_text))
+            lines.append('# TYPE %s %s' % (metric, kind))
+            for name, totals in stages:
+                lines.append('%s{stage="%s"} %s' % (metric, name, repr(totals[key])))
+        for name, value in gauges:
+            lines.append('# TYPE ner_%s gauge' % name)
+            lines.append('ner_%s %s' % (name, repr(value)))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.gauges = {}
+
+
+registry = Registry()
+
+
+def stage(name):
+    """Context manager timing a stage of the pipeline, a no-op while instrumentation is disabled."""
+    return registry.stage(name)
+
+
+def set_gauge(name, value):
+    registry.set_gauge(name, value)
+
+
+def enable(sinks=(), trace_memory=False):
+    """
+    Start collecting metrics.
+    :param sinks: objects with an observe(event) method, receiving every observation as a dict.
+    :param trace_memory: also measure the peak Python allocations of every stage with tracemalloc, which slows
+    allocation-heavy code down noticeably.
+    """
+    registry.sinks = list(sinks)
+    registry.enabled = True
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    registry.enabled = False
+    registry.sinks = []
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def configure(metrics, metrics_file=None, trace_memory=False):
+    """
+    Enable instrumentation from a command-line choice: 'off', 'log' (structured logs on stderr) or 'prometheus'
+    (metrics_file rewritten in the Prometheus text format, if given).
+    """
+    if metrics == 'off':
+        return
+    sinks = []
+    if metrics == 'log':
+        logging.basicConfig(level=logging.INFO)
+        sinks.append(LogSink())
+    elif metrics_file:
+        sinks.append(PrometheusFileSink(registry, metrics_file))
+    enable(sinks, trace_memory)
+
+
+def flush():
+    """Write the file sinks now, e.g. before the process exits."""
+    for sink in registry.sinks:
+        if hasattr(sink, 'write'):
+            sink.write()
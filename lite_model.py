@@ -0,0 +1,45 @@
+"""
+TensorFlow Lite runtime for models exported by export_model.py. The lean tflite_runtime package is used when
+installed, the interpreter bundled with TensorFlow otherwise.
+"""
+import numpy as np
+try:
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:
+    import tensorflow as tf
+    Interpreter = tf.lite.Interpreter
+
+LITE_FILE = 'model.tflite'
+
+
+class LiteModel:
+    def __init__(self, model_path, num_threads=None):
+        """
+        :param model_path: .tflite file written by export_model.py.
+        :param num_threads: interpreter threads, TensorFlow Lite's default if None.
+        """
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        # Keep the inputs in the order of the Keras model, which export_model.py encodes in their names.
+        self.input_details = sorted(self.interpreter.get_input_details(), key=lambda detail: detail['name'])
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.batch_shapes = None
+
+    @property
+    def input_shapes(self):
+        """Input shapes like those of a Keras model, with None as the batch dimension."""
+        return [(None,) + tuple(int(dim) for dim in detail['shape'][1:]) for detail in self.input_details]
+
+    def predict_on_batch(self, X):
+        """Same contract as keras.Model.predict_on_batch: one array, or a list of arrays for a multi-input model."""
+        X = X if isinstance(X, (list, tuple)) else [X]
+        shapes = [x.shape for x in X]
+        if shapes != self.batch_shapes:
+            for detail, shape in zip(self.input_details, shapes):
+                self.interpreter.resize_tensor_input(detail['index'], shape)
+            self.interpreter.allocate_tensors()
+            self.batch_shapes = shapes
+        for detail, x in zip(self.input_details, X):
+            self.interpreter.set_tensor(detail['index'], np.asarray(x, dtype=detail['dtype']))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index)
@@ -0,0 +1,79 @@
+"""
+Bounded least-recently-used caches with hit and miss counters, used by infer.py to skip the POS tagging, the word
+lookup and the prediction of texts, tokens and sentences it has already seen.
+"""
+import threading
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, name, maxsize):
+        """
+        :param maxsize: largest number of entries; the least recently used one is evicted beyond it. 0 disables the
+        cache, every lookup then being a miss.
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # The server tags batches on worker threads.
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self.lock:
+            value = self.entries.get(key, MISSING)
+            if value is MISSING:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def resize(self, maxsize):
+        with self.lock:
+            self.maxsize = maxsize
+            while len(self.entries) > max(0, maxsize):
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.}
+
+
+def lookup_all(cache, keys, compute):
+    """
+    Values of many keys, computing the missing ones together. Keys repeated in keys are computed once, even when
+    the cache is disabled.
+    :param compute: maps a list of distinct missing keys to the list of their values.
+    :return: list of values, aligned with keys.
+    """
+    values = [cache.get(key, MISSING) for key in keys]
+    missing = list(OrderedDict.fromkeys(key for key, value in zip(keys, values) if value is MISSING))
+    if not missing:
+        return values
+    computed = dict(zip(missing, compute(missing)))
+    for key, value in computed.items():
+        cache.put(key, value)
+    return [computed[key] if value is MISSING else value for key, value in zip(keys, values)]
@@ -1,5 +1,10 @@
 import utils
 import network
+import dataset
+from decoder import ViterbiDecoder
+import instrumentation
+from callbacks import ThroughputCallback
+from checkpoint import TrainingCheckpoint
 import argparse
 import numpy as np
 from datetime import datetime
@@ -8,64 +13,147 @@ import subprocess
 import shlex
 import json
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--word_dir", help="word surface dict directory")
-parser.add_argument("--vector_dir", help="word vector dict directory")
-parser.add_argument("--train_dir", help="training directory")
-parser.add_argument("--dev_dir", help="development directory")
-parser.add_argument("--test_dir", help="testing directory")
-parser.add_argument("--num_lstm_layer", help="number of lstm layer")
-parser.add_argument("--num_hidden_node", help="number of hidden node")
-parser.add_argument("--dropout", help="dropout number: between 0 and 1")
-parser.add_argument("--batch_size", help="batch size for training")
-parser.add_argument("--patience", help="patience")
-args = parser.parse_args()
 
-word_dir = args.word_dir
-vector_dir = args.vector_dir
-train_dir = args.train_dir
-dev_dir = args.dev_dir
-test_dir = args.test_dir
-num_lstm_layer = int(args.num_lstm_layer)
-num_hidden_node = int(args.num_hidden_node)
-dropout = float(args.dropout)
-batch_size = int(args.batch_size)
-patience = int(args.patience)
-# patience : number of epochs with no improvement after which training will be stopped
-startTime = datetime.now()
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--word_dir", help="word surface dict directory, or an embedding store directory")
+    parser.add_argument("--vector_dir", help="word vector dict directory")
+    parser.add_argument("--train_dir", help="training directory")
+    parser.add_argument("--dev_dir", help="development directory")
+    parser.add_argument("--test_dir", help="testing directory")
+    parser.add_argument("--num_lstm_layer", help="number of lstm layer")
+    parser.add_argument("--num_hidden_node", help="number of hidden node")
+    parser.add_argument("--dropout", help="dropout number: between 0 and 1")
+    parser.add_argument("--batch_size", help="batch size for training")
+    parser.add_argument("--patience", help="patience")
+    parser.add_argument("--streaming", action="store_true",
+                        help="featurize batches on the fly instead of building dense tensors up front")
+    parser.add_argument("--workers", default=1, help="number of threads preparing batches in streaming mode")
+    parser.add_argument("--bucketing", action="store_true",
+                        help="batch sentences of similar length and pad each batch to its own longest sentence "
+                             "(implies --streaming)")
+    parser.add_argument("--input_format", default="vector", choices=["vector", "id"],
+                        help="vector: float embedding + one-hot POS inputs; id: int32 word and POS ids embedded in the "
+                             "model, trained with a sparse loss (implies --bucketing)")
+    parser.add_argument("--cache_dir", help="preprocessing cache directory, reused across runs on the same data")
+    parser.add_argument("--tag_column", default=2, type=int,
+                        help="column of the NER tag in the data files, 3 or -1 for the 4-column VLSP format")
+    parser.add_argument("--reader_workers", default=None, type=int,
+                        help="processes parsing large data files, all cores by default, 0 to parse in this process")
+    parser.add_argument("--trainable_embedding", action="store_true",
+                        help="fine-tune the word embedding (--input_format id only)")
+    parser.add_argument("--checkpoint_dir", default="checkpoints",
+                        help="directory of the training checkpoints, saved after every epoch")
+    parser.add_argument("--checkpoint_steps", default=0, type=int,
+                        help="also save a checkpoint every this many batches, 0 to save after every epoch only")
+    parser.add_argument("--resume", action="store_true", help="continue training from the latest checkpoint")
+    parser.add_argument("--metrics", default="off", choices=["off", "log", "prometheus"],
+                        help="report the time and memory of every stage as structured logs or to --metrics_file")
+    parser.add_argument("--metrics_file", default="metrics.prom", help="Prometheus text file for --metrics prometheus")
+    parser.add_argument("--trace_memory", action="store_true",
+                        help="also measure the peak Python allocations of every stage (slower)")
+    args = parser.parse_args()
 
-print('Loading data...')
-input_train, output_train, input_dev, output_dev, input_test, output_test, alphabet_tag, max_length, \
-    alphabet_pos, alphabet_tag = utils.create_data(word_dir, vector_dir, train_dir, dev_dir, test_dir)
-print('Building model...')
-time_step, input_length = np.shape(input_train)[1:]
-output_length = np.shape(output_train)[2]
-ner_model = network.building_ner(num_lstm_layer, num_hidden_node, dropout, time_step, input_length, output_length)
-print('Model summary...')
-print(ner_model.summary())
-print('Training model...')
-early_stopping = EarlyStopping(patience=patience)
-history = ner_model.fit(input_train, output_train, batch_size=batch_size, epochs=1000,
-                        validation_data=(input_dev, output_dev), callbacks=[early_stopping])
-print('Saving model...')
-ner_model.save('model')
-alphabet_pos.save('model', name=None)
-# alphabet_chunk.save('model', name=None)
-alphabet_tag.save('model', name=None)
-print(f"Max length: {max_length}")
+    word_dir = args.word_dir
+    vector_dir = args.vector_dir
+    train_dir = args.train_dir
+    dev_dir = args.dev_dir
+    test_dir = args.test_dir
+    num_lstm_layer = int(args.num_lstm_layer)
+    num_hidden_node = int(args.num_hidden_node)
+    dropout = float(args.dropout)
+    batch_size = int(args.batch_size)
+    patience = int(args.patience)
+    input_format = args.input_format
+    bucketing = args.bucketing or input_format == 'id'
+    streaming = args.streaming or bucketing
+    workers = int(args.workers)
+    # patience : number of epochs with no improvement after which training will be stopped
+    startTime = datetime.now()
+    instrumentation.configure(args.metrics, args.metrics_file, args.trace_memory)
 
-print('Testing model...')
-answer = ner_model.predict_classes(input_test, batch_size=batch_size)
-utils.predict_to_file(answer, output_test, alphabet_tag, 'out.txt')
-# input = open('out.txt')
-# p1 = subprocess.Popen(shlex.split("perl conlleval.pl"), stdin=input)
-# p1.wait()
-endTime = datetime.now()
-print("Running time: ")
-print(endTime - startTime)
+    print('Loading data...')
+    if streaming:
+        train, dev, test, featurizer, alphabet_pos, alphabet_tag, max_length = \
+            utils.create_id_data(word_dir, vector_dir, train_dir, dev_dir, test_dir, cache_dir=args.cache_dir,
+                                 tag_column=args.tag_column, num_workers=args.reader_workers)
+        train_data = dataset.NerSequence(train, featurizer, alphabet_pos.size(), alphabet_tag.size(), batch_size,
+                                         max_length, shuffle=True, bucket=bucketing, input_format=input_format)
+        dev_data = dataset.NerSequence(dev, featurizer, alphabet_pos.size(), alphabet_tag.size(), batch_size,
+                                       max_length, bucket=bucketing, input_format=input_format)
+        output_test = test.split(test.tag_ids)
+        # A bucketed model accepts batches of any length.
+        time_step = None if bucketing else max_length
+        input_length = featurizer.embedd_dim + alphabet_pos.size()
+        output_length = alphabet_tag.size()
+    else:
+        input_train, output_train, input_dev, output_dev, input_test, output_test, alphabet_tag, max_length, \
+            alphabet_pos, alphabet_tag = utils.create_data(word_dir, vector_dir, train_dir, dev_dir, test_dir,
+                                                           cache_dir=args.cache_dir, tag_column=args.tag_column,
+                                                           num_workers=args.reader_workers)
+        time_step, input_length = np.shape(input_train)[1:]
+        output_length = np.shape(output_train)[2]
+    print('Building model...')
+    if input_format == 'id':
+        ner_model = network.building_ner_ids(num_lstm_layer, num_hidden_node, dropout, featurizer.embedding_matrix(),
+                                             alphabet_pos.size(), output_length,
+                                             trainable_embedding=args.trainable_embedding)
+    else:
+        ner_model = network.building_ner(num_lstm_layer, num_hidden_node, dropout, time_step, input_length,
+                                         output_length)
+    print('Model summary...')
+    print(ner_model.summary())
+    print('Training model...')
+    early_stopping = EarlyStopping(patience=patience)
+    checkpoint = TrainingCheckpoint(ner_model, args.checkpoint_dir, {'pos': alphabet_pos, 'tag': alphabet_tag},
+                                    early_stopping, save_steps=args.checkpoint_steps)
+    initial_epoch = checkpoint.restore([train_data] if streaming else ()) if args.resume else 0
+    if streaming:
+        throughput = ThroughputCallback(len(train))
+        history = ner_model.fit(train_data, epochs=1000, validation_data=dev_data,
+                                callbacks=[early_stopping, throughput, checkpoint], workers=workers,
+                                max_queue_size=10, initial_epoch=initial_epoch)
+    else:
+        throughput = ThroughputCallback(len(input_train))
+        history = ner_model.fit(input_train, output_train, batch_size=batch_size, epochs=1000,
+                                validation_data=(input_dev, output_dev),
+                                callbacks=[early_stopping, throughput, checkpoint], initial_epoch=initial_epoch)
+    # Keep the weights of the epoch with the lowest dev loss rather than those of the last one.
+    checkpoint.restore_best()
+    print('Saving model...')
+    ner_model.save('model')
+    alphabet_pos.save('model', name=None)
+    # alphabet_chunk.save('model', name=None)
+    alphabet_tag.save('model', name=None)
+    print(f"Max length: {max_length}")
 
-# print('Check saved model...')
-# from tensorflow import keras
-# model = keras.models.load_model('model')
-# answer2 = model.predict_classes(input_test, batch_size=batch_size)
-# utils.predict_to_file(answer2, output_test, alphabet_tag, 'out2.txt')
\ No newline at end of file
+    print('Testing model...')
+    decoder = ViterbiDecoder(alphabet_tag)
+    if streaming:
+        answer = dataset.predict_corpus(ner_model.predict_on_batch, test, featurizer, alphabet_pos.size(), batch_size,
+                                        time_step, decode=decoder, input_format=input_format)
+    else:
+        test_lengths = np.minimum([len(tags) for tags in output_test], time_step)
+        with instrumentation.stage('predict'):
+            probs = ner_model.predict(input_test, batch_size=batch_size)
+        with instrumentation.stage('decode'):
+            answer = decoder(probs, test_lengths)
+    utils.predict_to_file(answer, output_test, alphabet_tag, 'out.txt')
+    # input = open('out.txt')
+    # p1 = subprocess.Popen(shlex.split("perl conlleval.pl"), stdin=input)
+    # p1.wait()
+    endTime = datetime.now()
+    instrumentation.flush()
+    print("Running time: ")
+    print(endTime - startTime)
+
+    # print('Check saved model...')
+    # from tensorflow import keras
+    # model = keras.models.load_model('model')
+    # answer2 = model.predict_classes(input_test, batch_size=batch_size)
+    # utils.predict_to_file(answer2, output_test, alphabet_tag, 'out2.txt')
+
+
+if __name__ == "__main__":
+    # Data files are parsed by a spawned process pool, which imports this module again.
+    main()
@@ -1,5 +1,6 @@
-from keras.models import Sequential
-from keras.layers import LSTM, Dense, TimeDistributed, Activation, Bidirectional, Masking
+from keras.models import Sequential, Model
+from keras.layers import LSTM, GRU, Conv1D, Dense, TimeDistributed, Activation, Bidirectional, Masking, Input, \
+    Embedding, Concatenate
 
 
 def building_ner(num_lstm_layer, num_hidden_node, dropout, time_step, vector_length, output_lenght):
@@ -29,3 +30,62 @@ def building_ner(num_lstm_layer, num_hidden_node, dropout, time_step, vector_len
     model.compile(optimizer='adam',
                   loss='categorical_crossentropy', metrics=['accuracy'])
     return model
+
+
+def building_ner_ids(num_lstm_layer, num_hidden_node, dropout, embedd_matrix, dim_pos, output_lenght,
+                     pos_embedd_dim=None, trainable_embedding=False):
+    """
+    Same network as building_ner, fed with int32 word ids and POS ids instead of pre-expanded float vectors.
+    :param embedd_matrix: initial word embedding indexed by word id, see featurizer.Featurizer.embedding_matrix.
+    :param dim_pos: size of the POS alphabet.
+    :param pos_embedd_dim: size of the learned POS embedding, dim_pos by default.
+    :param trainable_embedding: fine-tune the word embedding instead of keeping it frozen.
+    """
+    word_ids = Input(shape=(None,), dtype='int32', name='word_ids')
+    pos_ids = Input(shape=(None,), dtype='int32', name='pos_ids')
+    # Word id 0 is padding: mask_zero plays the role of the Masking layer and also masks the loss.
+    word_embedd = Embedding(len(embedd_matrix), embedd_matrix.shape[1], weights=[embedd_matrix],
+                            trainable=trainable_embedding, mask_zero=True)(word_ids)
+    pos_embedd = Embedding(dim_pos, pos_embedd_dim or dim_pos)(pos_ids)
+    x = Concatenate()([word_embedd, pos_embedd])
+    for i in range(num_lstm_layer-1):
+        x = Bidirectional(LSTM(units=num_hidden_node, return_sequences=True, dropout=dropout,
+                               recurrent_dropout=dropout))(x)
+    x = Bidirectional(LSTM(units=num_hidden_node, return_sequences=True, dropout=dropout,
+                           recurrent_dropout=dropout), merge_mode='concat')(x)
+    x = TimeDistributed(Dense(output_lenght))(x)
+    output = Activation('softmax')(x)
+    model = Model(inputs=[word_ids, pos_ids], outputs=output)
+    model.compile(optimizer='adam',
+                  loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    return model
+
+
+def building_student(cell, num_layer, num_hidden_node, dropout, time_step, vector_length, output_lenght,
+                     kernel_size=3):
+    """
+    Smaller tagger fed with the same inputs as building_ner, trained by distill.py on the soft targets of a
+    building_ner model.
+    :param cell: 'lstm' or 'gru' for bidirectional recurrent layers, 'conv' for 1D convolutions over kernel_size
+    tokens. The recurrent layers have no recurrent dropout, so that Keras runs them with its fused kernels.
+    :param dropout: input dropout of the recurrent layers.
+    """
+    model = Sequential()
+    if cell == 'conv':
+        # Convolutions do not take a mask: padded steps are zero vectors, as at inference.
+        model.add(Conv1D(num_hidden_node, kernel_size, padding='same', activation='relu',
+                         input_shape=(time_step, vector_length)))
+        for i in range(num_layer-1):
+            model.add(Conv1D(num_hidden_node, kernel_size, padding='same', activation='relu'))
+    else:
+        model.add(Masking(mask_value=0., input_shape=(time_step, vector_length)))
+        layer = {'lstm': LSTM, 'gru': GRU}[cell]
+        for i in range(num_layer):
+            model.add(Bidirectional(layer(units=num_hidden_node, return_sequences=True, dropout=dropout),
+                                    merge_mode='concat'))
+    model.add(TimeDistributed(Dense(output_lenght)))
+    model.add(Activation('softmax'))
+    # Soft targets are probability distributions, which categorical_crossentropy accepts as they are.
+    model.compile(optimizer='adam',
+                  loss='categorical_crossentropy', metrics=['accuracy'])
+    return model
@@ -0,0 +1,214 @@
+"""
+TensorFlow-free inference backend: the weights of a model saved by ner.py are read from its checkpoint
+(model/variables) with a small reader of the TensorFlow tensor bundle format, and the forward pass of the
+network.building_ner architecture (masked bidirectional LSTM layers, then a time-distributed softmax layer) runs in
+batched NumPy. Importing this module loads neither TensorFlow nor Keras, so short-lived jobs start quickly.
+"""
+import os
+import re
+import struct
+import numpy as np
+
+VARIABLES_DIR = 'variables'
+TABLE_MAGIC = 0xdb4775248b80fb57
+FOOTER_SIZE = 48
+# DataType enum of tensorflow/core/framework/types.proto.
+DTYPES = {1: np.float32, 2: np.float64, 3: np.int32, 4: np.uint8, 5: np.int16, 6: np.int8, 9: np.int64,
+          10: np.bool_, 17: np.uint16, 19: np.float16, 22: np.uint32, 23: np.uint64}
+# Model variables of a Keras SavedModel, numbered in the order of model.variables; optimizer slots are excluded.
+MODEL_VARIABLE = re.compile(r'^variables/(\d+)/\.ATTRIBUTES/VARIABLE_VALUE$')
+
+
+def read_varint(data, position):
+    result = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def read_fields(data):
+    """Decode a protobuf message into a dict of field number -> list of raw values (ints or bytes)."""
+    fields = {}
+    position = 0
+    while position < len(data):
+        key, position = read_varint(data, position)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, position = read_varint(data, position)
+        elif wire_type == 1:
+            value = struct.unpack_from('<Q', data, position)[0]
+            position += 8
+        elif wire_type == 2:
+            length, position = read_varint(data, position)
+            value = bytes(data[position:position + length])
+            position += length
+        elif wire_type == 5:
+            value = struct.unpack_from('<I', data, position)[0]
+            position += 4
+        else:
+            raise ValueError('unsupported protobuf wire type %d' % wire_type)
+        fields.setdefault(number, []).append(value)
+    return fields
+
+
+def read_block(data, handle):
+    """Key/value pairs of an uncompressed table block."""
+    offset, size = handle
+    if data[offset + size] != 0:
+        raise ValueError('compressed checkpoint index blocks are not supported')
+    block = data[offset:offset + size]
+    num_restarts = struct.unpack_from('<I', block, size - 4)[0]
+    end = size - 4 - 4 * num_restarts
+    entries = []
+    key = b''
+    position = 0
+    while position < end:
+        shared, position = read_varint(block, position)
+        non_shared, position = read_varint(block, position)
+        value_length, position = read_varint(block, position)
+        key = key[:shared] + bytes(block[position:position + non_shared])
+        position += non_shared
+        entries.append((key, bytes(block[position:position + value_length])))
+        position += value_length
+    return entries
+
+
+def read_handle(data, position=0):
+    offset, position = read_varint(data, position)
+    size, position = read_varint(data, position)
+    return (offset, size), position
+
+
+def read_index(index_file):
+    """Entries of the sorted string table of a checkpoint index, as a dict of key -> serialized BundleEntryProto."""
+    with open(index_file, 'rb') as f:
+        data = f.read()
+    footer = data[-FOOTER_SIZE:]
+    if struct.unpack_from('<Q', footer, FOOTER_SIZE - 8)[0] != TABLE_MAGIC:
+        raise ValueError('%s is not a checkpoint index' % index_file)
+    _, position = read_handle(footer)
+    index_handle, _ = read_handle(footer, position)
+    entries = {}
+    for _, handle in read_block(data, index_handle):
+        for key, value in read_block(data, read_handle(handle)[0]):
+            entries[key.decode('utf-8')] = value
+    return entries
+
+
+def load_checkpoint(prefix):
+    """
+    Read the tensors of a TensorFlow checkpoint, e.g. model/variables/variables.
+    :return: dict of checkpoint key -> array.
+    """
+    entries = read_index(prefix + '.index')
+    header = read_fields(entries.pop(''))
+    num_shards = header.get(1, [1])[0]
+    shards = {}
+    tensors = {}
+    for key, value in entries.items():
+        entry = read_fields(value)
+        if 7 in entry:
+            raise ValueError('partitioned variable %s is not supported' % key)
+        dtype = DTYPES.get(entry.get(1, [0])[0])
+        if dtype is None:
+            # Strings, e.g. the object graph, are not weights.
+            continue
+        shape = [read_fields(dim).get(1, [0])[0] for dim in read_fields(entry.get(2, [b''])[0]).get(2, [])]
+        shard = entry.get(3, [0])[0]
+        if shard not in shards:
+            shards[shard] = np.memmap('%s.data-%05d-of-%05d' % (prefix, shard, num_shards), dtype=np.uint8,
+                                      mode='r')
+        offset, size = entry.get(4, [0])[0], entry.get(5, [0])[0]
+        tensors[key] = np.frombuffer(shards[shard][offset:offset + size].tobytes(), dtype=dtype).reshape(shape)
+    return tensors
+
+
+def sigmoid(x):
+    return 1. / (1. + np.exp(-x))
+
+
+def softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def lstm(X, mask, kernel, recurrent_kernel, bias, go_backwards=False):
+    """
+    Keras LSTM with return_sequences over a batch, gates in the order input, forget, cell, output.
+    :param X: (batch, time, features) inputs.
+    :param mask: (batch, time) booleans; masked steps keep the previous state and output zeros, as in a
+    Bidirectional layer.
+    :return: (batch, time, units) outputs.
+    """
+    batch_size, time_steps, _ = X.shape
+    units = recurrent_kernel.shape[0]
+    # The input projection of all the steps at once, only the recurrent part is sequential.
+    projected = np.dot(X, kernel) + bias
+    h = np.zeros((batch_size, units), dtype=np.float32)
+    c = np.zeros((batch_size, units), dtype=np.float32)
+    outputs = np.zeros((batch_size, time_steps, units), dtype=np.float32)
+    steps = range(time_steps - 1, -1, -1) if go_backwards else range(time_steps)
+    for t in steps:
+        z = projected[:, t] + np.dot(h, recurrent_kernel)
+        i = sigmoid(z[:, :units])
+        f = sigmoid(z[:, units:2 * units])
+        o = sigmoid(z[:, 3 * units:])
+        new_c = f * c + i * np.tanh(z[:, 2 * units:3 * units])
+        new_h = o * np.tanh(new_c)
+        keep = mask[:, t, None]
+        c = np.where(keep, new_c, c)
+        h = np.where(keep, new_h, h)
+        outputs[:, t] = np.where(keep, new_h, 0.)
+    return outputs
+
+
+def network_weights(tensors):
+    """
+    Weights of a network.building_ner model from its checkpoint tensors, in the order of model.get_weights():
+    kernel, recurrent kernel and bias of the forward then the backward LSTM of every layer, then the dense layer.
+    """
+    numbered = {}
+    for key, value in tensors.items():
+        match = MODEL_VARIABLE.match(key)
+        if match is not None:
+            numbered[int(match.group(1))] = value
+    weights = [numbered[number] for number in sorted(numbered)]
+    if len(weights) < 8 or (len(weights) - 2) % 6:
+        raise ValueError('expected the weights of bidirectional LSTM layers and a dense layer, got %d tensors'
+                         % len(weights))
+    for k in range(0, len(weights) - 2, 3):
+        kernel, recurrent_kernel, bias = weights[k:k + 3]
+        units = recurrent_kernel.shape[0]
+        if kernel.shape[1] != 4 * units or recurrent_kernel.shape != (units, 4 * units) or bias.shape != (4 * units,):
+            raise ValueError('tensors %d-%d are not the weights of an LSTM layer' % (k, k + 2))
+    return weights
+
+
+class NumpyModel:
+    def __init__(self, model_dir):
+        """:param model_dir: directory of a model saved by ner.py, built by network.building_ner."""
+        tensors = load_checkpoint(os.path.join(model_dir, VARIABLES_DIR, VARIABLES_DIR))
+        self.set_weights(network_weights(tensors))
+
+    def set_weights(self, weights):
+        weights = [np.asarray(w, dtype=np.float32) for w in weights]
+        self.layers = [(weights[k:k + 3], weights[k + 3:k + 6]) for k in range(0, len(weights) - 2, 6)]
+        self.dense_kernel, self.dense_bias = weights[-2:]
+
+    @property
+    def input_shapes(self):
+        # Any number of time steps: batches are only padded to their longest sentence.
+        return [(None, None, self.layers[0][0][0].shape[0])]
+
+    def predict_on_batch(self, X):
+        """(batch, time, #tags) tag probabilities of a batch of network inputs."""
+        X = np.asarray(X, dtype=np.float32)
+        # Masking(mask_value=0.): a step is masked when all its features are zero.
+        mask = np.any(X != 0, axis=-1)
+        for forward, backward in self.layers:
+            X = np.concatenate([lstm(X, mask, *forward), lstm(X, mask, *backward, go_backwards=True)], axis=-1)
+        return softmax(np.dot(X, self.dense_kernel) + self.dense_bias)
@@ -0,0 +1,76 @@
+"""
+Prediction over a featurizer.Corpus in length-bucketed batches. This module stays free of TensorFlow so that
+inference can run on the NumPy or TFLite backends without importing it; dataset.py builds the training pipeline on
+top of it.
+"""
+import numpy as np
+from featurizer import split_offsets, unpad
+from instrumentation import stage
+
+
+def bucket_batches(lengths, batch_size, shuffle=False):
+    """
+    Group sentence indices into batches of similar length.
+    :param lengths: length of every sentence.
+    :param shuffle: randomize the batches: ties between equal lengths are broken randomly and the batch order is
+    shuffled.
+    :return: list of index arrays, one per batch.
+    """
+    lengths = np.asarray(lengths)
+    if shuffle:
+        order = np.lexsort((np.random.permutation(len(lengths)), lengths))
+    else:
+        order = np.argsort(lengths, kind='stable')
+    batches = [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+    if shuffle:
+        np.random.shuffle(batches)
+    return batches
+
+
+def argmax_decode(probs, lengths):
+    return np.argmax(probs, axis=-1)
+
+
+def predict_corpus(predict_fn, corpus, featurizer, dim_pos, batch_size, max_length=None, decode=argmax_decode,
+                   input_format='vector'):
+    """
+    Predict the tag ids of every sentence of a corpus with length-bucketed batches.
+    :param predict_fn: maps a batch of network inputs to (batch, time, #tags) probabilities, e.g.
+    model.predict_on_batch.
+    :param max_length: number of time steps of a model with a fixed input length, None if it accepts any length.
+    Sentences longer than a fixed max_length are cut into pieces that are predicted separately.
+    :param decode: maps (probabilities, sentence lengths) of a batch to a (batch, time) matrix of tag ids.
+    :param input_format: 'vector' for a network built by network.building_ner, 'id' for network.building_ner_ids.
+    :return: one array of tag ids per sentence, in corpus order.
+    """
+    offsets = corpus.offsets if max_length is None else split_offsets(corpus.offsets, max_length)
+    lengths = np.diff(offsets)
+    predicts = np.zeros(len(corpus.word_ids), dtype=np.int32)
+    for indices in bucket_batches(lengths, batch_size):
+        time_step = max_length or max(1, int(lengths[indices].max()))
+        with stage('featurize_batch'):
+            X = featurizer.inputs(corpus.word_ids, corpus.pos_ids, offsets, time_step, dim_pos, indices,
+                                  input_format)
+        with stage('predict'):
+            probs = predict_fn(X)
+        with stage('decode'):
+            unpad(decode(probs, lengths[indices]), offsets, indices, predicts)
+    return corpus.split(predicts)
+
+
+def predict_probs(predict_fn, corpus, featurizer, dim_pos, batch_size, max_length=None, input_format='vector'):
+    """
+    Tag probabilities of every token of a corpus, batched as in predict_corpus.
+    :return: float32 (#tokens, #tags) array aligned with the flat ids of the corpus.
+    """
+    offsets = corpus.offsets if max_length is None else split_offsets(corpus.offsets, max_length)
+    lengths = np.diff(offsets)
+    probs = None
+    for indices in bucket_batches(lengths, batch_size):
+        time_step = max_length or max(1, int(lengths[indices].max()))
+        X = featurizer.inputs(corpus.word_ids, corpus.pos_ids, offsets, time_step, dim_pos, indices, input_format)
+        batch_probs = np.asarray(predict_fn(X), dtype=np.float32)
+        if probs is None:
+            probs = np.zeros((len(corpus.word_ids), batch_probs.shape[-1]), dtype=np.float32)
+        unpad(batch_probs, offsets, indices, probs)
+    return probs
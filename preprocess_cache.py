@@ -0,0 +1,152 @@
+"""
+On-disk cache of preprocessed corpora. An entry holds the flat word/POS/tag ids and sentence offsets of the
+train, dev and test files as .npy arrays, loaded memory-mapped, together with the POS and tag alphabets and a
+manifest. Entries are keyed by the content hashes of the CoNLL files and of the embedding, and by the normalization
+settings, so a changed input maps to a new key; the entry it replaces is then deleted.
+
+Hashing a multi-GB embedding takes longer than loading an entry, so the digest of every file is kept in
+digests.json and reused while the size, modification time and inode of the file are unchanged.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from alphabet import Alphabet
+from featurizer import Corpus, NORMALIZATION_VERSION, PUNCTUATIONS
+
+MANIFEST_FILE = 'manifest.json'
+DIGESTS_FILE = 'digests.json'
+SPLITS = ('train', 'dev', 'test')
+ARRAYS = ('word_ids', 'pos_ids', 'tag_ids', 'offsets')
+HASH_CHUNK = 1 << 20
+# Bump when the layout of an entry changes, so that older entries are rebuilt.
+FORMAT_VERSION = 2
+
+
+def file_digest(path, digests=None):
+    """
+    sha256 of the content of a file.
+    :param digests: optional dict of absolute path -> {'stat': ..., 'sha256': ...}, reused while the file is
+    unchanged and updated otherwise.
+    """
+    info = os.stat(path)
+    stat = [info.st_size, info.st_mtime_ns, info.st_ino]
+    path = os.path.abspath(path)
+    if digests is not None and path in digests and digests[path]['stat'] == stat:
+        return digests[path]['sha256']
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    if digests is not None:
+        digests[path] = {'stat': stat, 'sha256': digest.hexdigest()}
+    return digest.hexdigest()
+
+
+def hash_path(path, digest, digests=None):
+    """Feed the content hash of a file, or of every file of a directory, to digest."""
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            digest.update(name.encode('utf-8'))
+            hash_path(os.path.join(path, name), digest, digests)
+        return
+    digest.update(file_digest(path, digests).encode('ascii'))
+
+
+def normalization_settings():
+    return {'version': NORMALIZATION_VERSION, 'punctuations': sorted(PUNCTUATIONS)}
+
+
+def fingerprint(paths, settings=None, digests=None):
+    """:param digests: file digests to reuse, see file_digest."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(normalization_settings(), sort_keys=True).encode('utf-8'))
+    digest.update(b'format %d' % FORMAT_VERSION)
+    if settings is not None:
+        digest.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    for path in paths:
+        digest.update(b'\0')
+        if path is not None:
+            hash_path(path, digest, digests)
+    return digest.hexdigest()
+
+
+class PreprocessCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def key(self, sources, settings=None):
+        """
+        :param sources: paths whose content the preprocessed data depends on (CoNLL files and embedding).
+        :param settings: JSON-serializable reading options the preprocessed data also depends on.
+        """
+        digests_file = os.path.join(self.cache_dir, DIGESTS_FILE)
+        digests = {}
+        if os.path.exists(digests_file):
+            with open(digests_file) as f:
+                digests = json.load(f)
+        known = json.dumps(digests, sort_keys=True)
+        key = fingerprint(sources, settings, digests)
+        if json.dumps(digests, sort_keys=True) != known:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            tmp_file = digests_file + '.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump(digests, f)
+            os.replace(tmp_file, digests_file)
+        return key
+
+    def load(self, key):
+        """
+        :return: (train, dev, test, alphabet_pos, alphabet_tag, max_length), or None on a cache miss.
+        """
+        directory = self.entry_dir(key)
+        if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+            return None
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        corpora = []
+        for split in SPLITS:
+            arrays = [np.load(os.path.join(directory, '%s_%s.npy' % (split, name)), mmap_mode='r') for name in ARRAYS]
+            corpora.append(Corpus(*arrays))
+        alphabet_pos = Alphabet('pos', keep_growing=False)
+        alphabet_pos.load_binary(directory)
+        alphabet_tag = Alphabet('tag', keep_growing=False)
+        alphabet_tag.load_binary(directory)
+        return corpora[0], corpora[1], corpora[2], alphabet_pos, alphabet_tag, manifest['max_length']
+
+    def save(self, key, sources, train, dev, test, alphabet_pos, alphabet_tag, max_length):
+        """Write an entry atomically, then drop the older entries built from the same source paths."""
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        sources = [os.path.abspath(path) if path is not None else None for path in sources]
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+        for split, corpus in zip(SPLITS, (train, dev, test)):
+            for name in ARRAYS:
+                np.save(os.path.join(tmp_dir, '%s_%s.npy' % (split, name)), getattr(corpus, name))
+        alphabet_pos.save_binary(tmp_dir)
+        alphabet_tag.save_binary(tmp_dir)
+        manifest = {'key': key, 'sources': sources, 'max_length': int(max_length),
+                    'normalization': normalization_settings()}
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f)
+        if os.path.exists(self.entry_dir(key)):
+            shutil.rmtree(tmp_dir)
+        else:
+            os.rename(tmp_dir, self.entry_dir(key))
+        self.invalidate(sources, keep=key)
+
+    def invalidate(self, sources, keep=None):
+        """Delete the entries built from the given source paths, except keep."""
+        for name in os.listdir(self.cache_dir):
+            manifest_file = os.path.join(self.cache_dir, name, MANIFEST_FILE)
+            if name == keep or not os.path.exists(manifest_file):
+                continue
+            with open(manifest_file) as f:
+                if json.load(f)['sources'] == sources:
+                    shutil.rmtree(os.path.join(self.cache_dir, name))
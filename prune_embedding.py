@@ -0,0 +1,102 @@
+"""
+Prune the pretrained embedding to the words of our corpora. The CoNLL files (and optionally a frequency list, e.g.
+from production logs) are counted after the normalization of featurizer.map_number_and_punct, and the words found in
+the embedding are written as an embedding store (see embedding_store.py) whose rows are ranked by frequency, so the
+hot words share the first pages of vectors.npy. A fixed out-of-vocabulary vector is stored alongside, instead of
+the one Featurizer draws at random in every process.
+
+Words keep their vectors, so a model fed with vectors (the default input_format) and its alphabets work unchanged
+on the pruned store. Rows are renumbered, so a model trained with --input_format id must be trained on the store it
+runs with.
+
+Usage:
+    python prune_embedding.py --word_dir embedding/store --conll data/train.txt data/dev.txt data/test.txt \
+        --freq_file logs/word_counts.tsv --output_dir embedding/store_pruned
+    NER_EMBEDDING=embedding/store_pruned python server.py
+"""
+import argparse
+import os
+from collections import Counter
+import numpy as np
+from conll_reader import read_conll_columns
+from embedding_store import write_unknown, write_vectors, write_vocab
+from featurizer import Featurizer, map_number_and_punct
+
+
+def count_conll(paths, num_workers=None):
+    """Counts of the normalized words of CoNLL files."""
+    counts = Counter()
+    for path in paths:
+        columns = read_conll_columns(path, (0,), num_workers=num_workers)
+        frequencies = np.bincount(columns.ids[0], minlength=len(columns.vocabs[0]))
+        for word, frequency in zip(columns.vocabs[0], frequencies.tolist()):
+            counts[word] += frequency
+    return counts
+
+
+def count_frequency_file(path):
+    """Counts of a frequency list: one word per line, optionally followed by a tab and its count (1 otherwise)."""
+    counts = Counter()
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if not fields[0].strip():
+                continue
+            counts[map_number_and_punct(fields[0].strip().lower())] += int(fields[1]) if len(fields) > 1 else 1
+    return counts
+
+
+def hot_vocabulary(counts, word2row, min_count=1):
+    """
+    Words of counts found in the embedding, most frequent first (ties in word order), and their embedding rows.
+    Words are looked up lowercased, as Featurizer.word_ids does.
+    """
+    found = {}
+    for word, count in counts.items():
+        if count < min_count:
+            continue
+        word = word.lower()
+        row = word2row.get(word, -1)
+        if row >= 0:
+            found[word] = found.get(word, 0) + count
+    words = sorted(found, key=lambda word: (-found[word], word))
+    return words, np.array([word2row.get(word) for word in words], dtype=np.int64)
+
+
+def write_store(words, rows, embedd_vectors, output_dir, seed=0):
+    """Write an embedding store of the given words, word i taking row rows[i] of embedd_vectors as its row i."""
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    write_vocab(words, output_dir)
+    # Read the rows in file order, which is sequential on the memory-mapped matrix, then rank them.
+    order = np.argsort(rows, kind='stable')
+    vectors = np.empty((len(rows), np.shape(embedd_vectors)[1]), dtype=np.float32)
+    vectors[order] = embedd_vectors[rows[order]]
+    write_vectors(vectors, output_dir)
+    write_unknown(vectors.shape[1], output_dir, seed)
+
+
+def prune(word_dir, vector_dir, conll_files, output_dir, freq_file=None, min_count=1, seed=0, num_workers=None):
+    from utils import load_embedding
+    embedd_words, embedd_vectors = load_embedding(word_dir, vector_dir)
+    counts = count_conll(conll_files, num_workers)
+    if freq_file is not None:
+        counts.update(count_frequency_file(freq_file))
+    words, rows = hot_vocabulary(counts, Featurizer(embedd_words, embedd_vectors).word2row, min_count)
+    write_store(words, rows, embedd_vectors, output_dir, seed)
+    print('Kept %d of %d embedding rows (%d distinct corpus words, %d not in the embedding)' %
+          (len(words), len(embedd_vectors), len(counts), len(counts) - len(words)))
+    return words
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--word_dir", help="word surface dict directory, or an embedding store directory")
+    parser.add_argument("--vector_dir", help="word vector dict directory, ignored for a store")
+    parser.add_argument("--conll", nargs="+", required=True, help="CoNLL files whose words are kept")
+    parser.add_argument("--freq_file", default=None, help="extra words to keep, one per line with a tab and a count")
+    parser.add_argument("--min_count", default=1, type=int, help="rarest word kept")
+    parser.add_argument("--seed", default=0, type=int, help="seed of the out-of-vocabulary vector")
+    parser.add_argument("--output_dir", help="pruned embedding store directory to create")
+    args = parser.parse_args()
+    prune(args.word_dir, args.vector_dir, args.conll, args.output_dir, args.freq_file, args.min_count, args.seed)
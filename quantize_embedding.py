@@ -0,0 +1,97 @@
+"""
+Quantize an embedding store to int8 codes with a float32 scale per row (see embedding_store.py), cutting the mapped
+embedding to about a quarter of its size. Rows are dequantized only when a batch looks them up.
+
+--check tags a CoNLL file with the model (on the NumPy backend) fed by the float and by the quantized store, and
+reports the F1 scores, the share of identical tags, the row reconstruction error and the sizes of both matrices.
+
+Usage:
+    python quantize_embedding.py --store_dir embedding/store --output_dir embedding/store_int8
+    python quantize_embedding.py --store_dir embedding/store --output_dir embedding/store_int8 \
+        --check data/test_sample.txt --tag_column 3
+    NER_EMBEDDING=embedding/store_int8 python server.py
+"""
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+from embedding_store import EmbeddingStore, OFFSETS_FILE, ROWS_FILE, UNKNOWN_FILE, VOCAB_FILE, write_quantized
+
+
+def quantize(store_dir, output_dir):
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    for name in (VOCAB_FILE, OFFSETS_FILE, ROWS_FILE, UNKNOWN_FILE):
+        if os.path.exists(os.path.join(store_dir, name)):
+            shutil.copyfile(os.path.join(store_dir, name), os.path.join(output_dir, name))
+    write_quantized(EmbeddingStore(store_dir).vectors, output_dir)
+
+
+def reconstruction_error(vectors, quantized, chunk_rows=65536):
+    """Mean over the rows of the norm of the quantization error relative to the norm of the row."""
+    total = 0.
+    for start in range(0, len(vectors), chunk_rows):
+        rows = np.asarray(vectors[start:start + chunk_rows], dtype=np.float32)
+        norms = np.linalg.norm(rows, axis=1)
+        errors = np.linalg.norm(rows - quantized[start:start + chunk_rows], axis=1)
+        total += float(np.sum(errors[norms > 0] / norms[norms > 0]))
+    return total / max(1, len(vectors))
+
+
+def check(conll_file, store_dir, quantized_dir, model_dir='model', tag_column=-1, batch_size=50):
+    from alphabet import Alphabet
+    from conll_reader import read_conll_columns
+    from decoder import ViterbiDecoder
+    from eval import score_by_entity
+    from featurizer import Featurizer
+    from numpy_model import NumpyModel
+    from prediction import predict_corpus
+
+    columns = read_conll_columns(conll_file, (0, 1, tag_column), num_workers=0)
+    alphabet_pos = Alphabet('pos', keep_growing=False)
+    alphabet_pos.load(model_dir)
+    alphabet_tag = Alphabet('tag', keep_growing=False)
+    alphabet_tag.load(model_dir)
+    model = NumpyModel(model_dir)
+    decoder = ViterbiDecoder(alphabet_tag)
+    gold = columns.sentences(2)
+    pos_flat, _ = alphabet_pos.encode(columns.sentences(1))
+    store = EmbeddingStore(store_dir)
+    quantized_store = EmbeddingStore(quantized_dir)
+    # Both runs share one out-of-vocabulary vector, so that only the quantization differs.
+    unknown_embedd = store.unknown_embedd
+    if unknown_embedd is None:
+        unknown_embedd = np.random.RandomState(0).uniform(-0.01, 0.01, store.dim)
+    report = {}
+    tags = {}
+    for name, embedding in (('float32', store), ('int8', quantized_store)):
+        featurizer = Featurizer(embedding.vocab, embedding.vectors, unknown_embedd)
+        corpus = featurizer.corpus(columns.sentences(0), pos_flat)
+        predicts = predict_corpus(model.predict_on_batch, corpus, featurizer, alphabet_pos.size(), batch_size,
+                                  decode=decoder)
+        tags[name] = [alphabet_tag.decode(tag_ids) for tag_ids in predicts]
+        report[name] = {'F1': score_by_entity(tags[name], gold)['OVERALL']['F1'],
+                        'vector_bytes': int(embedding.vectors.nbytes)}
+    report['F1_delta'] = report['int8']['F1'] - report['float32']['F1']
+    num_tokens = sum(len(sentence) for sentence in gold)
+    report['same_tags'] = sum(a == b for sentence_a, sentence_b in zip(tags['float32'], tags['int8'])
+                              for a, b in zip(sentence_a, sentence_b)) / float(max(1, num_tokens))
+    report['relative_row_error'] = reconstruction_error(store.vectors, quantized_store.vectors)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store_dir", default="embedding/store", help="float32 embedding store to quantize")
+    parser.add_argument("--output_dir", default="embedding/store_int8", help="quantized store directory to create")
+    parser.add_argument("--check", default=None, metavar="CONLL_FILE",
+                        help="compare the model fed with both stores on this CoNLL file instead of quantizing")
+    parser.add_argument("--tag_column", default=-1, type=int, help="column of the NER tag in the CoNLL file")
+    parser.add_argument("--model_dir", default="model")
+    args = parser.parse_args()
+    if args.check:
+        print(json.dumps(check(args.check, args.store_dir, args.output_dir, args.model_dir, args.tag_column),
+                         indent=2))
+    else:
+        quantize(args.store_dir, args.output_dir)
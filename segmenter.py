@@ -0,0 +1,58 @@
+"""
+Word segmentation and POS tagging of raw text with underthesea, optionally spread over a process pool. This module
+stays free of TensorFlow so that pool workers start quickly.
+"""
+import functools
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from underthesea import pos_tag
+from featurizer import map_number_and_punct
+from instrumentation import stage
+
+_pool = None
+_pool_size = None
+
+
+def normalize(word):
+    return map_number_and_punct(word.lower())
+
+
+def segment(text, surface=False):
+    """
+    POS-tag a text and normalize its words. Returns (words, POS tags) of the text as one sentence.
+    :param surface: keep the words as they appear in the text (syllables joined by '_'), without normalization.
+    """
+    with stage('pos_tag'):
+        tagged = pos_tag(text)
+    with stage('normalize'):
+        word_list = []
+        pos_list = []
+        for word, pos in tagged:
+            word = re.sub(' ', '_', word)
+            word_list.append(word if surface else normalize(word))
+            pos_list.append(pos)
+    return word_list, pos_list
+
+
+def get_pool(num_workers=None):
+    """Process pool shared across calls. Workers are spawned, not forked, as the parent may hold TensorFlow state."""
+    global _pool, _pool_size
+    if _pool is None or _pool_size != num_workers:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context('spawn'))
+        _pool_size = num_workers
+    return _pool
+
+
+def segment_all(texts, num_workers=None, chunksize=8, surface=False):
+    """
+    Segment many texts, in order.
+    :param num_workers: number of worker processes, all cores by default. 0 segments in the calling process.
+    :param surface: see segment.
+    :return: list of (words, POS tags), one per text.
+    """
+    if num_workers == 0 or len(texts) < 2:
+        return [segment(text, surface) for text in texts]
+    return list(get_pool(num_workers).map(functools.partial(segment, surface=surface), texts, chunksize=chunksize))
@@ -0,0 +1,247 @@
+"""
+Asyncio HTTP server around the NER model. Incoming texts are queued and coalesced into micro-batches, flushed when
+max_batch_size texts are waiting or max_wait_ms after the first one arrived. Each batch is tagged by
+infer.infer_batch on a worker thread, so the event loop keeps accepting requests meanwhile. When the queue is full,
+requests are refused with 503 instead of piling up, and requests with more texts than the queue holds with 413.
+
+Endpoints:
+    POST /ner       {"text": "..."} -> {"result": [...]}, or {"texts": [...]} -> {"results": [[...], ...]}
+    GET  /health    {"status": "ok", "queue_size": ..., "max_queue_size": ..., "caches": {...}}, 503 once the batching
+                    task has stopped
+    GET  /metrics   per-stage timings in the Prometheus text format, collected with --metrics prometheus
+
+Usage:
+    python server.py --port 8000 --max_batch_size 32 --max_wait_ms 5
+"""
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import instrumentation
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+
+class Overloaded(Exception):
+    pass
+
+
+class MicroBatcher:
+    def __init__(self, predict_batch, max_batch_size=32, max_wait_ms=5., max_queue_size=1024):
+        """
+        :param predict_batch: maps a list of texts to a list of results, e.g. infer.infer_batch. Runs on a worker
+        thread, one batch at a time.
+        :param max_batch_size: largest number of texts predicted together.
+        :param max_wait_ms: longest time the first text of a batch waits for others to join it.
+        :param max_queue_size: number of waiting texts beyond which submit raises Overloaded.
+        """
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def submit(self, text):
+        return (await self.submit_all([text]))[0]
+
+    async def submit_all(self, texts):
+        """
+        Queue texts together and wait for their results. Either all the texts are queued or, when they do not fit in
+        the queue, none is and Overloaded is raised, so that a refused request costs no prediction.
+        """
+        if self.queue.maxsize > 0 and self.queue.qsize() + len(texts) > self.queue.maxsize:
+            raise Overloaded()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self.queue.put_nowait((text, future))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    async def next_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.next_batch()
+            texts = [text for text, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.predict_batch, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class NerServer:
+    def __init__(self, batcher, cache_stats=None, batch_task=None):
+        """
+        :param cache_stats: optional callable returning the stats of the inference caches, e.g. infer.cache_stats.
+        :param batch_task: optional task running batcher.run, reported unhealthy by /health once done.
+        """
+        self.batcher = batcher
+        self.cache_stats = cache_stats
+        self.batch_task = batch_task
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.respond(writer, 400, {'error': 'malformed request line'}, keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0) or 0)
+                if length > MAX_BODY_SIZE:
+                    await self.respond(writer, 413, {'error': 'request body too large'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                status, payload = await self.dispatch(method, path, body)
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, body):
+        if path == '/health':
+            if method != 'GET':
+                return 405, {'error': 'use GET'}
+            if self.batch_task is not None and self.batch_task.done():
+                return 503, {'status': 'error', 'error': 'the batching task has stopped'}
+            health = {'status': 'ok', 'queue_size': self.batcher.queue.qsize(),
+                      'max_queue_size': self.batcher.queue.maxsize}
+            if self.cache_stats is not None:
+                health['caches'] = self.cache_stats()
+            return 200, health
+        if path == '/metrics':
+            if method != 'GET':
+                return 405, {'error': 'use GET'}
+            instrumentation.set_gauge('queue_size', self.batcher.queue.qsize())
+            if self.cache_stats is not None:
+                for name, stats in self.cache_stats().items():
+                    for key in ('size', 'hits', 'misses'):
+                        instrumentation.set_gauge('%s_cache_%s' % (name, key), stats[key])
+            return 200, instrumentation.registry.prometheus_text()
+        if path != '/ner':
+            return 404, {'error': 'unknown path %s' % path}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+        try:
+            request = json.loads(body.decode('utf-8'))
+            texts = request['texts'] if 'texts' in request else [request['text']]
+            if not all(isinstance(text, str) for text in texts):
+                raise ValueError()
+        except (ValueError, KeyError, TypeError):
+            return 400, {'error': 'expected {"text": str} or {"texts": [str, ...]}'}
+        if 0 < self.batcher.queue.maxsize < len(texts):
+            # Such a request never fits in the queue: retrying it cannot help.
+            return 413, {'error': 'a request takes at most %d texts' % self.batcher.queue.maxsize}
+        try:
+            results = await self.batcher.submit_all(texts)
+        except Overloaded:
+            return 503, {'error': 'server overloaded, retry later'}
+        except Exception as e:
+            return 500, {'error': str(e)}
+        if 'texts' in request:
+            return 200, {'results': results}
+        return 200, {'result': results[0]}
+
+    async def respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body = payload.encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        headers = ['HTTP/1.1 %d %s' % (status, REASONS[status]),
+                   'Content-Type: %s' % content_type,
+                   'Content-Length: %d' % len(body),
+                   'Connection: %s' % ('keep-alive' if keep_alive else 'close')]
+        if status == 503:
+            headers.append('Retry-After: 1')
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve(predict_batch, host, port, max_batch_size, max_wait_ms, max_queue_size, cache_stats=None):
+    batcher = MicroBatcher(predict_batch, max_batch_size, max_wait_ms, max_queue_size)
+    batch_task = asyncio.ensure_future(batcher.run())
+    server = await asyncio.start_server(NerServer(batcher, cache_stats, batch_task).handle, host, port)
+    print('Serving on http://%s:%d' % (host, port))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", default=8000, type=int, help="port to listen on")
+    parser.add_argument("--max_batch_size", default=32, type=int, help="largest number of texts predicted together")
+    parser.add_argument("--max_wait_ms", default=5., type=float,
+                        help="longest time a text waits for others to fill its batch")
+    parser.add_argument("--max_queue_size", default=1024, type=int,
+                        help="number of waiting texts beyond which requests are refused with 503")
+    parser.add_argument("--segment_workers", default=None, type=int,
+                        help="POS tagging processes, all cores by default, 0 to tag on the worker thread")
+    parser.add_argument("--backend", default="keras", choices=["keras", "tflite", "numpy"],
+                        help="inference runtime, tflite needs a model exported by export_model.py, numpy runs the "
+                             "saved weights without TensorFlow")
+    parser.add_argument("--metrics", default="off", choices=["off", "log", "prometheus"],
+                        help="time every stage of the requests, logged or served on GET /metrics")
+    parser.add_argument("--segment_cache_size", default=10000, type=int,
+                        help="texts whose POS tagging is cached, 0 to disable the cache")
+    parser.add_argument("--token_cache_size", default=100000, type=int,
+                        help="words whose embedding row is cached, 0 to disable the cache")
+    parser.add_argument("--prediction_cache_size", default=10000, type=int,
+                        help="sentences whose predicted tags are cached, 0 to disable the cache")
+    args = parser.parse_args()
+    instrumentation.configure(args.metrics)
+    os.environ['NER_BACKEND'] = args.backend
+    import infer
+    infer.configure_caches(args.segment_cache_size, args.token_cache_size, args.prediction_cache_size)
+
+    def predict_batch(texts):
+        return infer.infer_batch(texts, num_workers=args.segment_workers)
+
+    asyncio.run(serve(predict_batch, args.host, args.port, args.max_batch_size, args.max_wait_ms,
+                      args.max_queue_size, infer.cache_stats))
@@ -0,0 +1,266 @@
+"""
+Hyperparameter sweep of the NER model. The corpora are read and mapped to ids once, the flat train and dev id arrays
+are put in shared memory, and the trials run concurrently in a process pool, each worker limited to a few threads.
+Workers open the embedding memory-mapped and featurize one batch at a time (dataset.NerSequence), so no worker holds
+a dense copy of the data.
+Trials whose dev loss is worse than the median of the other trials at the same epoch are stopped early.
+
+The search space is a JSON file:
+    {"method": "grid",
+     "params": {"num_lstm_layer": [1, 2], "num_hidden_node": [64, 128], "dropout": [0.3, 0.5], "batch_size": [50]}}
+With "method": "random", "num_trials" settings are drawn, a list being sampled uniformly and a
+{"low": ..., "high": ...} range uniformly (as integers when both bounds are integers).
+
+Usage:
+    python sweep.py --spec sweep.json --word_dir embedding/words.pl --vector_dir embedding/vectors.npy \
+        --train_dir data/train.txt --dev_dir data/dev.txt --test_dir data/test.txt --num_parallel 4
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+
+PARAMS = ('num_lstm_layer', 'num_hidden_node', 'dropout', 'batch_size')
+DEFAULTS = {'num_lstm_layer': 2, 'num_hidden_node': 64, 'dropout': 0.5, 'batch_size': 50}
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS',
+                    'TF_NUM_INTEROP_THREADS')
+
+
+def expand_spec(spec, seed=0):
+    """
+    Trial settings of a search space, every setting holding all of PARAMS (missing ones taking DEFAULTS).
+    :param spec: dict with method ('grid' or 'random'), params and, for a random search, num_trials.
+    """
+    params = spec['params']
+    unknown = set(params) - set(PARAMS)
+    if unknown:
+        raise ValueError('Unknown parameters %s, expected some of %s' % (sorted(unknown), list(PARAMS)))
+    method = spec.get('method', 'grid')
+    if method == 'grid':
+        names = sorted(params)
+        for values in params.values():
+            if not isinstance(values, list):
+                raise ValueError('A grid search takes a list of values per parameter')
+        trials = [dict(zip(names, values)) for values in itertools.product(*[params[name] for name in names])]
+    elif method == 'random':
+        rng = random.Random(seed)
+        trials = [{name: sample(values, rng) for name, values in sorted(params.items())}
+                  for _ in range(spec['num_trials'])]
+    else:
+        raise ValueError('Unknown search method %r' % method)
+    return [dict(DEFAULTS, **trial) for trial in trials]
+
+
+def sample(values, rng):
+    if isinstance(values, list):
+        return rng.choice(values)
+    low, high = values['low'], values['high']
+    if isinstance(low, int) and isinstance(high, int):
+        return rng.randint(low, high)
+    return rng.uniform(low, high)
+
+
+def share_array(array):
+    """Copy an array to a new shared memory block. :return: (block, descriptor for attach_array)."""
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def attach_array(descriptor):
+    """Read-only view of an array shared by share_array. :return: (block, array); keep block open while in use."""
+    name, shape, dtype = descriptor
+    block = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    array.flags.writeable = False
+    return block, array
+
+
+def should_prune(losses, epoch, loss, warmup=2, min_trials=3):
+    """
+    Median stopping rule: stop a trial whose dev loss at epoch is above the median of the other trials at that epoch.
+    :param losses: dev losses per epoch of the other trials.
+    :param warmup: epochs every trial runs before it can be stopped.
+    :param min_trials: other trials that must have reached epoch for the median to count.
+    """
+    if epoch < warmup:
+        return False
+    others = [trial_losses[epoch] for trial_losses in losses if len(trial_losses) > epoch]
+    return len(others) >= min_trials and loss > np.median(others)
+
+
+def format_table(results):
+    """Results sorted by dev F1 as a text table."""
+    header = ('trial',) + PARAMS + ('dev_f1', 'val_loss', 'epochs', 'status', 'seconds')
+    rows = []
+    for result in sorted(results, key=lambda result: -result['dev_f1']):
+        rows.append([str(result['trial'])] + [str(result['params'][name]) for name in PARAMS] +
+                    ['%.4f' % result['dev_f1'], '%.4f' % result['val_loss'], str(result['epochs']),
+                     result['status'], '%.1f' % result['seconds']])
+    widths = [max(len(cell) for cell in column) for column in zip(header, *rows)]
+    lines = ['  '.join(cell.ljust(width) for cell, width in zip(row, widths)) for row in [header] + rows]
+    return '\n'.join(lines)
+
+
+# State of a worker process, set by init_worker.
+worker = {}
+CORPUS_ARRAYS = ('word_ids', 'pos_ids', 'tag_ids', 'offsets')
+
+
+def shared_corpus(arrays, split):
+    """featurizer.Corpus over the arrays of a split attached from shared memory."""
+    from featurizer import Corpus
+    return Corpus(*[arrays['%s_%s' % (split, name)] for name in CORPUS_ARRAYS])
+
+
+def init_worker(descriptors, meta, losses, num_threads, patience, max_epochs, warmup, min_trials, word_dir,
+                vector_dir):
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(num_threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    from embedding_store import EmbeddingStore, is_store
+    from featurizer import Featurizer
+    blocks, arrays = {}, {}
+    for name, descriptor in descriptors.items():
+        blocks[name], arrays[name] = attach_array(descriptor)
+    # Words are already ids: only the memory-mapped vectors are needed, their pages shared by all the workers.
+    vectors = EmbeddingStore(word_dir).vectors if is_store(word_dir) else np.load(vector_dir, mmap_mode='r')
+    worker.update(blocks=blocks, meta=meta, losses=losses, patience=patience, max_epochs=max_epochs, warmup=warmup,
+                  min_trials=min_trials, train=shared_corpus(arrays, 'train'), dev=shared_corpus(arrays, 'dev'),
+                  featurizer=Featurizer([], vectors, meta['unknown_embedd']))
+
+
+def run_trial(trial, params):
+    """Train one setting on the shared data and score it on the dev set."""
+    import network
+    from dataset import NerSequence
+    from decoder import ViterbiDecoder
+    from eval import score_by_entity
+    from keras.callbacks import Callback, EarlyStopping
+    from prediction import predict_corpus
+
+    losses = worker['losses']
+
+    class MedianPruning(Callback):
+        def __init__(self):
+            super(MedianPruning, self).__init__()
+            self.pruned = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            loss = logs['val_loss']
+            losses[trial] = list(losses.get(trial, [])) + [loss]
+            others = [trial_losses for other, trial_losses in losses.items() if other != trial]
+            if should_prune(others, epoch, loss, worker['warmup'], worker['min_trials']):
+                self.pruned = True
+                self.model.stop_training = True
+
+    start = time.perf_counter()
+    meta, train, dev, featurizer = worker['meta'], worker['train'], worker['dev'], worker['featurizer']
+    batch_size = int(params['batch_size'])
+    model = network.building_ner(int(params['num_lstm_layer']), int(params['num_hidden_node']),
+                                 float(params['dropout']), meta['max_length'], featurizer.embedd_dim + meta['dim_pos'],
+                                 meta['num_tags'])
+    train_data = NerSequence(train, featurizer, meta['dim_pos'], meta['num_tags'], batch_size, meta['max_length'],
+                             shuffle=True)
+    dev_data = NerSequence(dev, featurizer, meta['dim_pos'], meta['num_tags'], batch_size, meta['max_length'])
+    pruning = MedianPruning()
+    history = model.fit(train_data, epochs=worker['max_epochs'], validation_data=dev_data,
+                        callbacks=[EarlyStopping(patience=worker['patience']), pruning], verbose=0)
+    alphabet_tag = meta['alphabet_tag']
+    answer = predict_corpus(model.predict_on_batch, dev, featurizer, meta['dim_pos'], batch_size, meta['max_length'],
+                            decode=ViterbiDecoder(alphabet_tag))
+    gold_tags = [alphabet_tag.decode(tag_ids) for tag_ids in dev.split(dev.tag_ids)]
+    pred_tags = [alphabet_tag.decode(tag_ids) for tag_ids in answer]
+    scores = score_by_entity(pred_tags, gold_tags, verbose=False)
+    return {'trial': trial, 'params': params, 'dev_f1': scores['OVERALL']['F1'],
+            'val_loss': min(history.history['val_loss']), 'epochs': len(history.history['val_loss']),
+            'status': 'pruned' if pruning.pruned else 'done', 'seconds': time.perf_counter() - start}
+
+
+def sweep(trials, word_dir, vector_dir, train_dir, dev_dir, test_dir, num_parallel=None, threads_per_trial=None,
+          patience=3, max_epochs=1000, warmup=2, min_trials=3, cache_dir=None, tag_column=2):
+    """
+    Run the trials of expand_spec on data preprocessed once.
+    :param num_parallel: concurrent trials, by default as many as fit one thread each on the machine.
+    :param threads_per_trial: threads of every trial, by default the cores divided among the concurrent trials.
+    :return: one result dict per trial, in order of completion.
+    """
+    import utils
+    num_cores = os.cpu_count() or 1
+    num_parallel = max(1, min(num_parallel or num_cores, len(trials)))
+    threads_per_trial = threads_per_trial or max(1, num_cores // num_parallel)
+    print('Loading data...')
+    train, dev, test, featurizer, alphabet_pos, alphabet_tag, max_length = \
+        utils.create_id_data(word_dir, vector_dir, train_dir, dev_dir, test_dir, cache_dir=cache_dir,
+                             tag_column=tag_column)
+    blocks, descriptors = [], {}
+    try:
+        for split, corpus in (('train', train), ('dev', dev)):
+            for name in CORPUS_ARRAYS:
+                block, descriptors['%s_%s' % (split, name)] = share_array(getattr(corpus, name))
+                blocks.append(block)
+        del train, dev, test
+        meta = {'max_length': max_length, 'dim_pos': alphabet_pos.size(), 'num_tags': alphabet_tag.size(),
+                'alphabet_tag': alphabet_tag, 'unknown_embedd': featurizer.unknown_embedd}
+        print('Running %d trials, %d at a time with %d threads each...' %
+              (len(trials), num_parallel, threads_per_trial))
+        context = multiprocessing.get_context('spawn')
+        with context.Manager() as manager:
+            losses = manager.dict()
+            with ProcessPoolExecutor(max_workers=num_parallel, mp_context=context, initializer=init_worker,
+                                     initargs=(descriptors, meta, losses, threads_per_trial, patience,
+                                               max_epochs, warmup, min_trials, word_dir, vector_dir)) as pool:
+                futures = [pool.submit(run_trial, trial, params) for trial, params in enumerate(trials)]
+                results = []
+                for future in as_completed(futures):
+                    result = future.result()
+                    print('Trial %d %s: dev F1 %.4f after %d epochs' %
+                          (result['trial'], result['status'], result['dev_f1'], result['epochs']))
+                    results.append(result)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--spec", required=True, help="JSON search space, see the module docstring")
+    parser.add_argument("--word_dir", help="word surface dict directory, or an embedding store directory")
+    parser.add_argument("--vector_dir", help="word vector dict directory")
+    parser.add_argument("--train_dir", help="training directory")
+    parser.add_argument("--dev_dir", help="development directory")
+    parser.add_argument("--test_dir", help="testing directory")
+    parser.add_argument("--cache_dir", help="preprocessing cache directory, reused across runs on the same data")
+    parser.add_argument("--tag_column", default=2, type=int, help="column of the NER tag in the data files")
+    parser.add_argument("--num_parallel", default=None, type=int, help="concurrent trials, all cores by default")
+    parser.add_argument("--threads_per_trial", default=None, type=int,
+                        help="threads of every trial, the cores divided among the concurrent trials by default")
+    parser.add_argument("--patience", default=3, type=int, help="patience of the early stopping of every trial")
+    parser.add_argument("--max_epochs", default=1000, type=int)
+    parser.add_argument("--prune_warmup", default=2, type=int, help="epochs every trial runs before it can be pruned")
+    parser.add_argument("--prune_min_trials", default=3, type=int,
+                        help="other trials needed at an epoch before a trial can be pruned there")
+    parser.add_argument("--seed", default=0, type=int, help="seed of a random search")
+    parser.add_argument("--output", default=None, help="JSON file receiving the results")
+    args = parser.parse_args()
+
+    with open(args.spec) as f:
+        trials = expand_spec(json.load(f), args.seed)
+    results = sweep(trials, args.word_dir, args.vector_dir, args.train_dir, args.dev_dir, args.test_dir,
+                    args.num_parallel, args.threads_per_trial, args.patience, args.max_epochs, args.prune_warmup,
+                    args.prune_min_trials, args.cache_dir, args.tag_column)
+    print(format_table(results))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,205 @@
+"""
+Tag large CoNLL or raw-text files with bounded memory. The input is read and predicted chunk_size sentences at a
+time and the tags are appended to the output as soon as a chunk is done, followed by a checkpoint recording the
+input byte offset reached and the output size. Running the same command again after an interruption truncates the
+output to the checkpointed size and resumes from that offset.
+
+With --num_workers N the input is split into N byte ranges tagged by separate processes, each writing its own part
+file, and the parts are concatenated in order at the end. A sentence belongs to the range containing its first
+byte, so ranges may cut the file anywhere.
+
+Input formats:
+    conll   one token per line (word, POS, ...), sentences separated by blank lines
+    raw     one text per line, POS-tagged with underthesea
+
+Usage:
+    python tag_corpus.py --input crawl.txt --input_format raw --output crawl.conll --num_workers 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+
+CHECKPOINT_SUFFIX = '.ckpt'
+LOOKBACK = 4096
+
+
+def at_sentence_start(f, position):
+    """Whether the line starting at position follows a blank line (or starts the file)."""
+    if position == 0:
+        return True
+    begin = max(0, position - LOOKBACK)
+    f.seek(begin)
+    previous = f.read(position - begin)[:-1].rsplit(b'\n', 1)
+    if len(previous) == 1 and begin > 0:
+        # No line start within the look-back window: a long, hence non-blank, line.
+        return False
+    return previous[-1].strip() == b''
+
+
+def align(f, start):
+    """Byte offset of the first line starting at or after start."""
+    if start == 0:
+        return 0
+    f.seek(start - 1)
+    f.readline()
+    return f.tell()
+
+
+def read_records(path, start, end, input_format):
+    """
+    Yield (start offset, end offset, record) for every record starting in [start, end): the text of a line for raw
+    input, the list of split token lines of a sentence for CoNLL input. The end offset is where the next record may
+    start.
+    """
+    with open(path, 'rb') as f:
+        position = align(f, start)
+        skipping = input_format == 'conll' and not at_sentence_start(f, position)
+        f.seek(position)
+        tokens = []
+        sentence_start = position
+        for line in iter(f.readline, b''):
+            line_start, position = position, position + len(line)
+            if input_format == 'raw':
+                if line_start >= end:
+                    return
+                yield line_start, position, line.decode('utf-8').rstrip('\r\n')
+            elif line.strip() == b'':
+                skipping = False
+                if tokens:
+                    yield sentence_start, position, tokens
+                    tokens = []
+            elif not skipping:
+                if not tokens:
+                    if line_start >= end:
+                        return
+                    sentence_start = line_start
+                tokens.append(line.decode('utf-8').split())
+        if tokens:
+            yield sentence_start, position, tokens
+
+
+def chunks(records, chunk_size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def load_checkpoint(checkpoint_file, input_file, start, end):
+    if not os.path.exists(checkpoint_file):
+        return None
+    with open(checkpoint_file) as f:
+        checkpoint = json.load(f)
+    if (checkpoint['input'], checkpoint['start'], checkpoint['end']) != (os.path.abspath(input_file), start, end):
+        raise ValueError('%s belongs to another run, delete it to start over' % checkpoint_file)
+    return checkpoint
+
+
+def save_checkpoint(checkpoint_file, input_file, start, end, offset, output_size):
+    tmp_file = checkpoint_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump({'input': os.path.abspath(input_file), 'start': start, 'end': end, 'offset': offset,
+                   'output_size': output_size}, f)
+    os.replace(tmp_file, checkpoint_file)
+
+
+def remove_checkpoint(output_file):
+    if os.path.exists(output_file + CHECKPOINT_SUFFIX):
+        os.remove(output_file + CHECKPOINT_SUFFIX)
+
+
+def format_records(records, words, tags, input_format, output_format):
+    lines = []
+    for (offset, _, record), sentence_words, sentence_tags in zip(records, words, tags):
+        if output_format == 'jsonl':
+            item = {'offset': offset, 'tokens': sentence_words, 'tags': sentence_tags}
+            if input_format == 'raw':
+                item['text'] = record
+            lines.append(json.dumps(item, ensure_ascii=False) + '\n')
+        else:
+            for word, tag in zip(sentence_words, sentence_tags):
+                lines.append(word + '\t' + tag + '\n')
+            lines.append('\n')
+    return ''.join(lines)
+
+
+def tag_range(input_file, output_file, start, end, input_format, output_format, chunk_size, pos_column=1):
+    """Tag the records starting in [start, end) of input_file into output_file, resuming from its checkpoint."""
+    import infer
+    from segmenter import segment_all, normalize
+    checkpoint_file = output_file + CHECKPOINT_SUFFIX
+    checkpoint = load_checkpoint(checkpoint_file, input_file, start, end)
+    offset, output_size = (checkpoint['offset'], checkpoint['output_size']) if checkpoint else (start, 0)
+    if offset >= end:
+        return
+    with open(output_file, 'ab') as out:
+        out.truncate(output_size)
+        for records in chunks(read_records(input_file, offset, end, input_format), chunk_size):
+            if input_format == 'raw':
+                segmented = segment_all([text for _, _, text in records], num_workers=0, surface=True)
+                words = [sentence_words for sentence_words, _ in segmented]
+                pos_list = [poss for _, poss in segmented]
+            else:
+                words = [[token[0] for token in tokens] for _, _, tokens in records]
+                pos_list = [[token[pos_column] for token in tokens] for _, _, tokens in records]
+            normalized = [[normalize(word) for word in sentence_words] for sentence_words in words]
+            corpus = infer.featurizer.corpus(normalized, infer.map_string_2_id(pos_list))
+            tags = [infer.decode_tags(tag_ids) for tag_ids in infer.predict(corpus)]
+            out.write(format_records(records, words, tags, input_format, output_format).encode('utf-8'))
+            out.flush()
+            os.fsync(out.fileno())
+            save_checkpoint(checkpoint_file, input_file, start, end, records[-1][1], out.tell())
+    save_checkpoint(checkpoint_file, input_file, start, end, end, os.path.getsize(output_file))
+
+
+def tag_file(input_file, output_file, input_format, output_format, chunk_size, num_workers=1, pos_column=1):
+    size = os.path.getsize(input_file)
+    if num_workers <= 1:
+        tag_range(input_file, output_file, 0, size, input_format, output_format, chunk_size, pos_column)
+        remove_checkpoint(output_file)
+        return
+    bounds = [size * i // num_workers for i in range(num_workers + 1)]
+    parts = ['%s.part%d' % (output_file, i) for i in range(num_workers)]
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=tag_range, args=(input_file, part, bounds[i], bounds[i + 1], input_format,
+                                                        output_format, chunk_size, pos_column))
+               for i, part in enumerate(parts)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    failed = [part for part, worker in zip(parts, workers) if worker.exitcode != 0]
+    if failed:
+        raise RuntimeError('workers writing %s failed, run again to resume them' % ', '.join(failed))
+    with open(output_file, 'wb') as out:
+        for part in parts:
+            if os.path.exists(part):
+                with open(part, 'rb') as f:
+                    shutil.copyfileobj(f, out)
+                os.remove(part)
+            remove_checkpoint(part)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="file to tag")
+    parser.add_argument("--output", help="tagged output file")
+    parser.add_argument("--input_format", default="conll", choices=["conll", "raw"])
+    parser.add_argument("--output_format", default="conll", choices=["conll", "jsonl"])
+    parser.add_argument("--pos_column", default=1, type=int, help="column of the POS tag in CoNLL input")
+    parser.add_argument("--chunk_size", default=1000, type=int, help="sentences read and predicted at a time")
+    parser.add_argument("--num_workers", default=1, type=int, help="processes tagging separate byte ranges")
+    parser.add_argument("--backend", default="keras", choices=["keras", "tflite", "numpy"],
+                        help="inference runtime, tflite needs a model exported by export_model.py, numpy runs the "
+                             "saved weights without TensorFlow")
+    args = parser.parse_args()
+    # Read by infer at import, in this process and in the spawned workers.
+    os.environ['NER_BACKEND'] = args.backend
+    tag_file(args.input, args.output, args.input_format, args.output_format, args.chunk_size, args.num_workers,
+             args.pos_column)
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pytest
+
+from alphabet import Alphabet
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', 'model')
+SENTENCES = [['N', 'V', 'N', 'CH'], [], ['Np', 'N', 'X'], ['V']]
+
+
+def test_encode_matches_get_index():
+    token_by_token = Alphabet('pos')
+    expected = [[token_by_token.get_index(pos) for pos in sentence] for sentence in SENTENCES]
+    bulk = Alphabet('pos')
+    flat, offsets = bulk.encode(SENTENCES)
+    assert [flat[offsets[i]:offsets[i + 1]].tolist() for i in range(len(SENTENCES))] == expected
+    assert bulk.instances == token_by_token.instances
+    bulk.close()
+    flat, _ = bulk.encode([['V', 'unseen']])
+    assert flat.tolist() == [bulk.get_index('V'), 0]
+    assert bulk.size() == token_by_token.size()
+
+
+def test_encode_takes_only_str():
+    alphabet = Alphabet('pos')
+    flat, _ = alphabet.encode([['N', 'N' * 200, 'N']])
+    assert flat.tolist() == [1, 2, 1]
+    with pytest.raises(TypeError):
+        alphabet.encode([['N', 1]])
+
+
+def test_decode_matches_get_instance():
+    alphabet = Alphabet('tag')
+    alphabet.encode([['O', 'B-LOC', 'I-LOC']])
+    ids = np.array([0, 1, 2, 3])
+    assert alphabet.decode(ids) == [alphabet.get_instance(i) for i in ids]
+    with pytest.warns(UserWarning):
+        assert alphabet.decode([7]) == ['O']
+    with pytest.raises(ValueError):
+        alphabet.decode([1, -1])
+
+
+@pytest.mark.parametrize('name', ['pos', 'tag'])
+def test_binary_round_trip_of_model_alphabets(tmpdir, name):
+    from_json = Alphabet(name, keep_growing=False)
+    from_json.load(MODEL_DIR)
+    from_json.save_binary(str(tmpdir))
+    from_binary = Alphabet(name, keep_growing=False)
+    from_binary.load_binary(str(tmpdir))
+    assert from_binary.instances == from_json.instances
+    assert from_binary.instance2index == from_json.instance2index
+    from_binary.save(str(tmpdir))
+    again = Alphabet(name)
+    again.load(str(tmpdir))
+    assert again.get_content() == from_json.get_content()
@@ -0,0 +1,27 @@
+import os
+
+from benchmark import compare, generate_corpus
+from tag_corpus import read_records
+
+
+def test_generate_corpus(tmpdir):
+    corpus_file = str(tmpdir.join('corpus.txt'))
+    vocab = generate_corpus(corpus_file, 300, mean_length=20, max_length=40, vocab_size=50)
+    sentences = [tokens for _, _, tokens in read_records(corpus_file, 0, os.path.getsize(corpus_file), 'conll')]
+    assert len(sentences) == 300
+    assert all(1 <= len(tokens) <= 40 for tokens in sentences)
+    assert set(token[0] for tokens in sentences for token in tokens) <= set(vocab)
+    for tokens in sentences:
+        tags = [token[2] for token in tokens]
+        assert all(tag.startswith('B-') or tag == 'O' or previous[2:] == tag[2:] != ''
+                   for previous, tag in zip(['O'] + tags, tags))
+
+
+def test_compare_flags_regressions_only():
+    baseline = {'read_conll_format': {'seconds': 1.0, 'tokens_per_second': 1000.},
+                'infer_string': {'p50_ms': 10., 'p99_ms': 20.}}
+    results = {'read_conll_format': {'seconds': 1.05, 'tokens_per_second': 800.},
+               'infer_string': {'p50_ms': 5., 'p99_ms': 30.},
+               'score_by_entity': {'seconds': 3.}}
+    assert compare(results, baseline, 0.1) == [('infer_string', 'p99_ms', 20., 30.),
+                                               ('read_conll_format', 'tokens_per_second', 1000., 800.)]
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from featurizer import Corpus
+
+
+def test_resumed_epoch_order_matches_uninterrupted_run(tmp_path):
+    pytest.importorskip('tensorflow')
+    keras = pytest.importorskip('keras')
+    from checkpoint import TrainingCheckpoint
+    from dataset import NerSequence
+    offsets = np.cumsum([0] + [1 + i % 7 for i in range(40)])
+    corpus = Corpus(np.zeros(offsets[-1], np.int32), np.zeros(offsets[-1], np.int32),
+                    np.zeros(offsets[-1], np.int32), offsets)
+    model = keras.Sequential([keras.layers.Dense(2, input_shape=(3,))])
+    model.compile('adam', 'mse')
+
+    def sequence():
+        return NerSequence(corpus, None, 1, 2, 4, 8, shuffle=True, bucket=True)
+
+    np.random.seed(1)
+    train_data = sequence()
+    TrainingCheckpoint(model, str(tmp_path)).save(1)
+    # Keras reshuffles the sequence after the callbacks saved the epoch.
+    train_data.on_epoch_end()
+    np.random.seed(2)
+    resumed = sequence()
+    assert TrainingCheckpoint(model, str(tmp_path)).restore([resumed]) == 1
+    assert [list(batch) for batch in resumed.batches] == [list(batch) for batch in train_data.batches]
@@ -0,0 +1,65 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from alphabet import Alphabet
+from conll_reader import read_conll_columns
+from featurizer import map_number_and_punct
+
+DATA_FILES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'data', '*_sample.txt')))
+
+
+def read_lines(path, columns):
+    sentences, sentence = [], []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.split()
+            if fields:
+                sentence.append([fields[column] for column in columns])
+            elif sentence:
+                sentences.append(sentence)
+                sentence = []
+    if sentence:
+        sentences.append(sentence)
+    return [[[token[k] for token in sentence] for sentence in sentences] for k in range(len(columns))]
+
+
+@pytest.mark.parametrize('path', DATA_FILES)
+def test_columns_match_a_line_reader(path):
+    columns = read_conll_columns(path, (0, 1, 3), normalize_columns=(), num_workers=0)
+    expected = read_lines(path, (0, 1, 3))
+    for k in range(3):
+        assert columns.sentences(k) == expected[k]
+    assert columns.max_length == max(len(sentence) for sentence in expected[0])
+
+
+@pytest.mark.parametrize('path', DATA_FILES)
+@pytest.mark.parametrize('num_shards', [2, 7, 50])
+def test_shards_give_the_same_columns(path, num_shards):
+    single = read_conll_columns(path, (0, 1, -1), num_workers=0, num_shards=1)
+    sharded = read_conll_columns(path, (0, 1, -1), num_workers=0, num_shards=num_shards)
+    assert sharded.vocabs == single.vocabs
+    assert np.array_equal(sharded.offsets, single.offsets)
+    for single_ids, sharded_ids in zip(single.ids, sharded.ids):
+        assert np.array_equal(sharded_ids, single_ids)
+
+
+def test_vocabulary_order_matches_alphabet_encode():
+    path = DATA_FILES[0]
+    columns = read_conll_columns(path, (1,), normalize_columns=(), num_workers=0)
+    alphabet = Alphabet('pos')
+    flat, offsets = alphabet.encode(read_lines(path, (1,))[0])
+    assert np.array_equal(columns.ids[0] + 1, flat)
+    assert np.array_equal(columns.offsets, offsets)
+
+
+def test_words_are_normalized_and_last_sentence_is_kept(tmpdir):
+    path = str(tmpdir.join('corpus.txt'))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('Hà\tNp\tB-LOC\nNội\tNp\tI-LOC\n\n\n2017\tM\tO\n')
+    columns = read_conll_columns(path, num_workers=0)
+    assert len(columns) == 2
+    assert columns.sentences(0) == [['hà', 'nội'], [map_number_and_punct('2017')]]
+    assert columns.sentences(2) == [['B-LOC', 'I-LOC'], ['O']]
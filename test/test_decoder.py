@@ -0,0 +1,56 @@
+import itertools
+
+import numpy as np
+
+from alphabet import Alphabet
+from decoder import ViterbiDecoder, transition_mask
+
+TAGS = ['O', 'B-LOC', 'I-LOC', 'B-PER', 'I-PER']
+
+
+def tag_alphabet():
+    alphabet = Alphabet('tag')
+    for tag in TAGS:
+        alphabet.add(tag)
+    return alphabet
+
+
+def is_legal(path, allowed, start_allowed):
+    return start_allowed[path[0]] and all(allowed[i, j] for i, j in zip(path, path[1:]))
+
+
+def test_transition_mask():
+    alphabet = tag_alphabet()
+    allowed, start_allowed = transition_mask(alphabet)
+    index = alphabet.get_index
+    assert not start_allowed[0] and not allowed[:, 0].any()
+    assert not start_allowed[index('I-LOC')] and start_allowed[index('B-LOC')]
+    assert allowed[index('B-LOC'), index('I-LOC')] and allowed[index('I-LOC'), index('I-LOC')]
+    assert not allowed[index('O'), index('I-LOC')] and not allowed[index('B-PER'), index('I-LOC')]
+
+
+def test_matches_exhaustive_search():
+    rng = np.random.RandomState(0)
+    alphabet = tag_alphabet()
+    decoder = ViterbiDecoder(alphabet)
+    num_tags = alphabet.size()
+    probs = rng.dirichlet(np.ones(num_tags), size=(6, 5))
+    lengths = np.array([5, 3, 1, 4, 5, 2])
+    paths = decoder(probs, lengths)
+    for probs_row, length, path in zip(probs, lengths, paths):
+        best = max((candidate for candidate in itertools.product(range(num_tags), repeat=length)
+                    if is_legal(candidate, decoder.allowed, decoder.start_allowed)),
+                   key=lambda candidate: sum(np.log(probs_row[t, tag]) for t, tag in enumerate(candidate)))
+        assert tuple(path[:length]) == best
+        assert not path[length:].any()
+
+
+def test_never_predicts_padding_or_illegal_starts():
+    alphabet = tag_alphabet()
+    decoder = ViterbiDecoder(alphabet)
+    probs = np.full((1, 3, alphabet.size()), 0.01)
+    probs[0, :, 0] = 0.9
+    probs[0, 0, alphabet.get_index('I-PER')] = 0.5
+    path = decoder(probs, [3])[0]
+    assert 0 not in path
+    assert is_legal(path, decoder.allowed, decoder.start_allowed)
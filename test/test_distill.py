@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+
+from distill import mix_targets, soften
+from featurizer import pad_ids
+from numpy_model import NumpyModel
+from prediction import predict_corpus, predict_probs
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+MODEL_DIR = os.path.join(ROOT, 'model')
+
+
+def softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def test_soften_matches_a_softmax_at_the_temperature():
+    logits = np.random.RandomState(0).normal(size=(6, 9))
+    probs = softmax(logits)
+    assert soften(probs, 1.) is probs
+    assert np.allclose(soften(probs, 3.), softmax(logits / 3.), atol=1e-6)
+    assert np.all(soften(probs, 3.).max(axis=-1) < probs.max(axis=-1))
+
+
+def test_mix_targets_keeps_distributions():
+    soft = softmax(np.random.RandomState(1).normal(size=(4, 5))).astype(np.float32)
+    tag_ids = np.array([1, 2, 2, 4])
+    targets = mix_targets(soft, tag_ids, 0.3)
+    assert np.allclose(targets.sum(axis=-1), 1.)
+    assert np.allclose(targets[np.arange(4), tag_ids], 0.3 * soft[np.arange(4), tag_ids] + 0.7)
+    assert np.allclose(mix_targets(soft, tag_ids, 1.), soft)
+
+
+def test_pad_ids_pads_rows_of_a_flat_array():
+    flat = np.arange(12, dtype=np.float32).reshape(6, 2)
+    padded = pad_ids(flat, np.array([0, 4, 6]), 3)
+    assert padded.shape == (2, 3, 2)
+    assert np.array_equal(padded[0], flat[:3])
+    assert np.array_equal(padded[1], np.concatenate([flat[4:], np.zeros((1, 2))]))
+
+
+def test_teacher_probabilities_agree_with_its_predictions():
+    from test_numpy_model import sample_inputs
+    model = NumpyModel(MODEL_DIR)
+    corpus, featurizer, dim_pos = sample_inputs()
+    probs = predict_probs(model.predict_on_batch, corpus, featurizer, dim_pos, batch_size=8)
+    assert probs.shape == (len(corpus.word_ids), 9)
+    assert np.allclose(probs.sum(axis=-1), 1., atol=1e-5)
+    predicts = predict_corpus(model.predict_on_batch, corpus, featurizer, dim_pos, batch_size=8)
+    assert np.array_equal(np.concatenate(predicts), np.argmax(probs, axis=-1))
+    pieces = predict_probs(model.predict_on_batch, corpus, featurizer, dim_pos, batch_size=8, max_length=5)
+    assert pieces.shape == probs.shape
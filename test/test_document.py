@@ -0,0 +1,35 @@
+from document import align_words, entity_spans, merge_windows, split_sentences, window_bounds
+
+
+def test_split_sentences_keeps_offsets():
+    text = ' Ông Nguyễn V. A. sống ở TP. Hồ Chí Minh. Anh ấy nói: "Xin chào!" \n\nHết'
+    spans = split_sentences(text)
+    assert [text[start:end] for start, end in spans] == [
+        'Ông Nguyễn V. A. sống ở TP. Hồ Chí Minh.', 'Anh ấy nói: "Xin chào!"', 'Hết']
+    text = 'Đội thắng 3. Sau đó họ về nhà.'
+    assert [text[start:end] for start, end in split_sentences(text)] == ['Đội thắng 3.', 'Sau đó họ về nhà.']
+
+
+def test_align_words_finds_joined_syllables():
+    text = 'Hà Nội là  thủ đô.'
+    words = ['Hà_Nội', 'là', 'thủ_đô', '.']
+    spans = align_words(text, words, offset=10)
+    assert [text[start - 10:end - 10] for start, end in spans] == ['Hà Nội', 'là', 'thủ đô', '.']
+    assert align_words('a b', ['a', 'x', 'b']) == [(0, 1), (1, 1), (2, 3)]
+
+
+def test_windows_cover_the_sentence_and_merge_by_center():
+    assert window_bounds(5, 10, 2) == [(0, 5)]
+    bounds = window_bounds(10, 4, 2)
+    assert bounds == [(0, 4), (2, 6), (4, 8), (6, 10)]
+    # Every window predicts its own index, so the merge shows which window each token came from.
+    predictions = [[k] * (end - start) for k, (start, end) in enumerate(bounds)]
+    assert merge_windows(10, bounds, predictions) == [0, 0, 0, 1, 1, 2, 2, 3, 3, 3]
+
+
+def test_entity_spans():
+    text = 'Ở Hà Nội có ông Nam'
+    word_spans = [(0, 1), (2, 8), (9, 11), (12, 15), (16, 19)]
+    entities = entity_spans(text, ['O', 'B-LOC', 'O', 'O', 'I-PER'], word_spans)
+    assert entities == [{'type': 'LOC', 'start': 2, 'end': 8, 'text': 'Hà Nội'},
+                        {'type': 'PER', 'start': 16, 'end': 19, 'text': 'Nam'}]
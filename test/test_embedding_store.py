@@ -0,0 +1,26 @@
+import numpy as np
+
+import embedding_store
+from featurizer import Featurizer
+
+
+def test_store_matches_word_list(tmp_path):
+    embedd_words = ['việt_nam', 'là', '<number>', 'là', 'ă']
+    embedd_vectors = np.random.uniform(-1, 1, [5, 4])
+    embedding_store.write_vocab(embedd_words, str(tmp_path))
+    embedding_store.write_vectors(embedd_vectors, str(tmp_path))
+    store = embedding_store.EmbeddingStore(str(tmp_path))
+    assert [store.vocab.get(w, -1) for w in ['việt_nam', 'là', 'ă', 'hà_nội']] == [0, 1, 4, -1]
+    sentences = [['Việt_Nam', 'là', 'hà_nội'], ['<number>']]
+    unknown_embedd = np.zeros([1, 4])
+    expected = Featurizer(embedd_words, embedd_vectors, unknown_embedd).construct_tensor_word(sentences, 3)
+    actual = Featurizer(store.vocab, store.vectors, unknown_embedd).construct_tensor_word(sentences, 3)
+    assert np.allclose(expected, actual)
+
+
+def test_vocabulary_memo_is_bounded(tmp_path):
+    embedding_store.write_vocab(['a', 'b', 'c'], str(tmp_path))
+    vocab = embedding_store.Vocabulary(str(tmp_path), memo_size=2)
+    assert [vocab.get(w) for w in ['a', 'x', 'c', 'y', 'x']] == [0, None, 2, None, None]
+    assert vocab.get('y', -1) == -1
+    assert len(vocab.memo) == 2
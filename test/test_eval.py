@@ -0,0 +1,69 @@
+import glob
+import os
+import random
+import re
+import shutil
+import subprocess
+
+import pytest
+
+from eval import score_file
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+SAMPLES = sorted(glob.glob(os.path.join(ROOT, 'data', '*_sample.txt')))
+
+
+def corrupt(tags, labels, rng):
+    return [rng.choice(labels) if rng.random() < 0.3 else tag for tag in tags]
+
+
+def write_result(sample, column, output, seed):
+    """Write 'word gold predicted' lines, the predictions being the gold tags of column with random errors."""
+    rng = random.Random(seed)
+    sentences = [[]]
+    with open(sample, encoding='utf-8') as f:
+        for line in f:
+            fields = line.split()
+            if fields:
+                sentences[-1].append((fields[0], fields[column]))
+            elif sentences[-1]:
+                sentences.append([])
+    labels = sorted(set(tag for sentence in sentences for _, tag in sentence))
+    with open(output, 'w', encoding='utf-8') as f:
+        for sentence in sentences:
+            preds = corrupt([tag for _, tag in sentence], labels, rng)
+            for (word, gold), pred in zip(sentence, preds):
+                f.write('%s %s %s\n' % (word, gold, pred))
+            f.write('\n')
+
+
+def conlleval(result_file):
+    with open(result_file, 'rb') as f:
+        output = subprocess.run(['perl', os.path.join(ROOT, 'conlleval.pl')], stdin=f, stdout=subprocess.PIPE,
+                                check=True).stdout.decode('utf-8')
+    scores = {}
+    for line in output.splitlines():
+        match = re.match(r'accuracy:\s*([\d.]+)%; precision:\s*([\d.]+)%; recall:\s*([\d.]+)%; FB1:\s*([\d.]+)', line)
+        if match:
+            scores['OVERALL'] = [float(value) for value in match.groups()]
+        match = re.match(r'\s*(\S+): precision:\s*([\d.]+)%; recall:\s*([\d.]+)%; FB1:\s*([\d.]+)', line)
+        if match:
+            scores[match.group(1)] = [float(value) for value in match.groups()[1:]]
+    return scores
+
+
+@pytest.mark.skipif(shutil.which('perl') is None, reason='conlleval.pl needs perl')
+@pytest.mark.parametrize('sample', SAMPLES)
+@pytest.mark.parametrize('column', [2, 3])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_parity_with_conlleval(tmpdir, sample, column, seed):
+    result_file = str(tmpdir.join('result.txt'))
+    write_result(sample, column, result_file, seed)
+    expected = conlleval(result_file)
+    scores = score_file(result_file, pred_column=-1, gold_column=-2)
+    assert set(scores) == set(expected)
+    for tag, values in expected.items():
+        got = [scores[tag]['Precision'], scores[tag]['Recall'], scores[tag]['F1']]
+        if tag == 'OVERALL':
+            got = [scores[tag]['Accuracy']] + got
+        assert [round(100 * value, 2) for value in got] == pytest.approx(values, abs=0.01)
@@ -0,0 +1,23 @@
+import os
+
+import numpy as np
+import pytest
+
+from numpy_model import NumpyModel
+from test_numpy_model import MODEL_DIR, sample_inputs
+
+
+def test_exported_model_matches_the_saved_weights(tmp_path):
+    pytest.importorskip('tensorflow')
+    from export_model import export
+    from lite_model import LiteModel, LITE_FILE
+    # The masked LSTM layers need select TensorFlow ops.
+    export(MODEL_DIR, str(tmp_path), select_tf_ops=True)
+    assert os.path.exists(str(tmp_path / 'tag.json'))
+    lite_model = LiteModel(str(tmp_path / LITE_FILE))
+    max_length = lite_model.input_shapes[0][1]
+    corpus, featurizer, dim_pos = sample_inputs()
+    X = featurizer.transform_ids(corpus.word_ids, corpus.pos_ids, corpus.offsets, max_length, dim_pos, np.arange(8))
+    mask = np.any(X != 0, axis=-1)
+    expected = NumpyModel(MODEL_DIR).predict_on_batch(X)
+    assert np.allclose(lite_model.predict_on_batch(X)[mask], expected[mask], atol=1e-4)
@@ -0,0 +1,42 @@
+import numpy as np
+
+from featurizer import Featurizer, construct_tensor_onehot, map_number_and_punct
+
+
+def construct_tensor_word_loop(word_sentences, unknown_embedd, embedd_words, embedd_vectors, max_length):
+    """Reference implementation: per-token list lookup."""
+    X = np.zeros([len(word_sentences), max_length, np.shape(embedd_vectors)[1]])
+    for i, words in enumerate(word_sentences):
+        for j, word in enumerate(words):
+            word = word.lower()
+            X[i, j] = embedd_vectors[embedd_words.index(word)] if word in embedd_words else unknown_embedd
+    return X
+
+
+def test_construct_tensor_word():
+    embedd_words = ['hà_nội', 'là', '<number>', 'là']
+    embedd_vectors = np.random.uniform(-1, 1, [4, 5])
+    unknown_embedd = np.random.uniform(-0.01, 0.01, [1, 5])
+    sentences = [['Hà_Nội', 'là', 'thủ_đô'], ['<number>'], []]
+    featurizer = Featurizer(embedd_words, embedd_vectors, unknown_embedd)
+    X = featurizer.construct_tensor_word(sentences, 4)
+    assert X.dtype == np.float32
+    assert np.allclose(X, construct_tensor_word_loop(sentences, unknown_embedd, embedd_words, embedd_vectors, 4))
+
+
+def test_transform_concatenates_pos():
+    featurizer = Featurizer(['a', 'b'], np.ones([2, 3]))
+    X = featurizer.transform([['a', 'b'], ['c']], [[1, 2], [0]], 3, 4)
+    assert X.shape == (2, 3, 7)
+    assert np.array_equal(X[:, :, 3:], construct_tensor_onehot([[1, 2], [0]], 3, 4))
+    assert not X[0, 2].any() and not X[1, 1:].any()
+
+
+def test_map_number_and_punct():
+    assert map_number_and_punct(u'12/5') == u'<number>'
+    assert map_number_and_punct(u'...') == u'<punct>'
+    assert map_number_and_punct(u'việt_nam') == u'việt_nam'
+    # Same as str.isdigit: superscripts and circled digits count as digits.
+    assert map_number_and_punct(u'm²') == u'<number>'
+    assert map_number_and_punct(u'①') == u'<number>'
+    assert map_number_and_punct(u'٣') == u'<number>'
@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+
+from alphabet import Alphabet
+from conll_reader import read_conll_columns
+from featurizer import Corpus
+from finetune import concat_corpora, map_columns, widen_input_kernels
+from numpy_model import NumpyModel, load_checkpoint, network_weights
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+MODEL_DIR = os.path.join(ROOT, 'model')
+
+
+def write_conll(path, sentences):
+    with open(path, 'w', encoding='utf-8') as f:
+        for sentence in sentences:
+            for token in sentence:
+                f.write(' '.join(token) + '\n')
+            f.write('\n')
+
+
+def test_widened_network_ignores_the_new_features():
+    weights = network_weights(load_checkpoint(os.path.join(MODEL_DIR, 'variables', 'variables')))
+    widened = widen_input_kernels(weights, 3)
+    assert widened[0].shape == (322, 256) and widened[3].shape == (322, 256)
+    assert [w.shape for w in widened[1:3] + widened[4:]] == [w.shape for w in weights[1:3] + weights[4:]]
+    X = np.random.RandomState(0).uniform(-1, 1, (2, 5, 319)).astype(np.float32)
+    model = NumpyModel.__new__(NumpyModel)
+    model.set_weights(weights)
+    expected = model.predict_on_batch(X)
+    model.set_weights(widened)
+    X_wide = np.concatenate([X, np.zeros((2, 5, 3), dtype=np.float32)], axis=-1)
+    assert np.allclose(model.predict_on_batch(X_wide), expected, atol=1e-6)
+
+
+def test_map_columns_grows_pos_and_refuses_new_tags(tmp_path):
+    alphabet_pos = Alphabet('pos')
+    alphabet_pos.load(MODEL_DIR)
+    alphabet_tag = Alphabet('tag', keep_growing=False)
+    alphabet_tag.load(MODEL_DIR)
+    size = alphabet_pos.size()
+    known_pos = alphabet_pos.instances[0]
+    path = str(tmp_path / 'new.txt')
+    write_conll(path, [[('Hà_Nội', known_pos, 'B-LOC'), ('mới', 'NEWPOS', 'O')]])
+    pos_ids, tag_ids = map_columns(read_conll_columns(path, (0, 1, 2), num_workers=0), alphabet_pos, alphabet_tag,
+                                   path)
+    assert alphabet_pos.size() == size + 1
+    assert list(pos_ids) == [alphabet_pos.get_index(known_pos), size]
+    assert list(alphabet_tag.decode(tag_ids)) == ['B-LOC', 'O']
+
+    write_conll(path, [[('Hà_Nội', known_pos, 'B-GPE')]])
+    with pytest.raises(ValueError, match='B-GPE'):
+        map_columns(read_conll_columns(path, (0, 1, 2), num_workers=0), alphabet_pos, alphabet_tag, path)
+
+
+def test_concat_corpora_shifts_offsets():
+    first = Corpus(np.array([2, 3, 4]), np.array([1, 1, 2]), np.array([1, 2, 1]), np.array([0, 1, 3]))
+    second = Corpus(np.array([5, 6]), np.array([2, 1]), np.array([1, 1]), np.array([0, 2]))
+    corpus = concat_corpora([first, second])
+    assert len(corpus) == 3
+    assert [list(s) for s in corpus.split(corpus.word_ids)] == [[2], [3, 4], [5, 6]]
@@ -0,0 +1,56 @@
+import instrumentation
+from instrumentation import NULL_STAGE, registry, stage
+
+
+class ListSink:
+    def __init__(self):
+        self.events = []
+
+    def observe(self, event):
+        self.events.append(event)
+
+
+def test_disabled_stages_are_no_ops():
+    instrumentation.disable()
+    registry.reset()
+    assert stage('predict') is NULL_STAGE
+    with stage('predict'):
+        pass
+    assert registry.stages == {}
+
+
+def test_stages_reach_sinks_and_prometheus_text():
+    check_stages()
+
+
+def test_traced_memory_without_reset_peak(monkeypatch):
+    # Python 3.8 and older, which the pinned TensorFlow requires.
+    monkeypatch.setattr(instrumentation, 'CAN_RESET_PEAK', False)
+    check_stages()
+
+
+def check_stages():
+    sink = ListSink()
+    registry.reset()
+    instrumentation.enable([sink], trace_memory=True)
+    try:
+        with stage('featurize_batch'):
+            with stage('word_ids'):
+                data = [0] * 100000
+            del data
+        with stage('word_ids'):
+            pass
+        instrumentation.set_gauge('train_samples_per_second', 12.5)
+    finally:
+        instrumentation.disable()
+    assert [event.get('stage') for event in sink.events] == ['word_ids', 'featurize_batch', 'word_ids', None]
+    first, outer = sink.events[0], sink.events[1]
+    # The allocation inside the nested stage also counts for the enclosing one.
+    assert first['peak_traced_bytes'] >= 800000
+    assert outer['peak_traced_bytes'] >= first['peak_traced_bytes']
+    assert registry.stages['word_ids']['count'] == 2
+    text = registry.prometheus_text()
+    assert 'ner_stage_calls_total{stage="word_ids"} 2' in text
+    assert 'ner_train_samples_per_second 12.5' in text
+    assert 'ner_stage_process_peak_rss_bytes{stage="word_ids"}' in text
+    registry.reset()
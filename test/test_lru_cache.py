@@ -0,0 +1,37 @@
+from lru_cache import LRUCache, lookup_all
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache('test', 2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['hits'] == 3 and cache.stats()['misses'] == 1
+    cache.resize(1)
+    assert len(cache) == 1 and cache.get('c') == 3
+
+
+def test_lookup_all_computes_distinct_misses_once():
+    cache = LRUCache('test', 10)
+    calls = []
+
+    def compute(keys):
+        calls.append(keys)
+        return [key.upper() for key in keys]
+
+    assert lookup_all(cache, ['a', 'b', 'a'], compute) == ['A', 'B', 'A']
+    assert lookup_all(cache, ['b', 'c', 'c'], compute) == ['B', 'C', 'C']
+    assert calls == [['a', 'b'], ['c']]
+
+
+def test_disabled_cache_still_deduplicates():
+    cache = LRUCache('test', 0)
+    calls = []
+    compute = lambda keys: calls.append(keys) or [len(key) for key in keys]
+    assert lookup_all(cache, ['ab', 'ab'], compute) == [2, 2]
+    assert lookup_all(cache, ['ab'], compute) == [2]
+    assert calls == [['ab'], ['ab']]
+    assert len(cache) == 0
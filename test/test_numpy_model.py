@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+import pytest
+
+from alphabet import Alphabet
+from conll_reader import read_conll_columns
+from featurizer import Featurizer
+from numpy_model import NumpyModel, load_checkpoint, network_weights
+from prediction import predict_corpus
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+MODEL_DIR = os.path.join(ROOT, 'model')
+TEST_FILE = os.path.join(ROOT, 'data', 'test_sample.txt')
+EMBEDD_DIM = 300
+
+
+def sample_inputs():
+    """Network inputs of data/test_sample.txt, with a random embedding over its words in place of the real one."""
+    columns = read_conll_columns(TEST_FILE, (0, 1), num_workers=0)
+    rng = np.random.RandomState(0)
+    featurizer = Featurizer(columns.vocabs[0], rng.uniform(-1, 1, (len(columns.vocabs[0]), EMBEDD_DIM)))
+    alphabet_pos = Alphabet('pos', keep_growing=False)
+    alphabet_pos.load(MODEL_DIR)
+    corpus = featurizer.corpus(columns.sentences(0), alphabet_pos.encode(columns.sentences(1))[0])
+    return corpus, featurizer, alphabet_pos.size()
+
+
+def test_checkpoint_holds_the_released_network():
+    weights = network_weights(load_checkpoint(os.path.join(MODEL_DIR, 'variables', 'variables')))
+    assert [w.shape for w in weights] == [(319, 256), (64, 256), (256,)] * 2 + [(128, 256), (64, 256), (256,)] * 2 + \
+        [(128, 9), (9,)]
+
+
+def test_batched_prediction_matches_single_sentences():
+    model = NumpyModel(MODEL_DIR)
+    corpus, featurizer, dim_pos = sample_inputs()
+    batched = predict_corpus(model.predict_on_batch, corpus, featurizer, dim_pos, batch_size=8)
+    for i in range(0, len(corpus), 7):
+        X = featurizer.transform_ids(corpus.word_ids, corpus.pos_ids, corpus.offsets, int(corpus.lengths[i]),
+                                     dim_pos, [i])
+        assert np.array_equal(np.argmax(model.predict_on_batch(X)[0], axis=-1), batched[i])
+
+
+def test_probabilities_match_keras():
+    pytest.importorskip('tensorflow')
+    import network
+    model = NumpyModel(MODEL_DIR)
+    corpus, featurizer, dim_pos = sample_inputs()
+    weights = network_weights(load_checkpoint(os.path.join(MODEL_DIR, 'variables', 'variables')))
+    keras_model = network.building_ner(2, 64, 0., None, EMBEDD_DIM + dim_pos, 9)
+    keras_model.set_weights(weights)
+    max_length = int(corpus.lengths.max())
+    X = featurizer.transform_ids(corpus.word_ids, corpus.pos_ids, corpus.offsets, max_length, dim_pos)
+    mask = np.arange(max_length) < corpus.lengths[:, None]
+    expected = keras_model.predict(X, batch_size=16)
+    assert np.allclose(model.predict_on_batch(X)[mask], expected[mask], atol=1e-5)
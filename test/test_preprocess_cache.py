@@ -0,0 +1,23 @@
+import json
+import os
+
+from preprocess_cache import DIGESTS_FILE, PreprocessCache
+
+
+def test_file_digests_are_reused_until_the_file_changes(tmp_path):
+    source = tmp_path / 'vectors.npy'
+    source.write_bytes(b'0123456789')
+    cache = PreprocessCache(str(tmp_path / 'cache'))
+    key = cache.key([str(source), None])
+    assert cache.key([str(source), None]) == key
+    digests_file = tmp_path / 'cache' / DIGESTS_FILE
+    digests = json.loads(digests_file.read_text())
+    assert list(digests) == [os.path.abspath(str(source))]
+    # A stored digest is trusted while the file is unchanged, so the file is not read again.
+    digests[os.path.abspath(str(source))]['sha256'] = 'stale'
+    digests_file.write_text(json.dumps(digests))
+    assert cache.key([str(source), None]) != key
+    source.write_bytes(b'01234567890')
+    changed = cache.key([str(source), None])
+    assert changed not in (key, cache.key([str(source)]))
+    assert json.loads(digests_file.read_text())[os.path.abspath(str(source))]['sha256'] != 'stale'
@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+from featurizer import Featurizer
+from prune_embedding import count_conll, count_frequency_file, hot_vocabulary, write_store
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+def test_pruned_store_embeds_corpus_words_like_the_full_embedding(tmp_path):
+    counts = count_conll([os.path.join(DATA_DIR, 'dev_sample.txt')], num_workers=0)
+    corpus_words = sorted(counts)
+    # A full embedding holding every other corpus word among unrelated ones.
+    embedd_words = ['unrelated_%d' % i for i in range(50)] + corpus_words[::2]
+    embedd_vectors = np.random.RandomState(0).uniform(-1, 1, [len(embedd_words), 8]).astype(np.float32)
+    full = Featurizer(embedd_words, embedd_vectors)
+    words, rows = hot_vocabulary(counts, full.word2row)
+    assert set(words) == set(corpus_words[::2])
+    assert [counts[word] for word in words] == sorted((counts[word] for word in words), reverse=True)
+
+    write_store(words, rows, embedd_vectors, str(tmp_path))
+    store = EmbeddingStore(str(tmp_path))
+    assert len(store.vectors) == len(words)
+    pruned = Featurizer(store.vocab, store.vectors, store.unknown_embedd)
+    full.unknown_embedd = store.unknown_embedd
+    sentences = [corpus_words[:20], ['never_seen'] + corpus_words[-5:]]
+    assert np.array_equal(full.construct_tensor_word(sentences, 25), pruned.construct_tensor_word(sentences, 25))
+    # The out-of-vocabulary vector is stored, not drawn again in every process.
+    assert np.array_equal(EmbeddingStore(str(tmp_path)).unknown_embedd, store.unknown_embedd)
+
+
+def test_frequency_file_is_normalized(tmp_path):
+    path = tmp_path / 'counts.tsv'
+    path.write_text('Hà_Nội\t5\nhà_nội\t2\n2020\t3\nxin\n', encoding='utf-8')
+    counts = count_frequency_file(str(path))
+    assert counts['hà_nội'] == 7
+    assert counts['xin'] == 1
+    assert sum(counts.values()) == 11
@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+
+import embedding_store
+from conll_reader import read_conll_columns
+from embedding_store import EmbeddingStore
+from featurizer import Featurizer
+from quantize_embedding import check, quantize
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+TEST_FILE = os.path.join(ROOT, 'data', 'test_sample.txt')
+
+
+def write_store(directory, words, dim):
+    os.makedirs(directory)
+    embedding_store.write_vocab(words, directory)
+    embedding_store.write_vectors(np.random.RandomState(0).normal(0, 0.3, [len(words), dim]), directory)
+
+
+def test_quantized_store_embeds_like_the_float_store(tmp_path):
+    words = ['w%d' % i for i in range(100)]
+    write_store(str(tmp_path / 'float'), words, 16)
+    quantize(str(tmp_path / 'float'), str(tmp_path / 'int8'))
+    store = EmbeddingStore(str(tmp_path / 'float'))
+    quantized = EmbeddingStore(str(tmp_path / 'int8'))
+    assert quantized.vectors.nbytes < store.vectors.nbytes / 3
+    sentences = [words[:10], ['oov'] + words[50:]]
+    unknown_embedd = np.zeros(16)
+    expected = Featurizer(store.vocab, store.vectors, unknown_embedd).construct_tensor_word(sentences, 60)
+    actual = Featurizer(quantized.vocab, quantized.vectors, unknown_embedd).construct_tensor_word(sentences, 60)
+    assert actual.dtype == np.float32
+    # Every value is within half a quantization step of its row.
+    steps = np.abs(store.vectors).max(axis=1) / 127.
+    assert np.all(np.abs(actual - expected) <= steps.max() / 2 + 1e-6)
+
+
+def test_check_reports_the_impact_on_the_sample_data(tmp_path):
+    words = read_conll_columns(TEST_FILE, (0,), num_workers=0).vocabs[0]
+    # The released model takes 300-dimensional vectors.
+    write_store(str(tmp_path / 'float'), words, 300)
+    quantize(str(tmp_path / 'float'), str(tmp_path / 'int8'))
+    report = check(TEST_FILE, str(tmp_path / 'float'), str(tmp_path / 'int8'), os.path.join(ROOT, 'model'))
+    assert report['same_tags'] > 0.95
+    assert report['relative_row_error'] < 0.02
+    assert report['int8']['vector_bytes'] < report['float32']['vector_bytes'] / 3
@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+from server import MicroBatcher, NerServer
+
+
+def test_requests_are_coalesced():
+    batches = []
+
+    def predict_batch(texts):
+        batches.append(list(texts))
+        return [text.upper() for text in texts]
+
+    async def run():
+        batcher = MicroBatcher(predict_batch, max_batch_size=4, max_wait_ms=50)
+        task = asyncio.ensure_future(batcher.run())
+        results = await asyncio.gather(*[batcher.submit(text) for text in ['a', 'b', 'c', 'd', 'e']])
+        task.cancel()
+        return results
+
+    assert asyncio.run(run()) == ['A', 'B', 'C', 'D', 'E']
+    assert batches == [['a', 'b', 'c', 'd'], ['e']]
+
+
+def test_http_endpoints():
+    async def request(port, raw):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(raw)
+        response = await reader.read()
+        writer.close()
+        head, _, body = response.partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(body)
+
+    async def run():
+        predicted = []
+
+        def predict_batch(texts):
+            predicted.extend(texts)
+            return [len(text) for text in texts]
+
+        batcher = MicroBatcher(predict_batch, max_queue_size=1)
+        task = asyncio.ensure_future(batcher.run())
+        server = await asyncio.start_server(NerServer(batcher, batch_task=task).handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        body = json.dumps({'texts': ['ab', 'abc']}).encode('utf-8')
+        health = await request(port, b'GET /health HTTP/1.1\r\nConnection: close\r\n\r\n')
+        too_large = await request(port, b'POST /ner HTTP/1.1\r\nConnection: close\r\nContent-Length: %d\r\n\r\n%s'
+                                  % (len(body), body))
+        body = json.dumps({'text': 'abcd'}).encode('utf-8')
+        ner = await request(port, b'POST /ner HTTP/1.1\r\nConnection: close\r\nContent-Length: %d\r\n\r\n%s'
+                            % (len(body), body))
+        task.cancel()
+        await asyncio.sleep(0)
+        stopped = await request(port, b'GET /health HTTP/1.1\r\nConnection: close\r\n\r\n')
+        server.close()
+        return health, too_large, ner, stopped, predicted
+
+    health, too_large, ner, stopped, predicted = asyncio.run(run())
+    assert health == (200, {'status': 'ok', 'queue_size': 0, 'max_queue_size': 1})
+    # Two texts never fit in a queue of one: the request is refused for good, without predicting either.
+    assert too_large == (413, {'error': 'a request takes at most 1 texts'})
+    assert ner == (200, {'result': 4})
+    assert predicted == ['abcd']
+    assert stopped[0] == 503
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from featurizer import Corpus
+from sweep import CORPUS_ARRAYS, DEFAULTS, attach_array, expand_spec, format_table, share_array, shared_corpus, \
+    should_prune
+
+
+def test_grid_covers_every_combination_with_defaults():
+    trials = expand_spec({'method': 'grid', 'params': {'num_hidden_node': [32, 64], 'dropout': [0.3, 0.5]}})
+    assert len(trials) == 4
+    assert {(trial['num_hidden_node'], trial['dropout']) for trial in trials} == {(32, 0.3), (32, 0.5), (64, 0.3),
+                                                                                  (64, 0.5)}
+    assert all(trial['batch_size'] == DEFAULTS['batch_size'] for trial in trials)
+
+
+def test_random_search_samples_lists_and_ranges():
+    spec = {'method': 'random', 'num_trials': 20,
+            'params': {'num_lstm_layer': {'low': 1, 'high': 3}, 'dropout': {'low': 0.1, 'high': 0.6},
+                       'batch_size': [32, 64]}}
+    trials = expand_spec(spec, seed=1)
+    assert len(trials) == 20
+    assert trials == expand_spec(spec, seed=1)
+    assert all(trial['num_lstm_layer'] in (1, 2, 3) for trial in trials)
+    assert all(0.1 <= trial['dropout'] <= 0.6 for trial in trials)
+    with pytest.raises(ValueError):
+        expand_spec({'params': {'learning_rate': [0.1]}})
+
+
+def test_shared_array_round_trip():
+    array = np.arange(24, dtype=np.float32).reshape(2, 3, 4)
+    block, descriptor = share_array(array)
+    try:
+        attached_block, attached = attach_array(descriptor)
+        assert np.array_equal(attached, array)
+        assert not attached.flags.writeable
+        del attached
+        attached_block.close()
+    finally:
+        block.close()
+        block.unlink()
+
+
+def test_shared_corpus_round_trip():
+    corpus = Corpus(np.array([2, 3, 1], dtype=np.int32), np.array([1, 2, 1], dtype=np.int32),
+                    np.array([1, 1, 2], dtype=np.int32), np.array([0, 1, 3]))
+    blocks, arrays = [], {}
+    try:
+        for name in CORPUS_ARRAYS:
+            block, descriptor = share_array(getattr(corpus, name))
+            blocks.append(block)
+            attached_block, arrays['train_' + name] = attach_array(descriptor)
+            blocks.append(attached_block)
+        shared = shared_corpus(arrays, 'train')
+        assert [list(ids) for ids in shared.split(shared.word_ids)] == [[2], [3, 1]]
+        assert np.array_equal(shared.tag_ids, corpus.tag_ids)
+        del shared, arrays
+    finally:
+        for block in blocks:
+            block.close()
+        for block in blocks[::2]:
+            block.unlink()
+
+
+def test_median_pruning():
+    others = [[1.0, 0.8, 0.6], [1.0, 0.7, 0.5], [1.0, 0.9, 0.7], [1.0]]
+    assert not should_prune(others, 1, 5.0, warmup=2)
+    assert should_prune(others, 2, 0.65, warmup=2)
+    assert not should_prune(others, 2, 0.55, warmup=2)
+    assert not should_prune(others, 2, 0.65, warmup=2, min_trials=4)
+
+
+def test_table_is_sorted_by_f1():
+    results = [{'trial': trial, 'params': DEFAULTS, 'dev_f1': f1, 'val_loss': 0.1, 'epochs': 3, 'status': 'done',
+                'seconds': 1.0} for trial, f1 in enumerate([0.5, 0.9])]
+    lines = format_table(results).splitlines()
+    assert lines[0].startswith('trial')
+    assert lines[1].startswith('1') and lines[2].startswith('0')
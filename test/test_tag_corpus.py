@@ -0,0 +1,23 @@
+import os
+
+from tag_corpus import read_records
+
+SAMPLE = os.path.join(os.path.dirname(__file__), '..', 'data', 'train_sample.txt')
+
+
+def test_byte_ranges_partition_the_sentences():
+    size = os.path.getsize(SAMPLE)
+    sentences = list(read_records(SAMPLE, 0, size, 'conll'))
+    assert len(sentences) == 10
+    for num_workers in (2, 3, 7, 50):
+        bounds = [size * i // num_workers for i in range(num_workers + 1)]
+        split = [record for i in range(num_workers) for record in read_records(SAMPLE, bounds[i], bounds[i + 1],
+                                                                               'conll')]
+        assert split == sentences
+
+
+def test_resume_from_record_end():
+    size = os.path.getsize(SAMPLE)
+    records = list(read_records(SAMPLE, 0, size, 'raw'))
+    _, end, _ = records[4]
+    assert list(read_records(SAMPLE, end, size, 'raw')) == records[5:]
@@ -1,5 +1,10 @@
 import codecs
 from alphabet import Alphabet
+from embedding_store import EmbeddingStore, is_store
+from preprocess_cache import PreprocessCache
+from featurizer import Corpus, Featurizer, map_number_and_punct, construct_tensor_onehot
+from instrumentation import stage
+from conll_reader import read_conll_columns
 import numpy as np
 import pickle5 as pickle
 
@@ -35,41 +40,27 @@ def read_conll_format(input_file):
                 tags = []
                 num_sent += 1
                 max_length = max(max_length, sent_length)
+        # The last sentence counts even without a trailing blank line.
+        if words:
+            word_list.append(words)
+            pos_list.append(poss)
+            tag_list.append(tags)
+            num_sent += 1
+            max_length = max(max_length, len(words))
     return word_list, pos_list, tag_list, num_sent, max_length
 
 
-def map_number_and_punct(word):
-    if any(char.isdigit() for char in word):
-        word = u'<number>'
-    elif word in [u',', u'<', u'.', u'>', u'/', u'?', u'..', u'...', u'....', u':', u';', u'"', u"'", u'[', u'{', u']',
-                  u'}', u'|', u'\\', u'`', u'~', u'!', u'@', u'#', u'$', u'%', u'^', u'&', u'*', u'(', u')', u'-', u'+',
-                  u'=']:
-        word = u'<punct>'
-    return word
-
-
 def map_string_2_id_open(string_list, name):
-    string_id_list = []
+    """Build an alphabet over string_list and map it to ids. Returns (flat ids, offsets) and the closed alphabet."""
     alphabet_string = Alphabet(name)
-    for strings in string_list:
-        ids = []
-        for string in strings:
-            id = alphabet_string.get_index(string)
-            ids.append(id)
-        string_id_list.append(ids)
+    string_ids = alphabet_string.encode(string_list)
     alphabet_string.close()
-    return string_id_list, alphabet_string
+    return string_ids, alphabet_string
 
 
 def map_string_2_id_close(string_list, alphabet_string):
-    string_id_list = []
-    for strings in string_list:
-        ids = []
-        for string in strings:
-            id = alphabet_string.get_index(string)
-            ids.append(id)
-        string_id_list.append(ids)
-    return string_id_list
+    """Map string_list to (flat ids, offsets) with an existing alphabet, unknown strings getting id 0."""
+    return alphabet_string.encode(string_list)
 
 
 def map_string_2_id(pos_list_train, pos_list_dev, pos_list_test, \
@@ -83,6 +74,7 @@ def map_string_2_id(pos_list_train, pos_list_dev, pos_list_test, \
     tag_id_list_train, alphabet_tag = map_string_2_id_open(tag_list_train, 'tag')
     tag_id_list_dev = map_string_2_id_close(tag_list_dev, alphabet_tag)
     tag_id_list_test = map_string_2_id_close(tag_list_test, alphabet_tag)
+    # Every id list is a (flat ids, offsets) pair, see Alphabet.encode.
     return pos_id_list_train, pos_id_list_dev, pos_id_list_test, \
            tag_id_list_train, tag_id_list_dev, tag_id_list_test, alphabet_pos, alphabet_tag
 
@@ -109,98 +101,104 @@ def padding_data(pos_id_list_train, pos_id_list_dev, pos_id_list_test, chunk_id_
 
 
 def construct_tensor_word(word_sentences, unknown_embedd, embedd_words, embedd_vectors, embedd_dim, max_length):
-    X = np.empty([len(word_sentences), max_length, embedd_dim]) # shape: (#sentence, max_length of a sentence, dim)
-    for i in range(len(word_sentences)):
-        words = word_sentences[i] # a sentence
-        length = len(words)
-        for j in range(length):
-            word = words[j].lower()
-            try:
-                embedd = embedd_vectors[embedd_words.index(word)]
-            except:
-                embedd = unknown_embedd
-            X[i, j, :] = embedd
-        # Zero out X after the end of the sequence
-        X[i, length:] = np.zeros([1, embedd_dim])
-    return X
-
-
-def construct_tensor_onehot(feature_sentences, max_length, dim):
-    X = np.zeros([len(feature_sentences), max_length, dim])
-    for i in range(len(feature_sentences)):
-        for j in range(len(feature_sentences[i])):
-            if feature_sentences[i][j] > 0:
-                X[i, j, feature_sentences[i][j]] = 1
-    return X
-
-
-def create_vector_data(word_list_train, word_list_dev, word_list_test, pos_id_list_train, pos_id_list_dev,
-                       pos_id_list_test,  tag_id_list_train,
-                       tag_id_list_dev, tag_id_list_test, unknown_embedd, embedd_words, embedd_vectors, embedd_dim,
-                       max_length, dim_pos, dim_tag):
-    word_train = construct_tensor_word(word_list_train, unknown_embedd, embedd_words, embedd_vectors, embedd_dim, 
-                                       max_length)
-    word_dev = construct_tensor_word(word_list_dev, unknown_embedd, embedd_words, embedd_vectors, embedd_dim,
-                                     max_length)
-    word_test = construct_tensor_word(word_list_test, unknown_embedd, embedd_words, embedd_vectors, embedd_dim,
-                                      max_length)
-    pos_train = construct_tensor_onehot(pos_id_list_train, max_length, dim_pos)
-    pos_dev = construct_tensor_onehot(pos_id_list_dev, max_length, dim_pos)
-    pos_test = construct_tensor_onehot(pos_id_list_test, max_length, dim_pos)
-    # chunk_train = construct_tensor_onehot(chunk_id_list_train, max_length, dim_chunk)
-    # chunk_dev = construct_tensor_onehot(chunk_id_list_dev, max_length, dim_chunk)
-    # chunk_test = construct_tensor_onehot(chunk_id_list_test, max_length, dim_chunk)
-    tag_train = construct_tensor_onehot(tag_id_list_train, max_length, dim_tag)
-    tag_dev = construct_tensor_onehot(tag_id_list_dev, max_length, dim_tag)
-    tag_test = construct_tensor_onehot(tag_id_list_test, max_length, dim_tag)
-    input_train = word_train
-    input_train = np.concatenate((input_train, pos_train), axis=2)
-    # input_train = np.concatenate((input_train, chunk_train), axis=2)
-    output_train = tag_train
-    input_dev = word_dev
-    input_dev = np.concatenate((input_dev, pos_dev), axis=2)
-    # input_dev = np.concatenate((input_dev, chunk_dev), axis=2)
-    output_dev = tag_dev
-    input_test = word_test
-    input_test = np.concatenate((input_test, pos_test), axis=2)
-    # input_test = np.concatenate((input_test, chunk_test), axis=2)
-    output_test = tag_test
-    return input_train, output_train, input_dev, output_dev, input_test, output_test
-
-
-def create_data(word_dir, vector_dir, train_dir, dev_dir, test_dir):
-    embedd_vectors = np.load(vector_dir) #load pre-trained vector. shape (#words, dim)
+    featurizer = Featurizer(embedd_words, embedd_vectors, unknown_embedd)
+    return featurizer.construct_tensor_word(word_sentences, max_length)
+
+
+def load_embedding(word_dir, vector_dir):
+    """
+    Load the pre-trained embedding, memory-mapped.
+    :param word_dir: pickled word list, or an embedding store directory (see embedding_store.py).
+    :param vector_dir: .npy embedding matrix, ignored when word_dir is a store.
+    :return: (words or word -> row mapping, embedding matrix of shape (#words, dim))
+    """
+    if is_store(word_dir):
+        store = EmbeddingStore(word_dir)
+        return store.vocab, store.vectors
+    embedd_vectors = np.load(vector_dir, mmap_mode='r') #load pre-trained vector. shape (#words, dim)
     with open(word_dir, 'rb') as handle: #list words. len(#words)
         embedd_words = pickle.load(handle)
-    embedd_dim = np.shape(embedd_vectors)[1]
-    unknown_embedd = np.random.uniform(-0.01, 0.01, [1, embedd_dim])
-    word_list_train, pos_list_train, tag_list_train, num_sent_train, max_length_train = \
-        read_conll_format(train_dir)
-    word_list_dev, pos_list_dev, tag_list_dev, num_sent_dev, max_length_dev = \
-        read_conll_format(dev_dir)
-    word_list_test, pos_list_test, tag_list_test, num_sent_test, max_length_test = \
-        read_conll_format(test_dir)
-    pos_id_list_train, pos_id_list_dev, pos_id_list_test, \
-    tag_id_list_train, tag_id_list_dev, tag_id_list_test, alphabet_pos,alphabet_tag = \
-        map_string_2_id(pos_list_train, pos_list_dev, pos_list_test, \
-                        tag_list_train, tag_list_dev, tag_list_test)
-    max_length = max(max_length_train, max_length_dev, max_length_test)
-    input_train, output_train, input_dev, output_dev, input_test, output_test = \
-        create_vector_data(word_list_train, word_list_dev, word_list_test, pos_id_list_train, pos_id_list_dev,
-                           pos_id_list_test, tag_id_list_train, tag_id_list_dev, tag_id_list_test, unknown_embedd, embedd_words,
-                           embedd_vectors, embedd_dim, max_length, alphabet_pos.size(),
-                           alphabet_tag.size())
+    return embedd_words, embedd_vectors
+
+
+def load_unknown_embedd(word_dir):
+    """Out-of-vocabulary vector stored with an embedding store (see prune_embedding.py), None otherwise."""
+    return EmbeddingStore(word_dir).unknown_embedd if is_store(word_dir) else None
+
+
+def column_ids(alphabet, columns, column):
+    """Ids of a column read by conll_reader in an alphabet, looking up every distinct token once."""
+    vocab = columns.vocabs[column]
+    lookup = np.fromiter((alphabet.get_index(token) for token in vocab), dtype=np.int32, count=len(vocab))
+    return lookup[columns.ids[column]]
+
+
+def create_id_data(word_dir, vector_dir, train_dir, dev_dir, test_dir, cache_dir=None, tag_column=2,
+                   num_workers=None):
+    """
+    Read the train/dev/test CoNLL files and map them to flat word, POS and tag ids, without building any tensor.
+    :param cache_dir: optional preprocessing cache directory (see preprocess_cache.py). On a hit, the ids and
+    alphabets are loaded from it instead of parsing the CoNLL files again.
+    :param tag_column: column of the NER tag, 3 (or -1) for the 4-column files in data/.
+    :param num_workers: processes parsing large files, see conll_reader.read_conll_columns.
+    :return: train, dev and test Corpus, the Featurizer turning them into network inputs, the POS and tag
+    alphabets and the maximum sentence length.
+    """
+    with stage('load_embedding'):
+        embedd_words, embedd_vectors = load_embedding(word_dir, vector_dir)
+    featurizer = Featurizer(embedd_words, embedd_vectors, load_unknown_embedd(word_dir))
+    if cache_dir is not None:
+        cache = PreprocessCache(cache_dir)
+        sources = [train_dir, dev_dir, test_dir, word_dir, None if is_store(word_dir) else vector_dir]
+        with stage('cache_load'):
+            key = cache.key(sources, {'columns': [0, 1, tag_column]})
+            cached = cache.load(key)
+        if cached is not None:
+            train, dev, test, alphabet_pos, alphabet_tag, max_length = cached
+            return train, dev, test, featurizer, alphabet_pos, alphabet_tag, max_length
+    with stage('read_conll'):
+        # Words, POS and tags as columnar ids; words are normalized like read_conll_format does.
+        columns = [read_conll_columns(path, (0, 1, tag_column), num_workers=num_workers)
+                   for path in (train_dir, dev_dir, test_dir)]
+    with stage('alphabet_mapping'):
+        # Vocabularies are in order of first occurrence, so the alphabets get the ids map_string_2_id would give.
+        alphabet_pos = Alphabet('pos')
+        alphabet_tag = Alphabet('tag')
+        pos_ids = [column_ids(alphabet_pos, columns[0], 1)]
+        tag_ids = [column_ids(alphabet_tag, columns[0], 2)]
+        alphabet_pos.close()
+        alphabet_tag.close()
+        pos_ids += [column_ids(alphabet_pos, split_columns, 1) for split_columns in columns[1:]]
+        tag_ids += [column_ids(alphabet_tag, split_columns, 2) for split_columns in columns[1:]]
+    max_length = max(split_columns.max_length for split_columns in columns)
+    with stage('word_ids'):
+        train, dev, test = [Corpus(featurizer.vocab_word_ids(split_columns.vocabs[0], split_columns.ids[0]),
+                                   split_pos_ids, split_tag_ids, split_columns.offsets)
+                            for split_columns, split_pos_ids, split_tag_ids in zip(columns, pos_ids, tag_ids)]
+    if cache_dir is not None:
+        with stage('cache_save'):
+            cache.save(key, sources, train, dev, test, alphabet_pos, alphabet_tag, max_length)
+    return train, dev, test, featurizer, alphabet_pos, alphabet_tag, max_length
+
+
+def create_data(word_dir, vector_dir, train_dir, dev_dir, test_dir, cache_dir=None, tag_column=2, num_workers=None):
+    train, dev, test, featurizer, alphabet_pos, alphabet_tag, max_length = \
+        create_id_data(word_dir, vector_dir, train_dir, dev_dir, test_dir, cache_dir, tag_column, num_workers)
+    with stage('build_tensors'):
+        input_train, output_train = featurizer.transform_corpus(train, max_length, alphabet_pos.size(),
+                                                                alphabet_tag.size())
+        input_dev, output_dev = featurizer.transform_corpus(dev, max_length, alphabet_pos.size(),
+                                                            alphabet_tag.size())
+        input_test, _ = featurizer.transform_corpus(test, max_length, alphabet_pos.size(), alphabet_tag.size())
+    tag_id_list_test = test.split(test.tag_ids)
     return input_train, output_train, input_dev, output_dev, input_test, tag_id_list_test, alphabet_tag, max_length, alphabet_pos, alphabet_tag
 
 
 def predict_to_file(predicts, tests, alphabet_tag, output_file):
     with codecs.open(output_file, 'w', 'utf-8') as f:
         for i in range(len(tests)):
-            for j in range(len(tests[i])):
-                predict = alphabet_tag.get_instance(predicts[i][j])
-                if predict == None:
-                    predict = alphabet_tag.get_instance(predicts[i][j] + 1)
-                test = alphabet_tag.get_instance(tests[i][j])
+            length = len(tests[i])
+            for predict, test in zip(alphabet_tag.decode(predicts[i][:length]), alphabet_tag.decode(tests[i])):
                 f.write('_' + ' ' + predict + ' ' + test + '\n')
             f.write('\n')
 